@@ -0,0 +1,11 @@
+"""
+Микробенчмарки горячих путей бота
+
+Запуск из корня проекта:
+    python -m benchmarks.run                  - сравнить с baseline.json
+    python -m benchmarks.run --update         - перезаписать baseline.json
+    python -m benchmarks.run -k parse         - только бенчмарки с 'parse' в имени
+
+Время операций сохраняется в единицах эталона fsm_roundtrip[memory], который
+замеряется в том же запуске, поэтому baseline.json переносим между машинами.
+"""
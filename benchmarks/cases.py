@@ -0,0 +1,128 @@
+import asyncio
+import os
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Tuple, Union
+
+# Бенчмарки не требуют настроенного бота и файла базы
+os.environ.setdefault("ADMIN_IDS", "0")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database.fsm_storage import SQLAlchemyStorage
+from database.models import Base
+from keyboards.inline import get_question_keyboard, get_quiz_question_keyboard, get_quizzes_keyboard
+from services.quiz_cache import CachedQuiz
+from services.quiz_parser import parse_quiz_text
+
+Benchmark = Union[Callable[[], object], Callable[[], Awaitable[object]]]
+
+QUESTION_COUNTS = (1, 10, 50)  # 50 - предел _validate_quiz_structure
+CATALOG_SIZES = (10, 100)
+
+
+def generate_quiz_text(questions: int, options: int = 4) -> str:
+    """Квиз в формате /template с заданным количеством вопросов"""
+    parts = ["Название: Бенчмарк", "Описание: Сгенерированный квиз", ""]
+    for number in range(1, questions + 1):
+        parts.append(f"Вопрос {number}: Какой вариант правильный в вопросе {number}?")
+        parts.extend(f"{option}. Вариант ответа {option}" for option in range(1, options + 1))
+        parts.append(f"Правильный ответ: {number % options + 1}")
+        parts.append("")
+    return "\n".join(parts)
+
+
+def generate_catalog(size: int) -> list:
+    """Строки каталога (id, title, created_at), как из get_active_quizzes"""
+    start = datetime(2026, 1, 1)
+    return [
+        SimpleNamespace(id=quiz_id, title=f"Квиз номер {quiz_id}", created_at=start + timedelta(minutes=quiz_id))
+        for quiz_id in range(1, size + 1)
+    ]
+
+
+def session_payload() -> Dict:
+    """Состояние прохождения квиза, как в services.quiz_session.new_session_data"""
+    return {
+        "attempt_id": "0123456789abcdef0123456789abcdef",
+        "quiz_id": 12345,
+        "quiz_version": 1,
+        "current_question": 0,
+        "correct_answers": 0,
+        "seed": 987654321
+    }
+
+
+def _fsm_context(storage) -> FSMContext:
+    key = StorageKey(bot_id=1, chat_id=100, user_id=100)
+    return FSMContext(storage=storage, key=key)
+
+
+async def _answer_roundtrip(state: FSMContext) -> None:
+    """Один ответ на вопрос: чтение состояния и обновление курсора и счета"""
+    data = await state.get_data()
+    await state.update_data(
+        current_question=data["current_question"] + 1,
+        correct_answers=data["correct_answers"] + 1
+    )
+
+
+async def _sqlalchemy_storage() -> SQLAlchemyStorage:
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return SQLAlchemyStorage(async_sessionmaker(engine, expire_on_commit=False), flush_interval=3600)
+
+
+def build_benchmarks(
+        loop: asyncio.AbstractEventLoop
+) -> Tuple[Dict[str, Benchmark], Callable[[], Awaitable[None]]]:
+    """
+    Имя бенчмарка -> функция одной операции (обычная или корутина)
+
+    Второй элемент - корутина освобождения ресурсов (хранилищ FSM).
+    """
+    benchmarks: Dict[str, Benchmark] = {}
+
+    for questions in QUESTION_COUNTS:
+        text = generate_quiz_text(questions)
+        benchmarks[f"parse_quiz_text[{questions}q]"] = lambda text=text: parse_quiz_text(text)
+
+    for options in (2, 4, 10):
+        labels = [f"Вариант ответа {option}" for option in range(1, options + 1)]
+        benchmarks[f"get_question_keyboard[{options}opt]"] = lambda labels=labels: get_question_keyboard(labels, 0)
+
+    quiz = parse_quiz_text(generate_quiz_text(50))
+    cached_quiz = CachedQuiz(id=1, version=1, title=quiz.title, questions=quiz.questions)
+    benchmarks["get_quiz_question_keyboard[cached]"] = lambda: get_quiz_question_keyboard(cached_quiz, 7)
+
+    for size in CATALOG_SIZES:
+        catalog = generate_catalog(size)
+        benchmarks[f"get_quizzes_keyboard[{size}]"] = (
+            lambda catalog=catalog: get_quizzes_keyboard(catalog, has_prev=True, has_next=True)
+        )
+
+    memory_state = _fsm_context(MemoryStorage())
+    sql_storage = loop.run_until_complete(_sqlalchemy_storage())
+    sql_state = _fsm_context(sql_storage)
+    for state in (memory_state, sql_state):
+        loop.run_until_complete(state.set_data(session_payload()))
+
+    benchmarks["fsm_roundtrip[memory]"] = lambda: _answer_roundtrip(memory_state)
+    benchmarks["fsm_roundtrip[sqlalchemy]"] = lambda: _answer_roundtrip(sql_state)
+
+    async def flush_dirty() -> None:
+        await sql_state.update_data(correct_answers=0)
+        await sql_storage.flush()
+
+    benchmarks["fsm_flush[sqlalchemy]"] = flush_dirty
+
+    async def close() -> None:
+        await sql_storage.close()
+        await memory_state.storage.close()
+
+    return benchmarks, close
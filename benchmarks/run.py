@@ -0,0 +1,150 @@
+import argparse
+import asyncio
+import inspect
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+from .cases import Benchmark, build_benchmarks
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_TOLERANCE = 0.25  # Допустимое замедление относительно baseline (25%)
+# Эталон замеряется вперемешку с каждым бенчмарком: результаты хранятся и
+# сравниваются в его единицах, поэтому baseline не зависит от скорости машины
+REFERENCE = "fsm_roundtrip[memory]"
+
+
+def _timer(loop: asyncio.AbstractEventLoop, fn: Benchmark, min_time: float) -> Callable[[], float]:
+    """
+    Функция одного замера: время одной операции (мкс)
+
+    Количество операций в замере подбирается так, чтобы замер длился не
+    меньше min_time секунд.
+    """
+    probe = fn()  # Прогрев; асинхронный бенчмарк возвращает корутину
+    is_async = inspect.isawaitable(probe)
+    if is_async:
+        loop.run_until_complete(probe)
+
+    def run_batch(number: int) -> float:
+        if is_async:
+            async def batch():
+                start = time.perf_counter()
+                for _ in range(number):
+                    await fn()
+                return time.perf_counter() - start
+            return loop.run_until_complete(batch())
+
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        return time.perf_counter() - start
+
+    # Как timeit.autorange: 1, 2, 5, 10, 20, 50... операций
+    number, multipliers = 1, (2, 2.5, 2)
+    step = 0
+    while run_batch(number) < min_time:
+        number = int(number * multipliers[step % 3])
+        step += 1
+
+    return lambda: run_batch(number) / number * 1e6
+
+
+def _measure(
+        loop: asyncio.AbstractEventLoop,
+        fn: Benchmark,
+        reference: Callable[[], float],
+        repeat: int,
+        min_time: float
+) -> Tuple[float, float]:
+    """
+    Время операции (мкс, лучшее из repeat) и ее время в единицах эталона
+
+    Замеры бенчмарка и эталона чередуются, поэтому изменение скорости
+    машины во время прогона (троттлинг, соседние процессы) влияет на оба.
+    Отношение - медиана отношений соседних пар: она устойчивее к выбросам.
+    """
+    measure = _timer(loop, fn, min_time)
+    samples = [(measure(), reference()) for _ in range(repeat)]
+    value = min(sample for sample, _ in samples)
+    relative = statistics.median(sample / unit for sample, unit in samples)
+    return value, relative
+
+
+def _load_baseline() -> Dict:
+    if not BASELINE_PATH.exists():
+        return {"tolerance": DEFAULT_TOLERANCE, "reference": REFERENCE, "results": {}}
+    return json.loads(BASELINE_PATH.read_text(encoding="utf-8"))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Микробенчмарки QuizBot")
+    parser.add_argument("-k", dest="pattern", default="", help="Фильтр по подстроке имени")
+    parser.add_argument("--update", action="store_true", help="Записать результаты в baseline.json")
+    parser.add_argument("--tolerance", type=float, help="Допустимое замедление (доля), по умолчанию из baseline")
+    parser.add_argument("--repeat", type=int, default=10, help="Количество замеров")
+    parser.add_argument("--min-time", type=float, default=0.1, help="Минимальная длительность замера (сек)")
+    args = parser.parse_args()
+
+    baseline = _load_baseline()
+    tolerance = args.tolerance if args.tolerance is not None else baseline.get("tolerance", DEFAULT_TOLERANCE)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    benchmarks, close = build_benchmarks(loop)
+
+    # Старый baseline в мкс или с другим эталоном сравнивать не с чем
+    if baseline.get("reference") != REFERENCE:
+        baseline = {"tolerance": tolerance, "reference": REFERENCE, "results": {}}
+
+    # Эталон замеряется всегда, даже если отфильтрован через -k
+    reference = _timer(loop, benchmarks[REFERENCE], args.min_time)
+    print(f"Reference {REFERENCE}: {min(reference() for _ in range(args.repeat)):.2f} us/op")
+
+    results: Dict[str, float] = {}
+    regressions = []
+    print(f"{'benchmark':<36}{'us/op':>12}{'x ref':>10}{'baseline':>10}{'change':>10}")
+    for name, fn in benchmarks.items():
+        if args.pattern not in name or name == REFERENCE:
+            continue
+
+        value, relative = _measure(loop, fn, reference, args.repeat, args.min_time)
+        results[name] = round(relative, 4)
+
+        expected = baseline["results"].get(name)
+        if expected:
+            change = relative / expected - 1
+            mark = "  REGRESSION" if change > tolerance else ""
+            if mark:
+                regressions.append(name)
+            print(f"{name:<36}{value:>12.2f}{relative:>10.3f}{expected:>10.3f}{change:>+10.1%}{mark}")
+        else:
+            print(f"{name:<36}{value:>12.2f}{relative:>10.3f}{'-':>10}{'-':>10}")
+
+    loop.run_until_complete(close())
+    loop.close()
+
+    if args.update:
+        baseline["tolerance"] = tolerance
+        baseline["python"] = platform.python_version()
+        baseline["machine"] = platform.machine()
+        baseline["results"].update(results)
+        BASELINE_PATH.write_text(
+            json.dumps(baseline, indent=2, ensure_ascii=False, sort_keys=True) + "\n",
+            encoding="utf-8"
+        )
+        print(f"Baseline updated: {BASELINE_PATH}")
+        return 0
+
+    if regressions:
+        print(f"Slower than baseline by more than {tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
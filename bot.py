@@ -1,52 +1,221 @@
 import asyncio
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-
-from config import BOT_TOKEN, DATABASE_URL
-from database.models import Base
+from aiogram.client.default import DefaultBotProperties
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from config import (
+    BOT_TOKEN,
+    FSM_FLUSH_INTERVAL,
+    FSM_CACHE_SIZE,
+    WEBHOOK_URL,
+    RESULT_WRITE_BEHIND,
+    RESULT_FLUSH_INTERVAL_MS,
+    RESULT_FLUSH_BATCH,
+    WRITE_BEHIND_MAX_ATTEMPTS,
+    WRITE_BEHIND_MAX_BUFFER,
+    ANSWER_EVENTS,
+    ANSWER_FLUSH_INTERVAL_MS,
+    ANSWER_FLUSH_BATCH,
+    SEND_GLOBAL_RATE,
+    SEND_CHAT_RATE,
+    SEND_CHAT_BURST,
+    SEND_GROUP_RATE_PER_MIN,
+    SEND_MAX_RETRIES,
+    BROADCAST_WORKERS,
+    BROADCAST_BATCH,
+    CLEANUP_CHUNK_SIZE,
+    CLEANUP_QUIZ_BATCH,
+    CLEANUP_PAUSE_MS,
+    RESULT_RETENTION_DAYS,
+    RETENTION_INTERVAL_MIN,
+    RETENTION_BATCH,
+    QUESTION_TIMER_TICK_MS,
+    QUESTION_TIMER_SLOTS,
+    QUESTION_TIMER_WORKERS
+)
+from database.answers import record_answer_events
+from database.engine import create_engines
+from database.fsm_storage import SQLAlchemyStorage
+from database.leaderboard import load_leaderboards
+from database.queries import record_quiz_results
+from database.schema import check_schema_version
+from database.session import LazySession
 from handlers import register_all_handlers
+from handlers.callbacks import question_timeout
+from services.batch_writer import WriteBehindWriter
+from services.broadcast import Broadcaster
+from services.cleanup import CleanupRunner
+from services.quiz_import import quiz_importer
+from services.retention import RetentionJob
+from services.send_scheduler import SendScheduler
+from services.timer_wheel import TimerWheel
+from services.webhook import run_webhook
 
 
 async def setup_database():
     """Настройка подключения к базе данных"""
-    engine = create_async_engine(DATABASE_URL, echo=True)
+    engine, read_engine = create_engines()
 
-    # Создаем таблицы (в продакшене лучше использовать миграции)
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # Схема создается и обновляется миграциями (alembic upgrade head),
+    # при запуске только проверяем ее версию
+    await check_schema_version(engine)
 
-    return async_sessionmaker(engine, expire_on_commit=False)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    read_session_maker = async_sessionmaker(read_engine, expire_on_commit=False)
 
+    # Рейтинги в памяти восстанавливаются из компактной таблицы
+    async with read_session_maker() as session:
+        await load_leaderboards(session)
 
-async def main():
-    # Инициализация бота и хранилища состояний
-    bot = Bot(token=BOT_TOKEN, parse_mode="HTML")
-    dp = Dispatcher(storage=MemoryStorage())
+    return session_maker, read_session_maker
 
+
+async def main():
     # Настройка сессий БД
-    session_maker = await setup_database()
+    session_maker, read_session_maker = await setup_database()
 
-    # Middleware для инъекции сессий
+    # Инициализация бота и персистентного хранилища состояний
+    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+    # Все исходящие запросы проходят через планировщик с лимитами Telegram
+    send_scheduler = SendScheduler(
+        global_rate=SEND_GLOBAL_RATE,
+        chat_rate=SEND_CHAT_RATE,
+        chat_burst=SEND_CHAT_BURST,
+        group_rate=SEND_GROUP_RATE_PER_MIN / 60,
+        max_retries=SEND_MAX_RETRIES
+    )
+    bot.session.middleware(send_scheduler)
+    storage = SQLAlchemyStorage(
+        session_maker,
+        flush_interval=FSM_FLUSH_INTERVAL,
+        cache_size=FSM_CACHE_SIZE
+    )
+    dp = Dispatcher(storage=storage)
+    dp["send_scheduler"] = send_scheduler
+
+    # Middleware для инъекции сессий: соединение берется только при первом
+    # обращении к БД, фиксация или откат - один раз после обработки апдейта.
+    # Читающие запросы (каталог, история) получают отдельную сессию db_read
     @dp.update.outer_middleware()
     async def db_session_middleware(handler, event, data):
-        async with session_maker() as session:
-            data["db"] = session
-            try:
-                return await handler(event, data)
-            except Exception as e:
-                await session.rollback()
-                raise e
-            finally:
-                await session.close()
+        db = LazySession(session_maker)
+        db_read = LazySession(read_session_maker)
+        data["db"] = db
+        data["db_read"] = db_read
+        try:
+            result = await handler(event, data)
+        except Exception as e:
+            await db.finish(commit=False)
+            await db_read.finish(commit=False)
+            raise e
+        await db_read.finish(commit=False)
+        await db.finish(commit=True)
+        return result
+
+    # Общее колесо таймеров для вопросов с ограничением времени
+    # (доступно обработчикам как question_timers); останавливается раньше
+    # писателей, чтобы последние результаты успели записаться
+    async def on_question_timeout(deadline):
+        await question_timeout(
+            deadline,
+            storage,
+            session_maker,
+            result_writer=dp.workflow_data.get("result_writer"),
+            timers=question_timers
+        )
+
+    question_timers = TimerWheel(
+        on_question_timeout,
+        tick=QUESTION_TIMER_TICK_MS / 1000,
+        slots=QUESTION_TIMER_SLOTS,
+        workers=QUESTION_TIMER_WORKERS
+    )
+    dp["question_timers"] = question_timers
+    dp.startup.register(question_timers.start)
+
+    async def stop_question_timers():
+        # Хранилище FSM aiogram закрывает первым (до наших обработчиков
+        # shutdown) - сбрасываем состояния, измененные сработавшими таймерами
+        await question_timers.close()
+        await storage.close()
+
+    dp.shutdown.register(stop_question_timers)
+
+    # Отложенная пакетная запись результатов (доступна обработчикам как result_writer)
+    if RESULT_WRITE_BEHIND:
+        result_writer = WriteBehindWriter(
+            session_maker,
+            record_quiz_results,
+            flush_interval=RESULT_FLUSH_INTERVAL_MS / 1000,
+            max_batch=RESULT_FLUSH_BATCH,
+            name="quiz_results",
+            max_attempts=WRITE_BEHIND_MAX_ATTEMPTS,
+            max_buffer=WRITE_BEHIND_MAX_BUFFER
+        )
+        dp["result_writer"] = result_writer
+        dp.startup.register(result_writer.start)
+        dp.shutdown.register(result_writer.close)
+
+    # Журнал ответов для анализа вопросов (доступен обработчикам как answer_writer)
+    if ANSWER_EVENTS:
+        answer_writer = WriteBehindWriter(
+            session_maker,
+            record_answer_events,
+            flush_interval=ANSWER_FLUSH_INTERVAL_MS / 1000,
+            max_batch=ANSWER_FLUSH_BATCH,
+            name="answer_events",
+            max_attempts=WRITE_BEHIND_MAX_ATTEMPTS,
+            max_buffer=WRITE_BEHIND_MAX_BUFFER
+        )
+        dp["answer_writer"] = answer_writer
+        dp.startup.register(answer_writer.start)
+        dp.shutdown.register(answer_writer.close)
+
+    # Рассылки администратора; прерванные продолжаются при старте
+    broadcaster = Broadcaster(session_maker, workers=BROADCAST_WORKERS, batch_size=BROADCAST_BATCH)
+    dp["broadcaster"] = broadcaster
+    dp.startup.register(broadcaster.resume)
+    dp.shutdown.register(broadcaster.close)
+
+    # Фоновая очистка квизов порциями (/cleanup); перед удалением сбрасывает
+    # отложенные записи результатов и ответов
+    cleanup_runner = CleanupRunner(
+        session_maker,
+        chunk_size=CLEANUP_CHUNK_SIZE,
+        quiz_batch=CLEANUP_QUIZ_BATCH,
+        pause=CLEANUP_PAUSE_MS / 1000,
+        writers=[dp[name] for name in ("result_writer", "answer_writer") if name in dp.workflow_data]
+    )
+    dp["cleanup_runner"] = cleanup_runner
+    dp.shutdown.register(cleanup_runner.close)
+
+    # Свертка старых результатов в дневные агрегаты
+    if RESULT_RETENTION_DAYS:
+        retention_job = RetentionJob(
+            session_maker,
+            retention_days=RESULT_RETENTION_DAYS,
+            interval=RETENTION_INTERVAL_MIN * 60,
+            batch_size=RETENTION_BATCH
+        )
+        dp.startup.register(retention_job.start)
+        dp.shutdown.register(retention_job.close)
+
+    # Пул процессов импорта квизов создается при первом импорте
+    dp.shutdown.register(quiz_importer.close)
+
+    # Планировщик отправки останавливается последним: таймеры и рассылка
+    # при остановке еще отправляют сообщения
+    dp.shutdown.register(send_scheduler.close)
 
     # Регистрация обработчиков
     register_all_handlers(dp)
 
-    # Запуск бота
+    # Запуск бота (хранилище FSM сбрасывается на диск при остановке)
     try:
-        await dp.start_polling(bot)
+        if WEBHOOK_URL:
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
     finally:
         await bot.session.close()
 
@@ -0,0 +1,64 @@
+import logging
+from typing import List, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cleanup import get_missing_quiz_ids
+from .dialects import get_insert
+from .models import AnswerEvent
+
+logger = logging.getLogger(__name__)
+
+
+async def record_answer_events(db: AsyncSession, rows: List[dict]) -> int:
+    """
+    Пакетная запись ответов (flush-функция WriteBehindWriter)
+
+    Ответ с уже записанной парой (attempt_id, question_index) пропускается,
+    поэтому повтор пакета после сбоя не задваивает журнал. Ответы квизов,
+    удаленных очисткой, пока строки ждали записи, не сохраняются.
+    """
+    if not rows:
+        return 0
+
+    insert = get_insert(db.bind.dialect.name)
+    stmt = insert(AnswerEvent).on_conflict_do_nothing(
+        index_elements=[AnswerEvent.attempt_id, AnswerEvent.question_index]
+    )
+    await db.execute(stmt, rows)
+
+    missing = await get_missing_quiz_ids(db, (row["quiz_id"] for row in rows))
+    if missing:
+        await db.execute(delete(AnswerEvent).where(AnswerEvent.quiz_id.in_(missing)))
+        logger.warning(f"Skipped answer events of deleted quizzes {sorted(missing)}")
+    return len(rows)
+
+
+async def load_answer_events(db: AsyncSession, quiz_id: int) -> Tuple[list, list, list, list, list]:
+    """
+    Все ответы квиза по столбцам: attempt_id, question_index, option, is_correct, latency_ms
+
+    Столбцовая форма сразу превращается в массивы NumPy без обхода строк.
+    Только чтение - вызывается с сессией db_read.
+    """
+    try:
+        result = await db.execute(
+            select(
+                AnswerEvent.attempt_id,
+                AnswerEvent.question_index,
+                AnswerEvent.option,
+                AnswerEvent.is_correct,
+                AnswerEvent.latency_ms
+            )
+            .where(AnswerEvent.quiz_id == quiz_id)
+        )
+        rows = result.all()
+        if not rows:
+            return [], [], [], [], []
+        return tuple(list(column) for column in zip(*rows))
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error loading answer events: {e}")
+        raise ValueError("Ошибка при загрузке ответов")
@@ -0,0 +1,130 @@
+import logging
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Broadcast, User
+
+logger = logging.getLogger(__name__)
+
+
+async def create_broadcast(db: AsyncSession, text: str, created_by: int) -> Broadcast:
+    """Создает рассылку в статусе running"""
+    try:
+        broadcast = Broadcast(text=text, created_by=created_by, status="running")
+        db.add(broadcast)
+        await db.flush()
+        return broadcast
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error creating broadcast: {e}")
+        raise ValueError("Ошибка при создании рассылки")
+
+
+async def get_broadcast(db: AsyncSession, broadcast_id: int) -> Optional[Broadcast]:
+    try:
+        return await db.get(Broadcast, broadcast_id, populate_existing=True)
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error getting broadcast: {e}")
+        raise ValueError("Ошибка при получении рассылки")
+
+
+async def get_running_broadcast_ids(db: AsyncSession) -> List[int]:
+    """Незавершенные рассылки (для продолжения после перезапуска)"""
+    try:
+        result = await db.execute(
+            select(Broadcast.id).where(Broadcast.status == "running").order_by(Broadcast.id)
+        )
+        return list(result.scalars())
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error getting running broadcasts: {e}")
+        raise ValueError("Ошибка при получении рассылок")
+
+
+async def get_recent_broadcasts(db: AsyncSession, limit: int = 5) -> List[Broadcast]:
+    try:
+        result = await db.execute(select(Broadcast).order_by(Broadcast.id.desc()).limit(limit))
+        return list(result.scalars())
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error getting broadcasts: {e}")
+        raise ValueError("Ошибка при получении рассылок")
+
+
+async def get_recipients_batch(
+        db: AsyncSession,
+        after_user_id: int,
+        limit: int
+) -> List[Tuple[int, int]]:
+    """
+    Следующая пачка получателей (users.id, telegram_id) после after_user_id
+
+    Keyset-выборка по первичному ключу: стоимость не растет с номером
+    пачки, а новые пользователи попадают в конец рассылки.
+    """
+    try:
+        result = await db.execute(
+            select(User.id, User.telegram_id)
+            .where(User.id > after_user_id, User.is_blocked == False)
+            .order_by(User.id)
+            .limit(limit)
+        )
+        return [(user_id, telegram_id) for user_id, telegram_id in result]
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error getting broadcast recipients: {e}")
+        raise ValueError("Ошибка при выборке получателей")
+
+
+async def save_broadcast_checkpoint(
+        db: AsyncSession,
+        broadcast_id: int,
+        last_user_id: int,
+        sent: int,
+        failed: int,
+        blocked_user_ids: Sequence[int]
+) -> None:
+    """
+    Фиксирует обработанную пачку: сдвигает контрольную точку, добавляет
+    счетчики и отмечает пользователей, заблокировавших бота
+    """
+    try:
+        if blocked_user_ids:
+            await db.execute(
+                update(User).where(User.id.in_(blocked_user_ids)).values(is_blocked=True)
+            )
+        await db.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id)
+            .values(
+                last_user_id=last_user_id,
+                sent=Broadcast.sent + sent,
+                failed=Broadcast.failed + failed,
+                blocked=Broadcast.blocked + len(blocked_user_ids),
+                updated_at=datetime.now()
+            )
+        )
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error saving broadcast checkpoint: {e}")
+        raise ValueError("Ошибка при сохранении прогресса рассылки")
+
+
+async def set_broadcast_status(db: AsyncSession, broadcast_id: int, status: str) -> bool:
+    """Меняет статус незавершенной рассылки; False - рассылка уже завершена"""
+    try:
+        result = await db.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.status == "running")
+            .values(status=status, updated_at=datetime.now())
+        )
+        return result.rowcount > 0
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error updating broadcast status: {e}")
+        raise ValueError("Ошибка при обновлении рассылки")
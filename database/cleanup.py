@@ -0,0 +1,174 @@
+import logging
+from collections import Counter
+from datetime import datetime, time
+from typing import Iterable, List, Optional, Sequence, Set, Type, Union
+
+from sqlalchemy import bindparam, delete, func, select, tuple_, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.leaderboard import GLOBAL_BOARD, WINDOWS, period_key
+from .models import (
+    AnswerEvent, LeaderboardEntry, Quiz, QuizDailyScore, QuizResult, QuizScoreBucket, QuizStats, User, UserDailyResult
+)
+
+logger = logging.getLogger(__name__)
+
+# Таблицы с суррогатным id, строки которых удаляются диапазонами id
+ChunkedModel = Union[Type[AnswerEvent], Type[QuizResult]]
+
+
+async def get_cleanup_quiz_ids(
+        db: AsyncSession,
+        after_id: int,
+        limit: int,
+        created_before: Optional[datetime] = None,
+        creator_telegram_id: Optional[int] = None,
+        quiz_id: Optional[int] = None
+) -> List[int]:
+    """Следующая пачка id квизов под фильтры очистки (keyset по id)"""
+    try:
+        stmt = select(Quiz.id).where(Quiz.id > after_id).order_by(Quiz.id).limit(limit)
+        if created_before is not None:
+            stmt = stmt.where(Quiz.created_at < created_before)
+        if creator_telegram_id is not None:
+            stmt = stmt.join(User, Quiz.creator_id == User.id).where(User.telegram_id == creator_telegram_id)
+        if quiz_id is not None:
+            stmt = stmt.where(Quiz.id == quiz_id)
+        return list((await db.execute(stmt)).scalars())
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error selecting quizzes for cleanup: {e}")
+        raise ValueError("Ошибка при выборке квизов для очистки")
+
+
+async def deactivate_quizzes(db: AsyncSession, quiz_ids: Sequence[int]) -> None:
+    """Скрывает квизы из каталога перед удалением - новые прохождения не начинаются"""
+    try:
+        await db.execute(update(Quiz).where(Quiz.id.in_(quiz_ids)).values(is_active=False))
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error deactivating quizzes: {e}")
+        raise ValueError("Ошибка при удалении квизов")
+
+
+async def get_missing_quiz_ids(db: AsyncSession, quiz_ids: Iterable[int]) -> Set[int]:
+    """
+    Какие из quiz_ids уже удалены
+
+    Отложенная запись вызывает это после своего INSERT: в SQLite блокировка
+    записи уже взята, и очистка не может удалить квиз между проверкой и
+    фиксацией; в PostgreSQL ту же гарантию дает внешний ключ.
+    """
+    quiz_ids = set(quiz_ids)
+    existing = (await db.execute(select(Quiz.id).where(Quiz.id.in_(quiz_ids)))).scalars()
+    return quiz_ids.difference(existing)
+
+
+async def delete_quiz_rows_chunk(
+        db: AsyncSession,
+        model: ChunkedModel,
+        quiz_ids: Sequence[int],
+        chunk_size: int
+) -> int:
+    """
+    Удаляет не больше chunk_size строк квизов quiz_ids из answer_events или quiz_results
+
+    Находит границы очередного диапазона id и удаляет его одним запросом
+    по первичному ключу. Баллы удаляемых результатов вычитаются из общего
+    рейтинга в той же транзакции. Возвращает количество удаленных строк
+    (0 - строк не осталось).
+    """
+    try:
+        chunk = (
+            select(model.id)
+            .where(model.quiz_id.in_(quiz_ids))
+            .order_by(model.id)
+            .limit(chunk_size)
+            .subquery()
+        )
+        first_id, last_id = (await db.execute(select(func.min(chunk.c.id), func.max(chunk.c.id)))).one()
+        if first_id is None:
+            return 0
+
+        in_range = (model.id.between(first_id, last_id), model.quiz_id.in_(quiz_ids))
+        if model is QuizResult:
+            rows = await db.execute(
+                select(QuizResult.user_id, QuizResult.score, QuizResult.completed_at).where(*in_range)
+            )
+            await _subtract_global_scores(db, rows)
+
+        result = await db.execute(delete(model).where(*in_range))
+        return result.rowcount
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error deleting {model.__tablename__} chunk: {e}")
+        raise ValueError("Ошибка при удалении данных")
+
+
+async def delete_quizzes(db: AsyncSession, quiz_ids: Sequence[int]) -> int:
+    """
+    Удаляет квизы вместе с агрегатами; журнал ответов и результаты должны быть уже удалены
+
+    Строки рейтингов самих квизов удаляются, из общего рейтинга вычитаются
+    баллы свернутых результатов (сырые вычтены при их удалении).
+    """
+    try:
+        rolled = await db.execute(
+            select(UserDailyResult.user_id, func.sum(UserDailyResult.score_sum), UserDailyResult.day)
+            .where(UserDailyResult.quiz_id.in_(quiz_ids))
+            .group_by(UserDailyResult.user_id, UserDailyResult.day)
+        )
+        await _subtract_global_scores(
+            db, ((user_id, score, datetime.combine(day, time())) for user_id, score, day in rolled)
+        )
+
+        await db.execute(delete(QuizDailyScore).where(QuizDailyScore.quiz_id.in_(quiz_ids)))
+        await db.execute(delete(UserDailyResult).where(UserDailyResult.quiz_id.in_(quiz_ids)))
+        await db.execute(delete(QuizScoreBucket).where(QuizScoreBucket.quiz_id.in_(quiz_ids)))
+        await db.execute(delete(QuizStats).where(QuizStats.quiz_id.in_(quiz_ids)))
+        await db.execute(delete(LeaderboardEntry).where(LeaderboardEntry.quiz_id.in_(quiz_ids)))
+        result = await db.execute(delete(Quiz).where(Quiz.id.in_(quiz_ids)))
+        return result.rowcount
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error deleting quizzes: {e}")
+        raise ValueError("Ошибка при удалении квизов")
+
+
+async def _subtract_global_scores(db: AsyncSession, rows: Iterable) -> None:
+    """
+    Вычитает баллы из общего рейтинга
+
+    rows - тройки (user_id, баллы, момент результата); баллы вычитаются из
+    строк тех же периодов, в которые их добавил apply_results_to_leaderboards.
+    Обнулившиеся строки удаляются.
+    """
+    deltas = Counter()
+    for user_id, score, moment in rows:
+        for window in WINDOWS:
+            deltas[(period_key(window, moment), user_id)] += score
+    if not deltas:
+        return
+
+    table = LeaderboardEntry.__table__
+    await db.execute(
+        update(table)
+        .where(
+            table.c.quiz_id == GLOBAL_BOARD,
+            table.c.period == bindparam("b_period"),
+            table.c.user_id == bindparam("b_user_id")
+        )
+        .values(score=table.c.score - bindparam("b_delta")),
+        [
+            {"b_period": period, "b_user_id": user_id, "b_delta": delta}
+            for (period, user_id), delta in deltas.items()
+        ]
+    )
+    await db.execute(
+        delete(LeaderboardEntry).where(
+            LeaderboardEntry.quiz_id == GLOBAL_BOARD,
+            tuple_(LeaderboardEntry.period, LeaderboardEntry.user_id).in_(list(deltas)),
+            LeaderboardEntry.score <= 0
+        )
+    )
@@ -0,0 +1,15 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def get_insert(dialect_name: str):
+    """
+    Возвращает конструктор INSERT с поддержкой ON CONFLICT для текущего диалекта
+
+    Поддерживаются SQLite и PostgreSQL - оба умеют
+    on_conflict_do_update / on_conflict_do_nothing и RETURNING.
+    """
+    if dialect_name == "postgresql":
+        return postgresql.insert
+    if dialect_name == "sqlite":
+        return sqlite.insert
+    raise ValueError(f"Диалект {dialect_name} не поддерживает upsert")
@@ -0,0 +1,80 @@
+from typing import Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from config import (
+    DATABASE_URL,
+    DATABASE_READ_URL,
+    DB_ECHO,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_READ_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_CACHE_SIZE_KB,
+    SQLITE_MMAP_SIZE
+)
+
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return _is_sqlite(url) and make_url(url).database in (None, "", ":memory:")
+
+
+def _apply_sqlite_pragmas(engine: AsyncEngine, read_only: bool) -> None:
+    """
+    Настройки SQLite для каждого нового соединения
+
+    WAL позволяет читателям не блокировать единственного писателя,
+    synchronous=NORMAL безопасен в режиме WAL и заметно ускоряет фиксацию.
+    """
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def _create_engine(url: str, pool_size: int, read_only: bool) -> AsyncEngine:
+    kwargs = {"echo": DB_ECHO, "pool_pre_ping": not _is_sqlite(url)}
+    # In-memory SQLite использует StaticPool - размеры пула к нему неприменимы
+    if not _is_memory_sqlite(url):
+        kwargs.update(
+            pool_size=pool_size,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT
+        )
+
+    engine = create_async_engine(url, **kwargs)
+    if _is_sqlite(url):
+        _apply_sqlite_pragmas(engine, read_only)
+    return engine
+
+
+def create_engines() -> Tuple[AsyncEngine, AsyncEngine]:
+    """
+    Создает движок для записи и отдельный пул для читающих запросов
+
+    Для PostgreSQL DATABASE_READ_URL может указывать на реплику.
+    Для SQLite оба пула работают с одним файлом, читатели - в режиме query_only.
+    """
+    writer = _create_engine(DATABASE_URL, DB_POOL_SIZE, read_only=False)
+    if _is_memory_sqlite(DATABASE_URL):
+        # У каждого соединения in-memory SQLite своя база - читаем через писателя
+        return writer, writer
+
+    reader = _create_engine(DATABASE_READ_URL, DB_READ_POOL_SIZE, read_only=True)
+    return writer, reader
+
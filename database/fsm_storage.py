@@ -0,0 +1,211 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .dialects import get_insert
+from .models import FSMRecord
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    """Закэшированное состояние одного ключа FSM"""
+    __slots__ = ("state", "data")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any]):
+        self.state = state
+        self.data = data
+
+
+class SQLAlchemyStorage(BaseStorage):
+    """
+    Персистентное хранилище FSM поверх SQLAlchemy (SQLite/PostgreSQL)
+
+    Изменения применяются к кэшу в памяти и помечают ключ как "грязный".
+    Фоновая задача раз в flush_interval секунд сбрасывает все грязные ключи
+    одной транзакцией, поэтому несколько update_data в рамках одного апдейта
+    превращаются в одну запись. Чтение идет через LRU-кэш (read-through).
+    """
+
+    def __init__(
+            self,
+            session_maker: async_sessionmaker,
+            key_builder: Optional[KeyBuilder] = None,
+            flush_interval: float = 0.5,
+            cache_size: int = 10000
+    ):
+        self.session_maker = session_maker
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+
+        self._cache: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._dirty: Set[str] = set()
+        self._flushing: Set[str] = set()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._get_entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        entry = await self._get_entry(key)
+        entry.data = data.copy()
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get_entry(key)).data.copy()
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Обновляем запись на месте, без лишней пары get_data/set_data
+        entry = await self._get_entry(key)
+        entry.data.update(data)
+        self._mark_dirty(key)
+        return entry.data.copy()
+
+    async def close(self) -> None:
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Сбрасывает все накопленные изменения в БД одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+
+            keys = list(self._dirty)
+            self._dirty.clear()
+            self._flushing.update(keys)
+
+            now = datetime.now()
+            upserts = []
+            deletes = []
+            for storage_key in keys:
+                entry = self._cache.get(storage_key)
+                if entry is None or (entry.state is None and not entry.data):
+                    deletes.append(storage_key)
+                else:
+                    upserts.append({
+                        "key": storage_key,
+                        "state": entry.state,
+                        "data": json.dumps(entry.data, ensure_ascii=False),
+                        "updated_at": now
+                    })
+
+            try:
+                async with self.session_maker() as session:
+                    async with session.begin():
+                        if upserts:
+                            insert = get_insert(session.bind.dialect.name)
+                            stmt = insert(FSMRecord)
+                            stmt = stmt.on_conflict_do_update(
+                                index_elements=[FSMRecord.key],
+                                set_={
+                                    "state": stmt.excluded.state,
+                                    "data": stmt.excluded.data,
+                                    "updated_at": stmt.excluded.updated_at
+                                }
+                            )
+                            await session.execute(stmt, upserts)
+                        if deletes:
+                            await session.execute(
+                                delete(FSMRecord).where(FSMRecord.key.in_(deletes))
+                            )
+
+            except SQLAlchemyError as e:
+                # Вернем ключи в очередь - запишем при следующей попытке
+                logger.error(f"Error flushing FSM storage: {e}")
+                self._dirty.update(keys)
+
+            except BaseException:
+                # Отмена посреди записи (остановка бота) - изменения не теряем
+                self._dirty.update(keys)
+                raise
+
+            finally:
+                self._flushing.clear()
+
+    def _mark_dirty(self, key: StorageKey) -> None:
+        self._dirty.add(self.key_builder.build(key))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _get_entry(self, key: StorageKey) -> _Entry:
+        storage_key = self.key_builder.build(key)
+
+        entry = self._cache.get(storage_key)
+        if entry is not None:
+            self._cache.move_to_end(storage_key)
+            return entry
+
+        # Параллельные промахи по одному ключу ждут одну загрузку
+        loading = self._loading.get(storage_key)
+        if loading is not None:
+            return await loading
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[storage_key] = future
+        try:
+            entry = await self._load(storage_key)
+            self._evict()
+            self._cache[storage_key] = entry
+            future.set_result(entry)
+            return entry
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже пробрасывается вызывающему - не оставляем его "неполученным"
+            future.exception()
+            raise
+        finally:
+            del self._loading[storage_key]
+
+    async def _load(self, storage_key: str) -> _Entry:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(FSMRecord.state, FSMRecord.data).where(FSMRecord.key == storage_key)
+            )
+            row = result.first()
+
+        if row is None:
+            return _Entry(None, {})
+        return _Entry(row.state, json.loads(row.data) if row.data else {})
+
+    def _evict(self) -> None:
+        """Освобождает место под новую запись, вытесняя давние, кроме еще не сохраненных"""
+        overflow = len(self._cache) + 1 - self.cache_size
+        if overflow <= 0:
+            return
+
+        for storage_key in list(self._cache):
+            if overflow <= 0:
+                break
+            if storage_key in self._dirty or storage_key in self._flushing:
+                continue
+            del self._cache[storage_key]
+            overflow -= 1
@@ -0,0 +1,155 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from sqlalchemy import case, delete, func, insert, literal, select, union_all
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.leaderboard import leaderboards, period_key, GLOBAL_BOARD
+from .dialects import get_insert
+from .models import LeaderboardEntry, QuizResult, UserDailyResult
+from .session import call_after_commit
+
+logger = logging.getLogger(__name__)
+
+
+async def apply_results_to_leaderboards(db: AsyncSession, results: Iterable) -> None:
+    """
+    Учитывает новые результаты в таблице рейтингов и в рейтингах в памяти
+
+    results - строки с атрибутами quiz_id, user_id, score и completed_at
+    (только реально вставленные). Рейтинги в памяти обновляются после
+    фиксации транзакции: откат или повтор пакета не задваивает суммы.
+    """
+    results = list(results)
+    best = {}
+    totals = {}
+    for result in results:
+        for window in ("all", "week", "day"):
+            period = period_key(window, result.completed_at)
+            key = (result.quiz_id, period, result.user_id)
+            best[key] = max(best.get(key, result.score), result.score)
+            key = (GLOBAL_BOARD, period, result.user_id)
+            totals[key] = totals.get(key, 0) + result.score
+
+    if not best:
+        return
+
+    insert_stmt = get_insert(db.bind.dialect.name)
+
+    # По квизу храним лучший результат пользователя
+    stmt = insert_stmt(LeaderboardEntry)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[LeaderboardEntry.quiz_id, LeaderboardEntry.period, LeaderboardEntry.user_id],
+        set_={
+            "score": case(
+                (stmt.excluded.score > LeaderboardEntry.score, stmt.excluded.score),
+                else_=LeaderboardEntry.score
+            )
+        }
+    )
+    await db.execute(stmt, [
+        {"quiz_id": quiz_id, "period": period, "user_id": user_id, "score": score}
+        for (quiz_id, period, user_id), score in best.items()
+    ])
+
+    # В общем рейтинге - сумму баллов
+    stmt = insert_stmt(LeaderboardEntry)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[LeaderboardEntry.quiz_id, LeaderboardEntry.period, LeaderboardEntry.user_id],
+        set_={"score": LeaderboardEntry.score + stmt.excluded.score}
+    )
+    await db.execute(stmt, [
+        {"quiz_id": quiz_id, "period": period, "user_id": user_id, "score": score}
+        for (quiz_id, period, user_id), score in totals.items()
+    ])
+
+    def record() -> None:
+        for result in results:
+            leaderboards.record(result.quiz_id, result.user_id, result.score, result.completed_at)
+
+    call_after_commit(db, record)
+
+
+async def rebuild_leaderboards(db: AsyncSession) -> None:
+    """
+    Пересчитывает таблицу рейтингов из quiz_results (и свертки старых
+    результатов) и после фиксации перезагружает рейтинги в памяти
+
+    Строки прошедших недель и дней при этом удаляются.
+    """
+    try:
+        now = datetime.now()
+        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        starts = {
+            "all": None,
+            "week": day_start - timedelta(days=now.weekday()),
+            "day": day_start
+        }
+
+        await db.execute(delete(LeaderboardEntry))
+        columns = [
+            LeaderboardEntry.quiz_id,
+            LeaderboardEntry.period,
+            LeaderboardEntry.user_id,
+            LeaderboardEntry.score
+        ]
+        # Результаты старше окна хранения берутся из дневной свертки user_daily_results
+        for window, start in starts.items():
+            period = literal(period_key(window, now))
+            raw = select(
+                QuizResult.quiz_id,
+                QuizResult.user_id,
+                QuizResult.score.label("best_score"),
+                QuizResult.score.label("score_sum")
+            )
+            rolled = select(
+                UserDailyResult.quiz_id,
+                UserDailyResult.user_id,
+                UserDailyResult.best_score,
+                UserDailyResult.score_sum
+            )
+            if start is not None:
+                raw = raw.where(QuizResult.completed_at >= start)
+                rolled = rolled.where(UserDailyResult.day >= start.date())
+            combined = union_all(raw, rolled).subquery()
+
+            per_quiz = (
+                select(combined.c.quiz_id, period, combined.c.user_id, func.max(combined.c.best_score))
+                .group_by(combined.c.quiz_id, combined.c.user_id)
+            )
+            overall = (
+                select(literal(GLOBAL_BOARD), period, combined.c.user_id, func.sum(combined.c.score_sum))
+                .group_by(combined.c.user_id)
+            )
+
+            await db.execute(insert(LeaderboardEntry).from_select(columns, per_quiz))
+            await db.execute(insert(LeaderboardEntry).from_select(columns, overall))
+
+        # Память заменяется только после фиксации - при откате она совпадает с таблицей
+        entries = await _current_entries(db)
+        call_after_commit(db, lambda: leaderboards.load(entries))
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error rebuilding leaderboards: {e}")
+        raise ValueError("Ошибка пересчета рейтингов")
+
+
+async def load_leaderboards(db: AsyncSession) -> None:
+    """Загружает рейтинги текущих периодов из таблицы в память"""
+    leaderboards.load(await _current_entries(db))
+
+
+async def _current_entries(db: AsyncSession) -> list:
+    """Строки таблицы рейтингов текущих периодов"""
+    periods = list(leaderboards.current_periods().values())
+    result = await db.execute(
+        select(
+            LeaderboardEntry.quiz_id,
+            LeaderboardEntry.period,
+            LeaderboardEntry.user_id,
+            LeaderboardEntry.score
+        ).where(LeaderboardEntry.period.in_(periods))
+    )
+    return result.all()
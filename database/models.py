@@ -1,7 +1,7 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
 
-from sqlalchemy import ForeignKey, String, Boolean, Text, DateTime, Integer
+from sqlalchemy import BigInteger, ForeignKey, String, Boolean, Text, Date, DateTime, Integer, Index, false
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
@@ -15,13 +15,16 @@ class User(Base):
     __tablename__ = "users"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    telegram_id: Mapped[int] = mapped_column(unique=True, index=True)
+    telegram_id: Mapped[int] = mapped_column(BigInteger, unique=True, index=True)  # ID Telegram больше 2^31
     username: Mapped[Optional[str]] = mapped_column(String(64))
     full_name: Mapped[Optional[str]] = mapped_column(String(128))
     is_admin: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Бот заблокирован пользователем (выясняется при рассылке) - рассылки его пропускают
+    is_blocked: Mapped[bool] = mapped_column(Boolean, default=False, server_default=false())
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
 
     quiz_results: Mapped[List["QuizResult"]] = relationship(back_populates="user")
+    created_quizzes: Mapped[List["Quiz"]] = relationship(back_populates="creator")
 
 
 class Quiz(Base):
@@ -31,6 +34,8 @@ class Quiz(Base):
     title: Mapped[str] = mapped_column(String(100), index=True)
     description: Mapped[str] = mapped_column(Text)
     content: Mapped[str] = mapped_column(Text)  # JSON или текстовое представление
+    compiled: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Скомпилированная форма вопросов
+    format_version: Mapped[int] = mapped_column(Integer, default=0)  # Версия формата compiled (0 - не скомпилирован)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     creator_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
@@ -39,6 +44,17 @@ class Quiz(Base):
     creator: Mapped["User"] = relationship(back_populates="created_quizzes")
 
 
+# Частичный индекс для постраничного каталога: только активные квизы,
+# порядок совпадает с keyset-пагинацией по (created_at, id)
+Index(
+    "ix_quizzes_active_catalog",
+    Quiz.created_at,
+    Quiz.id,
+    sqlite_where=Quiz.is_active == True,
+    postgresql_where=Quiz.is_active == True
+)
+
+
 class QuizResult(Base):
     __tablename__ = "quiz_results"
 
@@ -48,6 +64,125 @@ class QuizResult(Base):
     score: Mapped[int] = mapped_column(Integer)
     total_questions: Mapped[int] = mapped_column(Integer)
     completed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    # Ключ идемпотентности попытки - повторная запись того же результата игнорируется
+    idempotency_key: Mapped[Optional[str]] = mapped_column(String(64), unique=True, index=True, nullable=True)
 
     user: Mapped["User"] = relationship(back_populates="quiz_results")
     quiz: Mapped["Quiz"] = relationship(back_populates="results")
+
+
+# История пользователя: WHERE user_id = ? ORDER BY completed_at DESC
+Index("ix_quiz_results_user_completed", QuizResult.user_id, QuizResult.completed_at.desc())
+# Статистика и пересчет агрегатов по квизу
+Index("ix_quiz_results_quiz_id", QuizResult.quiz_id)
+# Поиск результатов старше окна хранения для свертки
+Index("ix_quiz_results_completed_at", QuizResult.completed_at)
+
+
+class QuizDailyScore(Base):
+    """Свертка старых результатов: попытки квиза за день по баллам"""
+    __tablename__ = "quiz_daily_scores"
+
+    quiz_id: Mapped[int] = mapped_column(ForeignKey("quizzes.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    score: Mapped[int] = mapped_column(Integer, primary_key=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class UserDailyResult(Base):
+    """Свертка старых результатов: попытки пользователя по квизу за день"""
+    __tablename__ = "user_daily_results"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    quiz_id: Mapped[int] = mapped_column(ForeignKey("quizzes.id"), primary_key=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    score_sum: Mapped[int] = mapped_column(Integer, default=0)
+    best_score: Mapped[int] = mapped_column(Integer, default=0)
+    total_questions_sum: Mapped[int] = mapped_column(Integer, default=0)
+
+
+# Пересчет рейтингов и очистка по квизу
+Index("ix_user_daily_results_quiz_id", UserDailyResult.quiz_id)
+
+
+class AnswerEvent(Base):
+    """Журнал ответов на вопросы (только добавление) для анализа качества вопросов"""
+    __tablename__ = "answer_events"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    attempt_id: Mapped[str] = mapped_column(String(32))  # attempt_id сессии прохождения
+    quiz_id: Mapped[int] = mapped_column(ForeignKey("quizzes.id"))
+    question_index: Mapped[int] = mapped_column(Integer)  # Индекс вопроса в квизе (без перемешивания)
+    option: Mapped[int] = mapped_column(Integer)  # Выбранный вариант (0-based)
+    is_correct: Mapped[bool] = mapped_column(Boolean)
+    latency_ms: Mapped[int] = mapped_column(Integer)  # Время от показа вопроса до ответа
+    answered_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+# Повторная запись того же ответа (повтор пакета) игнорируется
+Index("ux_answer_events_attempt_question", AnswerEvent.attempt_id, AnswerEvent.question_index, unique=True)
+# Выборка ответов квиза для анализа
+Index("ix_answer_events_quiz_id", AnswerEvent.quiz_id)
+
+
+class QuizStats(Base):
+    """Агрегаты по квизу, обновляемые инкрементально при сохранении результатов"""
+    __tablename__ = "quiz_stats"
+
+    quiz_id: Mapped[int] = mapped_column(ForeignKey("quizzes.id"), primary_key=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    score_sum: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class QuizScoreBucket(Base):
+    """Гистограмма баллов квиза: количество попыток с данным баллом"""
+    __tablename__ = "quiz_score_buckets"
+
+    quiz_id: Mapped[int] = mapped_column(ForeignKey("quizzes.id"), primary_key=True)
+    score: Mapped[int] = mapped_column(Integer, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class LeaderboardEntry(Base):
+    """Компактная копия рейтингов: из нее восстанавливаются рейтинги в памяти"""
+    __tablename__ = "leaderboard_entries"
+
+    quiz_id: Mapped[int] = mapped_column(Integer, primary_key=True)  # 0 - общий рейтинг
+    period: Mapped[str] = mapped_column(String(16), primary_key=True)  # all, w2026-42, d2026-10-18
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    score: Mapped[int] = mapped_column(Integer, default=0)
+
+
+# Загрузка рейтингов текущих периодов при старте
+Index("ix_leaderboard_entries_period", LeaderboardEntry.period)
+
+
+class FSMRecord(Base):
+    """Состояние FSM пользователя (персистентное хранилище aiogram)"""
+    __tablename__ = "fsm_storage"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    data: Mapped[str] = mapped_column(Text, default="{}")  # JSON
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class Broadcast(Base):
+    """Рассылка администратора с контрольной точкой для продолжения после перезапуска"""
+    __tablename__ = "broadcasts"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    text: Mapped[str] = mapped_column(Text)  # HTML
+    created_by: Mapped[int] = mapped_column(BigInteger)  # telegram_id администратора
+    status: Mapped[str] = mapped_column(String(16), default="running")  # running, done, cancelled
+    last_user_id: Mapped[int] = mapped_column(Integer, default=0)  # users.id последнего обработанного получателя
+    sent: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    blocked: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+# Поиск незавершенных рассылок при старте
+Index("ix_broadcasts_status", Broadcast.status)
@@ -1,52 +1,97 @@
 import logging
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy import select, func
+from sqlalchemy import Row, delete, insert, literal, select, func, union_all, update, tuple_
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from .models import User, Quiz, QuizResult
+from services.quiz_cache import quiz_cache
+from services.quiz_compiler import COMPILED_FORMAT_VERSION
+from services.user_cache import user_cache
+from .cleanup import get_missing_quiz_ids
+from .dialects import get_insert
+from .models import User, Quiz, QuizResult, QuizStats, UserDailyResult
+from .leaderboard import apply_results_to_leaderboards
+from .session import call_after_commit
+from .stats import apply_results_to_stats
 
 logger = logging.getLogger(__name__)
 
 
+def _user_upsert_stmt(
+        db: AsyncSession,
+        telegram_id: int,
+        username: Optional[str],
+        full_name: Optional[str]
+):
+    """INSERT ... ON CONFLICT(telegram_id) DO UPDATE для SQLite и PostgreSQL"""
+    insert = get_insert(db.bind.dialect.name)
+    stmt = insert(User).values(
+        telegram_id=telegram_id,
+        username=username,
+        full_name=full_name,
+        is_admin=False,
+        created_at=datetime.now()
+    )
+    # Как и раньше, пустые значения не затирают сохраненные данные.
+    # Написавший боту пользователь снова получает рассылки
+    return stmt.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={
+            "username": func.coalesce(stmt.excluded.username, User.username),
+            "full_name": func.coalesce(stmt.excluded.full_name, User.full_name),
+            "is_blocked": False
+        }
+    )
+
+
 async def get_or_create_user(
         db: AsyncSession,
         telegram_id: int,
         username: Optional[str] = None,
         full_name: Optional[str] = None
 ) -> User:
-    """Безопасное получение или создание пользователя"""
+    """Безопасное получение или создание пользователя одним запросом"""
     try:
-        async with db.begin():
-            stmt = select(User).where(User.telegram_id == telegram_id)
-            result = await db.execute(stmt)
-            user = result.scalar_one_or_none()
-
-            if user:
-                # Обновляем данные, если они изменились
-                if username and user.username != username:
-                    user.username = username
-                if full_name and user.full_name != full_name:
-                    user.full_name = full_name
-                await db.commit()
-            else:
-                user = User(
-                    telegram_id=telegram_id,
-                    username=username,
-                    full_name=full_name
-                )
-                db.add(user)
-                await db.commit()
-                await db.refresh(user)
-
-            return user
+        stmt = _user_upsert_stmt(db, telegram_id, username, full_name).returning(User)
+        result = await db.execute(stmt, execution_options={"populate_existing": True})
+        user = result.scalar_one()
+        # Откатившийся upsert не должен оставить в кэше несуществующий id
+        user_id = user.id
+        call_after_commit(db, lambda: user_cache.put(telegram_id, user_id, username, full_name))
+        return user
 
     except SQLAlchemyError as e:
         logger.error(f"Error in get_or_create_user: {e}")
-        await db.rollback()
+        raise ValueError("Ошибка при работе с пользователем")
+
+
+async def get_or_create_user_id(
+        db: AsyncSession,
+        telegram_id: int,
+        username: Optional[str] = None,
+        full_name: Optional[str] = None
+) -> int:
+    """
+    Возвращает users.id по telegram_id
+
+    Если пользователь недавно встречался и его данные не изменились,
+    обращения к БД нет вовсе. Иначе - один upsert с RETURNING id.
+    """
+    user_id = user_cache.get(telegram_id, username, full_name)
+    if user_id is not None:
+        return user_id
+
+    try:
+        stmt = _user_upsert_stmt(db, telegram_id, username, full_name).returning(User.id)
+        user_id = (await db.execute(stmt)).scalar_one()
+        call_after_commit(db, lambda: user_cache.put(telegram_id, user_id, username, full_name))
+        return user_id
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error in get_or_create_user_id: {e}")
         raise ValueError("Ошибка при работе с пользователем")
 
 
@@ -55,89 +100,209 @@ async def create_quiz(
         title: str,
         description: str,
         content: str,
-        creator_id: int
+        creator_id: int,
+        compiled: Optional[str] = None,
+        format_version: int = 0
 ) -> Quiz:
-    """Создание квиза с транзакцией"""
+    """Создание квиза"""
     try:
-        async with db.begin():
-            quiz = Quiz(
-                title=title,
-                description=description,
-                content=content,
-                creator_id=creator_id
-            )
-            db.add(quiz)
-            await db.commit()
-            await db.refresh(quiz)
-            return quiz
+        quiz = Quiz(
+            title=title,
+            description=description,
+            content=content,
+            compiled=compiled,
+            format_version=format_version if compiled else 0,
+            creator_id=creator_id
+        )
+        db.add(quiz)
+        await db.flush()
+        return quiz
 
     except SQLAlchemyError as e:
         logger.error(f"Error creating quiz: {e}")
-        await db.rollback()
         raise ValueError("Ошибка при создании квиза")
 
 
-async def get_active_quizzes(db: AsyncSession) -> List[Quiz]:
-    """Безопасное получение активных квизов"""
+async def bulk_create_quizzes(
+        db: AsyncSession,
+        creator_id: int,
+        quizzes: List,
+        batch_size: int = 1000
+) -> int:
+    """
+    Массовое создание квизов (импорт) многострочными INSERT в текущей транзакции
+
+    quizzes - объекты с полями title, description, content и compiled
+    (services.quiz_import.ImportedQuiz). Возвращает количество вставленных строк.
+    """
     try:
-        async with db.begin():
-            stmt = (
-                select(Quiz)
-                .where(Quiz.is_active == True)
-                .options(selectinload(Quiz.creator))
-            )
-            result = await db.execute(stmt)
-            return list(result.scalars().all())
+        now = datetime.now()
+        for start in range(0, len(quizzes), batch_size):
+            rows = [
+                {
+                    "title": quiz.title,
+                    "description": quiz.description,
+                    "content": quiz.content,
+                    "compiled": quiz.compiled,
+                    "format_version": COMPILED_FORMAT_VERSION,
+                    "is_active": True,
+                    "creator_id": creator_id,
+                    "created_at": now
+                }
+                for quiz in quizzes[start:start + batch_size]
+            ]
+            await db.execute(insert(Quiz), rows)
+        return len(quizzes)
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error importing quizzes: {e}")
+        raise ValueError("Ошибка при импорте квизов")
+
+
+async def get_active_quizzes(
+        db: AsyncSession,
+        after: Optional[Tuple[datetime, int]] = None,
+        before: Optional[Tuple[datetime, int]] = None,
+        limit: int = 10
+) -> Tuple[List[Row], bool]:
+    """
+    Страница каталога активных квизов (новые сначала)
+
+    Keyset-пагинация по (created_at, id): after - курсор последней строки
+    предыдущей страницы, before - первой строки следующей. Загружаются только
+    id, title и created_at. Возвращает строки и признак наличия еще страниц
+    в направлении перехода. Только чтение - вызывается с сессией db_read.
+    """
+    try:
+        key = tuple_(Quiz.created_at, Quiz.id)
+        stmt = (
+            select(Quiz.id, Quiz.title, Quiz.created_at)
+            .where(Quiz.is_active == True)
+            .limit(limit + 1)
+        )
+        if before is not None:
+            stmt = stmt.where(key > tuple_(*before)).order_by(Quiz.created_at, Quiz.id)
+        else:
+            if after is not None:
+                stmt = stmt.where(key < tuple_(*after))
+            stmt = stmt.order_by(Quiz.created_at.desc(), Quiz.id.desc())
+
+        rows = list((await db.execute(stmt)).all())
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before is not None:
+            rows.reverse()
+        return rows, has_more
 
     except SQLAlchemyError as e:
         logger.error(f"Error fetching active quizzes: {e}")
-        await db.rollback()
         raise ValueError("Ошибка при получении квизов")
 
 
+async def get_quiz_title(db: AsyncSession, quiz_id: int) -> Optional[str]:
+    """Название квиза без загрузки его содержимого"""
+    try:
+        result = await db.execute(select(Quiz.title).where(Quiz.id == quiz_id))
+        return result.scalar_one_or_none()
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error fetching title of quiz {quiz_id}: {e}")
+        raise ValueError("Ошибка при поиске квиза")
+
+
 async def get_quiz_by_id(db: AsyncSession, quiz_id: int) -> Optional[Quiz]:
     """Получение квиза по ID с проверкой"""
     try:
-        async with db.begin():
-            stmt = (
-                select(Quiz)
-                .where(Quiz.id == quiz_id)
-                .options(selectinload(Quiz.creator))
-            )
-            result = await db.execute(stmt)
-            return result.scalar_one_or_none()
+        stmt = (
+            select(Quiz)
+            .where(Quiz.id == quiz_id)
+            .options(selectinload(Quiz.creator))
+        )
+        result = await db.execute(stmt)
+        return result.scalar_one_or_none()
 
     except SQLAlchemyError as e:
         logger.error(f"Error fetching quiz {quiz_id}: {e}")
-        await db.rollback()
         raise ValueError("Ошибка при поиске квиза")
 
 
+async def save_compiled_quiz(
+        db: AsyncSession,
+        quiz_id: int,
+        compiled: str,
+        format_version: int
+) -> None:
+    """Сохранение перекомпилированной формы квиза (ленивое обновление старых записей)"""
+    try:
+        await db.execute(
+            update(Quiz)
+            .where(Quiz.id == quiz_id)
+            .values(compiled=compiled, format_version=format_version)
+        )
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error saving compiled quiz {quiz_id}: {e}")
+        raise ValueError("Ошибка сохранения квиза")
+
+
+async def record_quiz_results(db: AsyncSession, rows: List[dict]) -> int:
+    """
+    Пакетная запись результатов одним многострочным INSERT
+
+    Строки с уже записанным idempotency_key пропускаются, для новых
+    инкрементально обновляются quiz_stats и рейтинги. Результаты квизов,
+    удаленных очисткой, пока строки ждали записи, не сохраняются.
+    Возвращает количество реально добавленных результатов.
+    """
+    if not rows:
+        return 0
+
+    insert = get_insert(db.bind.dialect.name)
+    stmt = (
+        insert(QuizResult)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=[QuizResult.idempotency_key])
+        .returning(
+            QuizResult.id, QuizResult.quiz_id, QuizResult.user_id, QuizResult.score, QuizResult.completed_at
+        )
+    )
+    inserted = (await db.execute(stmt)).all()
+
+    missing = await get_missing_quiz_ids(db, (row.quiz_id for row in inserted))
+    if missing:
+        orphans = [row.id for row in inserted if row.quiz_id in missing]
+        await db.execute(delete(QuizResult).where(QuizResult.id.in_(orphans)))
+        inserted = [row for row in inserted if row.quiz_id not in missing]
+        logger.warning(f"Skipped {len(orphans)} results of deleted quizzes {sorted(missing)}")
+
+    # Агрегаты и рейтинги обновляются в той же транзакции и только по новым строкам
+    await apply_results_to_stats(db, inserted)
+    await apply_results_to_leaderboards(db, inserted)
+    return len(inserted)
+
+
 async def save_quiz_result(
         db: AsyncSession,
         user_id: int,
         quiz_id: int,
         score: int,
-        total_questions: int
-) -> QuizResult:
-    """Сохранение результата с транзакцией"""
+        total_questions: int,
+        idempotency_key: Optional[str] = None
+) -> bool:
+    """Сохранение результата (False - такой результат уже был записан)"""
     try:
-        async with db.begin():
-            result = QuizResult(
-                user_id=user_id,
-                quiz_id=quiz_id,
-                score=score,
-                total_questions=total_questions,
-                completed_at=datetime.now()
-            )
-            db.add(result)
-            await db.commit()
-            await db.refresh(result)
-            return result
+        inserted = await record_quiz_results(db, [{
+            "user_id": user_id,
+            "quiz_id": quiz_id,
+            "score": score,
+            "total_questions": total_questions,
+            "completed_at": datetime.now(),
+            "idempotency_key": idempotency_key
+        }])
+        return inserted > 0
 
     except SQLAlchemyError as e:
         logger.error(f"Error saving quiz result: {e}")
-        await db.rollback()
         raise ValueError("Ошибка сохранения результата")
 
 
@@ -148,63 +313,140 @@ async def update_quiz_activity(
 ) -> bool:
     """Обновление статуса квиза с гарантированным возвратом bool"""
     try:
-        async with db.begin():
-            # Самый надежный вариант - отдельный запрос на проверку
-            quiz = await db.get(Quiz, quiz_id)
-            if not quiz:
-                return False
+        # Самый надежный вариант - отдельный запрос на проверку
+        quiz = await db.get(Quiz, quiz_id)
+        if not quiz:
+            return False
 
-            quiz.is_active = is_active
-            await db.commit()
-            return True
+        quiz.is_active = is_active
+        await db.flush()
+        quiz_cache.invalidate(quiz_id)
+        return True
 
     except SQLAlchemyError as e:
         logger.error(f"Error updating quiz {quiz_id}: {e}")
-        await db.rollback()
         raise ValueError("Ошибка обновления квиза")
 
 
-async def get_user_results(
+async def get_user_summary(db: AsyncSession, user_id: int) -> Row:
+    """
+    Итоги пользователя одним запросом: попытки, квизы, верные ответы, вопросы, последняя игра
+
+    Недавние попытки берутся из quiz_results, старые - из дневной свертки
+    user_daily_results. Последняя игра - last_played (время из quiz_results)
+    или, если недавних попыток нет, last_played_day (день из свертки).
+    Только чтение - вызывается с сессией db_read.
+    """
+    try:
+        combined = union_all(
+            select(
+                QuizResult.quiz_id,
+                literal(1).label("attempts"),
+                QuizResult.score.label("score_sum"),
+                QuizResult.total_questions.label("total_questions_sum")
+            ).where(QuizResult.user_id == user_id),
+            select(
+                UserDailyResult.quiz_id,
+                UserDailyResult.attempts,
+                UserDailyResult.score_sum,
+                UserDailyResult.total_questions_sum
+            ).where(UserDailyResult.user_id == user_id)
+        ).subquery()
+        last_played = (
+            select(func.max(QuizResult.completed_at))
+            .where(QuizResult.user_id == user_id)
+            .scalar_subquery()
+        )
+        # В свертке хранится только день; время и день - разные типы, поэтому отдельным столбцом
+        last_played_day = (
+            select(func.max(UserDailyResult.day))
+            .where(UserDailyResult.user_id == user_id)
+            .scalar_subquery()
+        )
+        stmt = select(
+            func.coalesce(func.sum(combined.c.attempts), 0).label("attempts"),
+            func.count(func.distinct(combined.c.quiz_id)).label("quizzes"),
+            func.coalesce(func.sum(combined.c.score_sum), 0).label("correct"),
+            func.coalesce(func.sum(combined.c.total_questions_sum), 0).label("questions"),
+            last_played.label("last_played"),
+            last_played_day.label("last_played_day")
+        )
+        return (await db.execute(stmt)).one()
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error fetching summary for user {user_id}: {e}")
+        raise ValueError("Ошибка получения статистики")
+
+
+async def get_user_history(
         db: AsyncSession,
-        user_id: int
-) -> List[QuizResult]:
-    """Получение результатов пользователя"""
+        user_id: int,
+        after: Optional[Tuple[datetime, int]] = None,
+        limit: int = 10
+) -> Tuple[List[Row], bool]:
+    """
+    Страница истории прохождений (новые сначала)
+
+    Keyset-пагинация по (completed_at, id) по индексу истории пользователя,
+    из квиза загружается только название. Возвращает строки и признак
+    следующей страницы. Только чтение - вызывается с сессией db_read.
+    """
     try:
-        async with db.begin():
-            stmt = (
-                select(QuizResult)
-                .join(Quiz)
-                .where(QuizResult.user_id == user_id)
-                .options(selectinload(QuizResult.quiz))
-                .order_by(QuizResult.completed_at.desc())
+        stmt = (
+            select(
+                QuizResult.id,
+                QuizResult.score,
+                QuizResult.total_questions,
+                QuizResult.completed_at,
+                Quiz.title
             )
-            result = await db.execute(stmt)
-            return list(result.scalars().all())
+            .join(Quiz, QuizResult.quiz_id == Quiz.id)
+            .where(QuizResult.user_id == user_id)
+            .order_by(QuizResult.completed_at.desc(), QuizResult.id.desc())
+            .limit(limit + 1)
+        )
+        if after is not None:
+            stmt = stmt.where(tuple_(QuizResult.completed_at, QuizResult.id) < tuple_(*after))
+
+        rows = list((await db.execute(stmt)).all())
+        return rows[:limit], len(rows) > limit
 
     except SQLAlchemyError as e:
-        logger.error(f"Error fetching results for user {user_id}: {e}")
-        await db.rollback()
+        logger.error(f"Error fetching history for user {user_id}: {e}")
         raise ValueError("Ошибка получения результатов")
 
 
 async def get_quiz_stats(db: AsyncSession, quiz_id: int) -> dict:
-    """Получение статистики квиза"""
+    """Получение статистики квиза из материализованных агрегатов"""
     try:
-        async with db.begin():
-            stmt = select(
-                func.count(QuizResult.id).label("total_attempts"),
-                func.avg(QuizResult.score).label("average_score")
-            ).where(QuizResult.quiz_id == quiz_id)
-
-            result = await db.execute(stmt)
-            stats = result.first()
+        stats = await db.get(QuizStats, quiz_id)
+        if not stats or not stats.attempts:
+            return {"total_attempts": 0, "average_score": 0.0}
 
-            return {
-                "total_attempts": stats.total_attempts or 0,
-                "average_score": float(stats.average_score or 0)
-            }
+        return {
+            "total_attempts": stats.attempts,
+            "average_score": stats.score_sum / stats.attempts
+        }
 
     except SQLAlchemyError as e:
         logger.error(f"Error fetching stats for quiz {quiz_id}: {e}")
-        await db.rollback()
         raise ValueError("Ошибка получения статистики")
+
+
+async def get_user_names(db: AsyncSession, user_ids: List[int]) -> Dict[int, str]:
+    """Отображаемые имена пользователей по users.id"""
+    if not user_ids:
+        return {}
+
+    try:
+        result = await db.execute(
+            select(User.id, User.full_name, User.username).where(User.id.in_(user_ids))
+        )
+        return {
+            row.id: row.full_name or row.username or f"Игрок {row.id}"
+            for row in result.all()
+        }
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error fetching user names: {e}")
+        raise ValueError("Ошибка при работе с пользователем")
@@ -0,0 +1,106 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import case, delete, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .dialects import get_insert
+from .models import QuizDailyScore, QuizResult, UserDailyResult
+
+logger = logging.getLogger(__name__)
+
+
+async def rollup_results_batch(db: AsyncSession, cutoff: datetime, batch_size: int) -> int:
+    """
+    Сворачивает до batch_size самых старых результатов до cutoff в дневные агрегаты
+
+    Свертка и удаление сырых строк выполняются в одной транзакции
+    вызывающего кода, поэтому повтор после сбоя не задваивает агрегаты.
+    Возвращает количество свернутых результатов (0 - сворачивать нечего).
+    """
+    try:
+        rows = (await db.execute(
+            select(
+                QuizResult.id,
+                QuizResult.user_id,
+                QuizResult.quiz_id,
+                QuizResult.score,
+                QuizResult.total_questions,
+                QuizResult.completed_at
+            )
+            .where(QuizResult.completed_at < cutoff)
+            .order_by(QuizResult.id)
+            .limit(batch_size)
+        )).all()
+        if not rows:
+            return 0
+
+        quiz_days = defaultdict(int)
+        user_days = {}
+        for _, user_id, quiz_id, score, total_questions, completed_at in rows:
+            day = completed_at.date()
+            quiz_days[(quiz_id, day, score)] += 1
+
+            key = (user_id, day, quiz_id)
+            current = user_days.get(key)
+            if current is None:
+                user_days[key] = [1, score, score, total_questions]
+            else:
+                current[0] += 1
+                current[1] += score
+                current[2] = max(current[2], score)
+                current[3] += total_questions
+
+        insert = get_insert(db.bind.dialect.name)
+
+        stmt = insert(QuizDailyScore)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[QuizDailyScore.quiz_id, QuizDailyScore.day, QuizDailyScore.score],
+            set_={"attempts": QuizDailyScore.attempts + stmt.excluded.attempts}
+        )
+        await db.execute(stmt, [
+            {"quiz_id": quiz_id, "day": day, "score": score, "attempts": attempts}
+            for (quiz_id, day, score), attempts in quiz_days.items()
+        ])
+
+        stmt = insert(UserDailyResult)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserDailyResult.user_id, UserDailyResult.day, UserDailyResult.quiz_id],
+            set_={
+                "attempts": UserDailyResult.attempts + stmt.excluded.attempts,
+                "score_sum": UserDailyResult.score_sum + stmt.excluded.score_sum,
+                "best_score": case(
+                    (stmt.excluded.best_score > UserDailyResult.best_score, stmt.excluded.best_score),
+                    else_=UserDailyResult.best_score
+                ),
+                "total_questions_sum": UserDailyResult.total_questions_sum + stmt.excluded.total_questions_sum
+            }
+        )
+        await db.execute(stmt, [
+            {
+                "user_id": user_id,
+                "day": day,
+                "quiz_id": quiz_id,
+                "attempts": attempts,
+                "score_sum": score_sum,
+                "best_score": best_score,
+                "total_questions_sum": total_questions_sum
+            }
+            for (user_id, day, quiz_id), (attempts, score_sum, best_score, total_questions_sum)
+            in user_days.items()
+        ])
+
+        # Выбранные строки - это ровно строки до cutoff в диапазоне их id
+        await db.execute(
+            delete(QuizResult).where(
+                QuizResult.id.between(rows[0].id, rows[-1].id),
+                QuizResult.completed_at < cutoff
+            )
+        )
+        return len(rows)
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error rolling up quiz results: {e}")
+        raise ValueError("Ошибка свертки результатов")
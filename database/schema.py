@@ -0,0 +1,56 @@
+import logging
+from pathlib import Path
+from typing import Optional
+
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+BASELINE_REVISION = "0001"  # Схема версии бота до перехода на миграции (create_all)
+
+
+def get_head_revision() -> Optional[str]:
+    """Последняя ревизия миграций в репозитории"""
+    config = Config(str(ALEMBIC_INI))
+    return ScriptDirectory.from_config(config).get_current_head()
+
+
+async def get_current_revision(engine: AsyncEngine) -> Optional[str]:
+    """Ревизия, на которой находится база (None - миграции не применялись)"""
+    async with engine.connect() as conn:
+        return await conn.run_sync(
+            lambda sync_conn: MigrationContext.configure(sync_conn).get_current_revision()
+        )
+
+
+async def check_schema_version(engine: AsyncEngine) -> None:
+    """
+    Проверяет, что схема базы соответствует последней миграции
+
+    Бот не создает и не меняет таблицы при запуске - схема обновляется
+    только командой alembic upgrade head.
+    """
+    head = get_head_revision()
+    current = await get_current_revision(engine)
+    if current is None and await _has_tables(engine):
+        # База создана до миграций: ее таблицы уже соответствуют 0001
+        raise RuntimeError(
+            f"База данных создана без миграций. Выполните: "
+            f"alembic stamp {BASELINE_REVISION} && alembic upgrade head"
+        )
+    if current != head:
+        raise RuntimeError(
+            f"Схема базы данных устарела (ревизия {current}, требуется {head}). "
+            f"Выполните: alembic upgrade head"
+        )
+    logger.info(f"Database schema revision: {current}")
+
+
+async def _has_tables(engine: AsyncEngine) -> bool:
+    async with engine.connect() as conn:
+        return await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table("users"))
@@ -0,0 +1,125 @@
+import logging
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_AFTER_COMMIT = "after_commit_callbacks"
+
+
+def call_after_commit(db: AsyncSession, callback: Callable[[], object]) -> None:
+    """
+    Откладывает callback до успешной фиксации текущей транзакции сессии
+
+    Так обновляются структуры в памяти (кэши, рейтинги), которые не должны
+    видеть незафиксированные данные. При откате callback отбрасывается.
+    """
+    db.info.setdefault(_AFTER_COMMIT, []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session) -> None:
+    for callback in session.info.pop(_AFTER_COMMIT, ()):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"After-commit callback failed: {e}", exc_info=True)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_after_commit(session: Session, transaction) -> None:
+    # После фиксации список уже пуст; непустой - транзакция откатилась или закрыта
+    if transaction.parent is None:
+        session.info.pop(_AFTER_COMMIT, None)
+
+
+class LazySession:
+    """
+    Ленивый прокси для AsyncSession на время обработки одного апдейта
+
+    Сессия (и соединение из пула) создается только при первом обращении
+    обработчика к БД. Фиксация или откат выполняются в одном месте - в
+    middleware через finish(), поэтому запросам не нужны свои db.begin().
+
+    Обработчики обычно сами перехватывают ошибки запросов, и middleware
+    видит успешное завершение. Поэтому ошибка SQLAlchemy в запросе
+    запоминается, и finish() вместо фиксации частичных изменений
+    откатывает транзакцию.
+    """
+    __slots__ = ("_session_maker", "_session", "_failed")
+
+    def __init__(self, session_maker: async_sessionmaker):
+        self._session_maker = session_maker
+        self._session: Optional[AsyncSession] = None
+        self._failed = False
+
+    @property
+    def is_used(self) -> bool:
+        """Обращался ли обработчик к БД"""
+        return self._session is not None
+
+    @property
+    def failed(self) -> bool:
+        """Был ли в текущей транзакции запрос с ошибкой"""
+        return self._failed
+
+    def _get_session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._session_maker()
+        return self._session
+
+    def __getattr__(self, name: str):
+        return getattr(self._get_session(), name)
+
+    async def _call(self, method: str, *args, **kwargs):
+        try:
+            return await getattr(self._get_session(), method)(*args, **kwargs)
+        except SQLAlchemyError:
+            self._failed = True
+            raise
+
+    async def execute(self, *args, **kwargs):
+        return await self._call("execute", *args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return await self._call("scalar", *args, **kwargs)
+
+    async def scalars(self, *args, **kwargs):
+        return await self._call("scalars", *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return await self._call("get", *args, **kwargs)
+
+    async def flush(self, *args, **kwargs):
+        return await self._call("flush", *args, **kwargs)
+
+    async def rollback(self) -> None:
+        """Явный откат обработчиком: после него транзакцию снова можно фиксировать"""
+        self._failed = False
+        if self._session is not None:
+            await self._session.rollback()
+
+    async def finish(self, commit: bool) -> None:
+        """Фиксирует (или откатывает) транзакцию и возвращает соединение в пул"""
+        if self._session is None:
+            return
+
+        session, self._session = self._session, None
+        if commit and self._failed:
+            logger.warning("Rolling back update transaction after a failed query")
+            commit = False
+        self._failed = False
+        try:
+            if commit:
+                await session.commit()
+            else:
+                await session.rollback()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
@@ -0,0 +1,139 @@
+import logging
+from collections import Counter
+from typing import Iterable, List, Optional
+
+from sqlalchemy import delete, func, insert, select, union_all
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .dialects import get_insert
+from .models import QuizDailyScore, QuizResult, QuizScoreBucket, QuizStats
+
+logger = logging.getLogger(__name__)
+
+
+async def apply_results_to_stats(db: AsyncSession, results: Iterable) -> None:
+    """
+    Инкрементально добавляет результаты в quiz_stats и гистограмму баллов
+
+    results - строки с атрибутами quiz_id и score (только реально вставленные
+    результаты, чтобы повтор записи не задвоил агрегаты).
+    """
+    attempts = Counter()
+    score_sums = Counter()
+    buckets = Counter()
+    for result in results:
+        attempts[result.quiz_id] += 1
+        score_sums[result.quiz_id] += result.score
+        buckets[(result.quiz_id, result.score)] += 1
+
+    if not attempts:
+        return
+
+    insert_stmt = get_insert(db.bind.dialect.name)
+
+    stmt = insert_stmt(QuizStats)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[QuizStats.quiz_id],
+        set_={
+            "attempts": QuizStats.attempts + stmt.excluded.attempts,
+            "score_sum": QuizStats.score_sum + stmt.excluded.score_sum
+        }
+    )
+    await db.execute(stmt, [
+        {"quiz_id": quiz_id, "attempts": count, "score_sum": score_sums[quiz_id]}
+        for quiz_id, count in attempts.items()
+    ])
+
+    stmt = insert_stmt(QuizScoreBucket)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[QuizScoreBucket.quiz_id, QuizScoreBucket.score],
+        set_={"count": QuizScoreBucket.count + stmt.excluded.count}
+    )
+    await db.execute(stmt, [
+        {"quiz_id": quiz_id, "score": score, "count": count}
+        for (quiz_id, score), count in buckets.items()
+    ])
+
+
+async def rebuild_quiz_stats(db: AsyncSession, quiz_ids: Optional[List[int]] = None) -> None:
+    """
+    Пересчитывает агрегаты из сырых результатов (для всех квизов или указанных)
+
+    Результаты старше окна хранения берутся из дневной свертки quiz_daily_scores.
+    """
+    try:
+        stats_delete = delete(QuizStats)
+        buckets_delete = delete(QuizScoreBucket)
+        raw = select(QuizResult.quiz_id, QuizResult.score, func.count(QuizResult.id).label("attempts"))
+        rolled = select(QuizDailyScore.quiz_id, QuizDailyScore.score, QuizDailyScore.attempts)
+        if quiz_ids is not None:
+            stats_delete = stats_delete.where(QuizStats.quiz_id.in_(quiz_ids))
+            buckets_delete = buckets_delete.where(QuizScoreBucket.quiz_id.in_(quiz_ids))
+            raw = raw.where(QuizResult.quiz_id.in_(quiz_ids))
+            rolled = rolled.where(QuizDailyScore.quiz_id.in_(quiz_ids))
+
+        # Гистограмма баллов по сырым строкам и свертке - из нее же сумма и число попыток
+        combined = union_all(
+            raw.group_by(QuizResult.quiz_id, QuizResult.score),
+            rolled
+        ).subquery()
+        buckets_select = (
+            select(combined.c.quiz_id, combined.c.score, func.sum(combined.c.attempts))
+            .group_by(combined.c.quiz_id, combined.c.score)
+        )
+        stats_select = (
+            select(
+                combined.c.quiz_id,
+                func.sum(combined.c.attempts),
+                func.sum(combined.c.score * combined.c.attempts)
+            )
+            .group_by(combined.c.quiz_id)
+        )
+
+        await db.execute(stats_delete)
+        await db.execute(buckets_delete)
+        await db.execute(
+            insert(QuizStats).from_select(
+                [QuizStats.quiz_id, QuizStats.attempts, QuizStats.score_sum],
+                stats_select
+            )
+        )
+        await db.execute(
+            insert(QuizScoreBucket).from_select(
+                [QuizScoreBucket.quiz_id, QuizScoreBucket.score, QuizScoreBucket.count],
+                buckets_select
+            )
+        )
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error rebuilding quiz stats: {e}")
+        raise ValueError("Ошибка пересчета статистики")
+
+
+async def get_score_percentile(db: AsyncSession, quiz_id: int, score: int) -> Optional[float]:
+    """
+    Доля попыток (в процентах), набравших меньше score
+
+    Читается одна строка quiz_stats и не более (число вопросов + 1) строк
+    гистограммы. None - если квиз еще никто не проходил.
+    """
+    try:
+        stmt = select(
+            select(QuizStats.attempts)
+            .where(QuizStats.quiz_id == quiz_id)
+            .scalar_subquery()
+            .label("attempts"),
+            select(func.coalesce(func.sum(QuizScoreBucket.count), 0))
+            .where(QuizScoreBucket.quiz_id == quiz_id, QuizScoreBucket.score < score)
+            .scalar_subquery()
+            .label("below")
+        )
+        row = (await db.execute(stmt)).first()
+        if not row.attempts:
+            return None
+        return row.below / row.attempts * 100
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error fetching percentile for quiz {quiz_id}: {e}")
+        raise ValueError("Ошибка получения статистики")
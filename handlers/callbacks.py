@@ -1,49 +1,177 @@
 from aiogram import Router, F
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import CallbackQuery, Message, User
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import StateFilter
-from sqlalchemy.ext.asyncio import AsyncSession
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+import asyncio
+import html
 import logging
+import weakref
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
 
 from database.queries import (
+    get_active_quizzes,
     get_quiz_by_id,
     save_quiz_result,
-    get_or_create_user
+    save_compiled_quiz,
+    get_or_create_user_id,
+    get_user_history
 )
+from config import (
+    SHUFFLE_QUESTIONS,
+    QUIZ_PAGE_SIZE,
+    COMPACT_PLAY,
+    STATS_HISTORY_PAGE_SIZE,
+    QUESTION_TIME_GRACE_MS
+)
+from database.session import LazySession
+from database.stats import get_score_percentile
 from keyboards.inline import (
-    get_question_keyboard,
-    get_quiz_result_keyboard
+    get_leaderboard_keyboard,
+    get_quiz_question_keyboard,
+    get_quiz_result_keyboard,
+    get_quizzes_keyboard,
+    get_stats_history_keyboard,
+    decode_catalog_cursor
 )
-from services.quiz_processor import process_quiz
+from services.batch_writer import WriteBehindWriter
+from services.leaderboard import leaderboards, WINDOWS
+from services.quiz_cache import quiz_cache, CachedQuiz
+from services.quiz_compiler import load_quiz_questions, COMPILED_FORMAT_VERSION
+from services.quiz_parser import QuizQuestion
+from services.quiz_session import new_session_data, now_ms, session_question_index
+from services.stats_cache import stats_cache
+from services.timer_wheel import TimerWheel
 from states import QuizStates
-from handlers.commands import cmd_run
+from handlers.commands import cmd_run, format_history, render_leaderboard, render_user_stats
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True, slots=True)
+class QuestionDeadline:
+    """Таймер вопроса с ограничением времени"""
+    message: Message  # Сообщение, в котором показан вопрос
+    user: User
+    attempt_id: str
+    position: int  # Номер вопроса в прохождении (current_question)
+
+
+# Блокировки прохождения по (chat_id, user_id): живут, пока ими кто-то пользуется
+_question_locks: "weakref.WeakValueDictionary[Tuple[int, int], asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def question_lock(chat_id: int, user_id: int) -> asyncio.Lock:
+    """Блокировка, под которой ответ или таймер переводит квиз к следующему вопросу"""
+    lock = _question_locks.get((chat_id, user_id))
+    if lock is None:
+        lock = _question_locks[(chat_id, user_id)] = asyncio.Lock()
+    return lock
+
+
+async def load_quiz(db: AsyncSession, quiz_id: int) -> Optional[CachedQuiz]:
+    """Загружает разобранный квиз из кэша, при промахе - из БД"""
+    cached = quiz_cache.get(quiz_id)
+    if cached:
+        return cached
+
+    quiz = await get_quiz_by_id(db, quiz_id)
+    if not quiz:
+        return None
+
+    # Квиз уже скомпилирован при создании - парсим текст только для старых записей
+    questions, recompiled = load_quiz_questions(quiz)
+    if recompiled:
+        await save_compiled_quiz(db, quiz.id, recompiled, COMPILED_FORMAT_VERSION)
+
+    cached = CachedQuiz(
+        id=quiz.id,
+        version=COMPILED_FORMAT_VERSION,
+        title=quiz.title,
+        questions=questions
+    )
+    quiz_cache.put(cached)
+    return cached
+
+
+async def get_session_quiz(db: AsyncSession, data: dict) -> CachedQuiz:
+    """Возвращает квиз текущей сессии, проверяя что его версия не изменилась"""
+    quiz = await load_quiz(db, data["quiz_id"])
+    if not quiz or quiz.version != data["quiz_version"]:
+        raise ValueError("Квиз был изменен или удален")
+    return quiz
+
+
+async def send_or_edit(message: Message, text: str, reply_markup=None, edit: bool = False) -> Message:
+    """
+    Редактирует сообщение квиза на месте (компактный режим) или отправляет новое
+
+    Возвращает сообщение, в котором теперь показан текст.
+    """
+    if edit:
+        try:
+            edited = await message.edit_text(text, reply_markup=reply_markup)
+            return edited if isinstance(edited, Message) else message
+        except TelegramBadRequest:
+            pass  # Сообщение уже нельзя изменить - отправляем новое
+    return await message.answer(text, reply_markup=reply_markup)
+
+
 async def show_question(
         message: Message,
         state: FSMContext,
-        db: AsyncSession
+        db: AsyncSession,
+        user: User,
+        data: Optional[dict] = None,
+        result_writer: Optional[WriteBehindWriter] = None,
+        feedback: Optional[str] = None,
+        timers: Optional[TimerWheel] = None
 ) -> None:
-    """Показывает текущий вопрос квиза"""
+    """
+    Показывает текущий вопрос квиза
+
+    Если передан feedback (компактный режим), сообщение квиза редактируется
+    на месте: отзыв об ответе и следующий вопрос - одним запросом к API.
+    Для вопроса с ограничением времени ставится таймер в общем колесе timers.
+    """
     try:
-        data = await state.get_data()
+        if data is None:
+            data = await state.get_data()
+        quiz = await get_session_quiz(db, data)
         current_idx = data["current_question"]
-        questions = data["questions"]
+        total_questions = len(quiz.questions)
 
-        if current_idx >= len(questions):
-            await finish_quiz(message, state, db)
+        if current_idx >= total_questions:
+            await finish_quiz(message, state, db, user, data, total_questions, result_writer, feedback)
             return
 
-        question = questions[current_idx]
-        await message.answer(
-            f"❓ Вопрос {current_idx + 1}/{len(questions)}:\n\n"
-            f"{question['text']}",
-            reply_markup=get_question_keyboard(question["options"])
+        question_idx = session_question_index(quiz, data)
+        question = quiz.questions[question_idx]
+        text = (
+            f"❓ Вопрос {current_idx + 1}/{total_questions}:\n\n"
+            f"{html.escape(question.text)}"
         )
+        if question.time_limit:
+            text += f"\n\n⏱ На ответ: {question.time_limit} сек"
+        shown = await send_or_edit(
+            message,
+            f"{feedback}\n\n{text}" if feedback else text,
+            reply_markup=get_quiz_question_keyboard(quiz, question_idx),
+            edit=feedback is not None
+        )
+
+        if question.time_limit and timers is not None:
+            # Таймер срабатывает тогда же, когда ответ перестает приниматься
+            timers.schedule(
+                (shown.chat.id, user.id),
+                question.time_limit + QUESTION_TIME_GRACE_MS / 1000,
+                QuestionDeadline(shown, user, data["attempt_id"], current_idx)
+            )
 
     except Exception as e:
         logger.error(f"Error showing question: {e}")
@@ -51,40 +179,161 @@ async def show_question(
         await state.clear()
 
 
-async def finish_quiz(
+async def advance_quiz(
         message: Message,
         state: FSMContext,
-        db: AsyncSession
+        db: AsyncSession,
+        user: User,
+        data: dict,
+        feedback: str,
+        result_writer: Optional[WriteBehindWriter] = None,
+        timers: Optional[TimerWheel] = None
 ) -> None:
-    """Завершает квиз и сохраняет результат"""
-    try:
+    """Показывает отзыв о вопросе и следующий вопрос (или итог квиза)"""
+    if COMPACT_PLAY:
+        # Отзыв и следующий вопрос (или итог) - одно редактирование сообщения
+        await show_question(message, state, db, user, data, result_writer, feedback, timers)
+    else:
+        try:
+            await message.edit_text(feedback, reply_markup=None)
+        except TelegramBadRequest:
+            pass
+        await show_question(message, state, db, user, data, result_writer, timers=timers)
+
+
+async def skip_timed_out_question(
+        message: Message,
+        state: FSMContext,
+        db: AsyncSession,
+        user: User,
+        data: dict,
+        question: QuizQuestion,
+        result_writer: Optional[WriteBehindWriter] = None,
+        timers: Optional[TimerWheel] = None
+) -> None:
+    """Время на вопрос вышло: вопрос не засчитывается, квиз переходит к следующему"""
+    data = await state.update_data(
+        current_question=data["current_question"] + 1,
+        shown_at_ms=now_ms()
+    )
+    feedback = (
+        "⏰ Время вышло!\n"
+        f"Правильный ответ: {html.escape(question.options[question.correct_answer])}"
+    )
+    await advance_quiz(message, state, db, user, data, feedback, result_writer, timers)
+
+
+def is_answer_late(question: QuizQuestion, data: dict, answered_at_ms: int) -> bool:
+    """Ответ пришел позже ограничения времени (с запасом на доставку)"""
+    if not question.time_limit:
+        return False
+    elapsed = answered_at_ms - data.get("shown_at_ms", answered_at_ms)
+    return elapsed > question.time_limit * 1000 + QUESTION_TIME_GRACE_MS
+
+
+async def question_timeout(
+        deadline: QuestionDeadline,
+        storage: BaseStorage,
+        session_maker: async_sessionmaker,
+        result_writer: Optional[WriteBehindWriter] = None,
+        timers: Optional[TimerWheel] = None
+) -> None:
+    """
+    Срабатывание таймера вопроса (вызывается колесом таймеров)
+
+    Если игрок уже ответил, начал другой квиз или вышел из него, таймер
+    игнорируется - это дешевле, чем отменять его во всех таких местах.
+    """
+    message = deadline.message
+    state = FSMContext(
+        storage=storage,
+        key=StorageKey(bot_id=message.bot.id, chat_id=message.chat.id, user_id=deadline.user.id)
+    )
+    async with question_lock(message.chat.id, deadline.user.id):
+        if await state.get_state() != QuizStates.quiz_in_progress.state:
+            return
         data = await state.get_data()
+        if data.get("attempt_id") != deadline.attempt_id or data.get("current_question") != deadline.position:
+            return
 
-        async with db.begin():
-            user = await get_or_create_user(
-                db,
-                telegram_id=message.from_user.id,
-                username=message.from_user.username,
-                full_name=message.from_user.full_name
-            )
+        db = LazySession(session_maker)
+        try:
+            quiz = await get_session_quiz(db, data)
+            question = quiz.questions[session_question_index(quiz, data)]
+            await skip_timed_out_question(message, state, db, deadline.user, data, question, result_writer, timers)
+        except Exception:
+            await db.finish(commit=False)
+            raise
+        await db.finish(commit=True)
+
+
+async def finish_quiz(
+        message: Message,
+        state: FSMContext,
+        db: AsyncSession,
+        user: User,
+        data: dict,
+        total_questions: int,
+        result_writer: Optional[WriteBehindWriter] = None,
+        feedback: Optional[str] = None
+) -> None:
+    """Завершает квиз и сохраняет результат (с feedback - в том же сообщении)"""
+    try:
+        user_id = await get_or_create_user_id(
+            db,
+            telegram_id=user.id,
+            username=user.username,
+            full_name=user.full_name
+        )
 
+        # Процентиль считаем по предыдущим попыткам - до записи своего результата
+        percentile = await get_score_percentile(db, data["quiz_id"], data["correct_answers"])
+
+        if result_writer:
+            # Запись в БД выполнится пакетом в фоне
+            await result_writer.put({
+                "user_id": user_id,
+                "quiz_id": data["quiz_id"],
+                "score": data["correct_answers"],
+                "total_questions": total_questions,
+                "completed_at": datetime.now(),
+                "idempotency_key": data["attempt_id"]
+            })
+        else:
             await save_quiz_result(
                 db,
-                user_id=user.id,
+                user_id=user_id,
                 quiz_id=data["quiz_id"],
                 score=data["correct_answers"],
-                total_questions=data["total_questions"]
+                total_questions=total_questions,
+                idempotency_key=data["attempt_id"]
             )
 
-            percentage = (data["correct_answers"] / data["total_questions"]) * 100
-            await message.answer(
-                f"🏆 Квиз завершен!\n\n"
-                f"Ваш результат: {data['correct_answers']}/{data['total_questions']}\n"
-                f"Процент правильных ответов: {percentage:.1f}%",
-                reply_markup=get_quiz_result_keyboard()
-            )
+        stats_cache.invalidate(user.id)
 
-            await state.clear()
+        percentage = (data["correct_answers"] / total_questions) * 100
+        text = (
+            f"🏆 Квиз завершен!\n\n"
+            f"Ваш результат: {data['correct_answers']}/{total_questions}\n"
+            f"Процент правильных ответов: {percentage:.1f}%"
+        )
+        if percentile is not None:
+            text += f"\nВы опередили {percentile:.0f}% игроков"
+
+        # Место по лучшему результату - бинарный поиск в рейтинге квиза
+        board = leaderboards.board(data["quiz_id"], "all")
+        best_score = max(data["correct_answers"], board.scores.get(user_id, 0))
+        players = len(board) + (user_id not in board.scores)
+        text += f"\n🏅 Место в рейтинге квиза: {board.rank_for_score(best_score)} из {players}"
+
+        await send_or_edit(
+            message,
+            f"{feedback}\n\n{text}" if feedback else text,
+            reply_markup=get_quiz_result_keyboard(data["quiz_id"]),
+            edit=feedback is not None
+        )
+
+        await state.clear()
 
     except Exception as e:
         logger.error(f"Error finishing quiz: {e}")
@@ -92,43 +341,72 @@ async def finish_quiz(
         await state.clear()
 
 
+@router.callback_query(F.data.startswith("catalog_"))
+async def catalog_page_callback(
+        callback: CallbackQuery,
+        db_read: AsyncSession
+) -> None:
+    """Переход по страницам каталога квизов"""
+    try:
+        _, direction, cursor = callback.data.split("_", 2)
+        cursor = decode_catalog_cursor(cursor)
+
+        if direction == "next":
+            quizzes, has_next = await get_active_quizzes(db_read, after=cursor, limit=QUIZ_PAGE_SIZE)
+            has_prev = True
+        else:
+            quizzes, has_prev = await get_active_quizzes(db_read, before=cursor, limit=QUIZ_PAGE_SIZE)
+            has_next = True
+
+        if not quizzes:
+            await callback.answer("Больше квизов нет")
+            return
+
+        await callback.message.edit_reply_markup(
+            reply_markup=get_quizzes_keyboard(quizzes, has_prev=has_prev, has_next=has_next)
+        )
+        await callback.answer()
+
+    except Exception as e:
+        logger.error(f"Error in catalog page: {e}")
+        await callback.answer("⚠️ Ошибка загрузки списка")
+
+
 @router.callback_query(F.data.startswith("quiz_"))
 async def select_quiz_callback(
         callback: CallbackQuery,
         state: FSMContext,
-        db: AsyncSession
+        db: AsyncSession,
+        question_timers: Optional[TimerWheel] = None
 ) -> None:
     """Обработчик выбора квиза"""
     try:
         quiz_id = int(callback.data.split("_")[1])
 
-        async with db.begin():
-            quiz = await get_quiz_by_id(db, quiz_id)
+        try:
+            quiz = await load_quiz(db, quiz_id)
 
             if not quiz:
                 await callback.answer("⚠️ Квиз не найден!")
                 return
 
-            try:
-                questions = process_quiz(quiz.content)
-                if not questions or len(questions) < 1:
-                    raise ValueError("Квиз не содержит вопросов")
-
-                await state.update_data(
-                    quiz_id=quiz.id,
-                    questions=questions,
-                    current_question=0,
-                    correct_answers=0,
-                    total_questions=len(questions)
-                )
+            if not quiz.questions:
+                raise ValueError("Квиз не содержит вопросов")
 
-                await show_question(callback.message, state, db)
-                await callback.answer()
+            # В FSM только курсор и счет - вопросы читаются из общего кэша
+            data = new_session_data(quiz, shuffle=SHUFFLE_QUESTIONS)
+            await state.set_data(data)
+            await state.set_state(QuizStates.quiz_in_progress)
 
-            except ValueError as e:
-                await callback.message.answer(f"❌ Ошибка: {str(e)}")
-                await callback.answer()
-                await state.clear()
+            await show_question(
+                callback.message, state, db, callback.from_user, data, timers=question_timers
+            )
+            await callback.answer()
+
+        except ValueError as e:
+            await callback.message.answer(f"❌ Ошибка: {str(e)}")
+            await callback.answer()
+            await state.clear()
 
     except Exception as e:
         logger.error(f"Error in select_quiz: {e}")
@@ -140,54 +418,163 @@ async def select_quiz_callback(
 async def answer_callback(
         callback: CallbackQuery,
         state: FSMContext,
-        db: AsyncSession
+        db: AsyncSession,
+        result_writer: Optional[WriteBehindWriter] = None,
+        answer_writer: Optional[WriteBehindWriter] = None,
+        question_timers: Optional[TimerWheel] = None
 ) -> None:
     """Обработчик ответа на вопрос"""
-    try:
-        selected_option = int(callback.data.split("_")[1])
-        data = await state.get_data()
-        current_idx = data["current_question"]
-        questions = data["questions"]
+    # Ответ и таймер вопроса не должны одновременно продвинуть квиз
+    async with question_lock(callback.message.chat.id, callback.from_user.id):
+        try:
+            if await state.get_state() != QuizStates.quiz_in_progress.state:
+                await callback.answer("⏰ Время вышло")  # Таймер успел завершить квиз
+                return
 
-        if current_idx >= len(questions):
-            await callback.answer("Недопустимый вопрос!")
-            return
+            # answer_<вопрос>_<вариант>; в старых клавиатурах номера вопроса нет
+            *shown_idx, selected_option = map(int, callback.data.split("_")[1:])
+            data = await state.get_data()
+            quiz = await get_session_quiz(db, data)
+            current_idx = data["current_question"]
 
-        correct_answer = questions[current_idx]["correct_answer"]
-        is_correct = selected_option == correct_answer
+            if current_idx >= len(quiz.questions):
+                await callback.answer("Недопустимый вопрос!")
+                return
 
-        await state.update_data(
-            current_question=current_idx + 1,
-            correct_answers=data["correct_answers"] + int(is_correct)
-        )
+            question_idx = session_question_index(quiz, data)
+            if shown_idx and shown_idx[0] != question_idx:
+                # Кнопка уже смененного вопроса: квиз продвинул таймер
+                await callback.answer("⏰ Время вышло")
+                return
+            question = quiz.questions[question_idx]
+            answered_at_ms = now_ms()
+
+            if question.time_limit and question_timers is not None:
+                question_timers.cancel((callback.message.chat.id, callback.from_user.id))
+            if is_answer_late(question, data, answered_at_ms):
+                # Поздний ответ не засчитывается; таймер мог не сработать (например, после перезапуска)
+                await skip_timed_out_question(
+                    callback.message, state, db, callback.from_user, data, question, result_writer, question_timers
+                )
+                await callback.answer("⏰ Время вышло")
+                return
 
-        try:
-            await callback.message.edit_text(
-                f"{'✅ Правильно!' if is_correct else '❌ Неправильно!'}\n\n"
-                f"Правильный ответ: {questions[current_idx]['options'][correct_answer]}",
-                reply_markup=None
+            is_correct = selected_option == question.correct_answer
+
+            if answer_writer:
+                # Журнал ответов пишется пакетами в фоне
+                await answer_writer.put({
+                    "attempt_id": data["attempt_id"],
+                    "quiz_id": data["quiz_id"],
+                    "question_index": question_idx,
+                    "option": selected_option,
+                    "is_correct": is_correct,
+                    "latency_ms": max(0, answered_at_ms - data.get("shown_at_ms", answered_at_ms)),
+                    "answered_at": datetime.now()
+                })
+
+            # Следующий вопрос показывается сразу - отмечаем момент его показа
+            data = await state.update_data(
+                current_question=current_idx + 1,
+                correct_answers=data["correct_answers"] + int(is_correct),
+                shown_at_ms=answered_at_ms
             )
-        except TelegramBadRequest:
+
+            feedback = (
+                f"{'✅ Правильно!' if is_correct else '❌ Неправильно!'}\n"
+                f"Правильный ответ: {html.escape(question.options[question.correct_answer])}"
+            )
+            await advance_quiz(
+                callback.message, state, db, callback.from_user, data, feedback, result_writer, question_timers
+            )
+
+            # На callback отвечаем ровно один раз - после обработки
             await callback.answer()
 
-        await show_question(callback.message, state, db)
+        except Exception as e:
+            logger.error(f"Error in answer callback: {e}")
+            await callback.answer("⚠️ Ошибка обработки ответа")
+            await state.clear()
+
+
+@router.callback_query(F.data.startswith("top_"))
+async def leaderboard_callback(
+        callback: CallbackQuery,
+        db: AsyncSession
+) -> None:
+    """Показ рейтинга квиза или общего рейтинга за выбранный период"""
+    try:
+        _, quiz_id, window = callback.data.split("_")
+        quiz_id = int(quiz_id)
+        # "show" - кнопка с экрана результата: рейтинг отправляется новым сообщением
+        is_new = window == "show"
+        if window not in WINDOWS:
+            window = "all"
+
+        text = await render_leaderboard(db, quiz_id, window, callback.from_user)
+        markup = get_leaderboard_keyboard(quiz_id, window)
+
+        if is_new:
+            await callback.message.answer(text, reply_markup=markup)
+        else:
+            try:
+                await callback.message.edit_text(text, reply_markup=markup)
+            except TelegramBadRequest:
+                pass  # Рейтинг не изменился
+        await callback.answer()
+
+    except Exception as e:
+        logger.error(f"Error in leaderboard: {e}")
+        await callback.answer("⚠️ Ошибка загрузки рейтинга")
+
+
+@router.callback_query(F.data.startswith("stats_"))
+async def stats_history_callback(
+        callback: CallbackQuery,
+        db: AsyncSession,
+        db_read: AsyncSession
+) -> None:
+    """Листание истории прохождений на экране «Моя статистика»"""
+    try:
+        if callback.data == "stats_home":
+            text, keyboard = await render_user_stats(db, db_read, callback.from_user)
+        else:
+            cursor = decode_catalog_cursor(callback.data.removeprefix("stats_next_"))
+            user_id = await get_or_create_user_id(
+                db,
+                telegram_id=callback.from_user.id,
+                username=callback.from_user.username,
+                full_name=callback.from_user.full_name
+            )
+            rows, has_next = await get_user_history(
+                db_read, user_id, after=cursor, limit=STATS_HISTORY_PAGE_SIZE
+            )
+            if not rows:
+                await callback.answer("Больше прохождений нет")
+                return
+            text = "🕘 История прохождений:\n" + format_history(rows)
+            keyboard = get_stats_history_keyboard(rows, has_next, is_first=False)
+
+        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.answer()
 
+    except TelegramBadRequest:
+        await callback.answer()  # Сообщение не изменилось
     except Exception as e:
-        logger.error(f"Error in answer callback: {e}")
-        await callback.answer("⚠️ Ошибка обработки ответа")
-        await state.clear()
+        logger.error(f"Error in stats history: {e}")
+        await callback.answer("⚠️ Ошибка загрузки истории")
 
 
 @router.callback_query(F.data == "retry_quiz")
 async def retry_quiz_callback(
         callback: CallbackQuery,
         state: FSMContext,
-        db: AsyncSession
+        db_read: AsyncSession
 ) -> None:
     """Обработчик повторного прохождения квиза"""
     try:
         await callback.message.delete()
-        await cmd_run(callback.message, state, db)
+        await cmd_run(callback.message, state, db_read)
     except Exception as e:
         logger.error(f"Error in retry quiz: {e}")
         await callback.answer("⚠️ Ошибка при запуске квиза")
\ No newline at end of file
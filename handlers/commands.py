@@ -1,18 +1,31 @@
-from aiogram import Router, types
-from aiogram.filters import Command
+import html
+from typing import Optional, Tuple
+
+from aiogram import F, Router, types
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from config import QUIZ_PAGE_SIZE, LEADERBOARD_SIZE, STATS_HISTORY_PAGE_SIZE
 from database.queries import (
-    get_or_create_user,
+    get_or_create_user_id,
     get_active_quizzes,
+    get_quiz_title,
+    get_user_history,
+    get_user_names,
+    get_user_summary,
     create_quiz
 )
 from keyboards.inline import (
     get_quizzes_keyboard,
-    get_main_menu_keyboard
+    get_main_menu_keyboard,
+    get_leaderboard_keyboard,
+    get_stats_history_keyboard
 )
+from services.leaderboard import leaderboards, GLOBAL_BOARD, WINDOWS, WINDOW_TITLES
+from services.quiz_compiler import compile_quiz, COMPILED_FORMAT_VERSION
 from services.quiz_parser import parse_quiz_text
+from services.stats_cache import stats_cache
 from states import QuizStates
 
 router = Router()
@@ -26,15 +39,15 @@ async def cmd_start(
 ):
     await state.clear()
 
-    # Создаем/получаем пользователя и используем его данные
-    user = await get_or_create_user(
+    # Создаем/обновляем пользователя (без запроса к БД, если данные не менялись)
+    await get_or_create_user_id(
         db,
         telegram_id=message.from_user.id,
         username=message.from_user.username,
         full_name=message.from_user.full_name
     )
 
-    greeting_name = user.full_name or user.username or "пользователь"
+    greeting_name = message.from_user.full_name or message.from_user.username or "пользователь"
 
     await message.answer(
         f"Добро пожаловать в QuizBot, {greeting_name}!\n\n"
@@ -62,6 +75,8 @@ async def cmd_create(
         "3. Вариант 3\n"
         "4. Вариант 4\n"
         "Правильный ответ: 1\n\n"
+        "⏱ Ограничение времени (необязательно): «Время на вопрос: 30» - "
+        "для всех вопросов, «Время: 30» после вопроса - для одного вопроса\n\n"
         "Пример: /template",
         parse_mode="Markdown"
     )
@@ -95,11 +110,12 @@ async def cmd_template(message: types.Message):
 async def cmd_run(
         message: types.Message,
         state: FSMContext,
-        db: AsyncSession
+        db_read: AsyncSession
 ):
     await state.clear()
 
-    quizzes = await get_active_quizzes(db)
+    # Каталог читается через пул для чтения
+    quizzes, has_next = await get_active_quizzes(db_read, limit=QUIZ_PAGE_SIZE)
 
     if not quizzes:
         await message.answer("❌ Нет доступных квизов для прохождения.")
@@ -107,10 +123,132 @@ async def cmd_run(
 
     await message.answer(
         "📋 Доступные квизы:",
-        reply_markup=get_quizzes_keyboard(quizzes)
+        reply_markup=get_quizzes_keyboard(quizzes, has_next=has_next)
+    )
+
+
+async def render_leaderboard(
+        db: AsyncSession,
+        quiz_id: int,
+        window: str,
+        user: types.User
+) -> str:
+    """Текст рейтинга: первые места и место пользователя"""
+    board = leaderboards.board(quiz_id, window)
+
+    if quiz_id == GLOBAL_BOARD:
+        title = f"🏆 Общий рейтинг {WINDOW_TITLES[window]}"
+    else:
+        quiz_title = await get_quiz_title(db, quiz_id) or f"#{quiz_id}"
+        title = f"🏅 Рейтинг квиза «{quiz_title}» {WINDOW_TITLES[window]}"
+
+    top = board.top(LEADERBOARD_SIZE)
+    if not top:
+        return f"{title}\n\nПока никто не набрал баллов."
+
+    names = await get_user_names(db, [user_id for user_id, _ in top])
+    lines = [
+        f"{board.rank_for_score(score)}. {html.escape(names.get(user_id, f'Игрок {user_id}'))} - {score}"
+        for user_id, score in top
+    ]
+
+    user_id = await get_or_create_user_id(
+        db,
+        telegram_id=user.id,
+        username=user.username,
+        full_name=user.full_name
+    )
+    rank = board.rank(user_id)
+    if rank is not None:
+        lines.append(f"\nВаше место: {rank} из {len(board)}")
+
+    return f"{title}\n\n" + "\n".join(lines)
+
+
+@router.message(Command("top"))
+async def cmd_top(
+        message: types.Message,
+        command: CommandObject,
+        db: AsyncSession
+):
+    """Общий рейтинг: /top, /top week, /top day"""
+    window = (command.args or "all").strip().lower()
+    if window not in WINDOWS:
+        window = "all"
+
+    await message.answer(
+        await render_leaderboard(db, GLOBAL_BOARD, window, message.from_user),
+        reply_markup=get_leaderboard_keyboard(GLOBAL_BOARD, window)
     )
 
 
+def format_history(rows: list) -> str:
+    """Строки истории прохождений"""
+    return "\n".join(
+        f"{row.completed_at:%d.%m.%Y %H:%M} - {row.title}: {row.score}/{row.total_questions}"
+        for row in rows
+    )
+
+
+async def render_user_stats(
+        db: AsyncSession,
+        db_read: AsyncSession,
+        user: types.User
+) -> Tuple[str, Optional[types.InlineKeyboardMarkup]]:
+    """
+    Экран «Моя статистика»: итоги и первая страница истории
+
+    Результат кэшируется на STATS_CACHE_TTL секунд для пользователя.
+    """
+    cached = stats_cache.get(user.id)
+    if cached is not None:
+        return cached
+
+    user_id = await get_or_create_user_id(
+        db,
+        telegram_id=user.id,
+        username=user.username,
+        full_name=user.full_name
+    )
+    summary = await get_user_summary(db_read, user_id)
+    if not summary.attempts:
+        screen = ("📊 Вы еще не прошли ни одного квиза.\nВыбрать квиз: /run", None)
+        stats_cache.put(user.id, screen)
+        return screen
+
+    rows, has_next = await get_user_history(db_read, user_id, limit=STATS_HISTORY_PAGE_SIZE)
+    accuracy = summary.correct / summary.questions * 100 if summary.questions else 0.0
+    text = (
+        "📊 Моя статистика\n\n"
+        f"Прохождений: {summary.attempts}\n"
+        f"Разных квизов: {summary.quizzes}\n"
+        f"Верных ответов: {summary.correct} из {summary.questions} ({accuracy:.1f}%)"
+    )
+    if summary.last_played is not None:
+        text += f"\nПоследняя игра: {summary.last_played:%d.%m.%Y %H:%M}"
+    elif summary.last_played_day is not None:
+        # Все попытки уже свернуты - известен только день
+        text += f"\nПоследняя игра: {summary.last_played_day:%d.%m.%Y}"
+    if rows:
+        text += "\n\n🕘 Последние прохождения:\n" + format_history(rows)
+
+    screen = (text, get_stats_history_keyboard(rows, has_next, is_first=True))
+    stats_cache.put(user.id, screen)
+    return screen
+
+
+@router.message(Command("stats"))
+@router.message(F.text == "📊 Моя статистика")
+async def cmd_stats(
+        message: types.Message,
+        db: AsyncSession,
+        db_read: AsyncSession
+):
+    """Личная статистика: итоги и история прохождений"""
+    text, keyboard = await render_user_stats(db, db_read, message.from_user)
+    await message.answer(text, reply_markup=keyboard)
+
+
 @router.message(QuizStates.waiting_for_quiz)
 async def process_quiz_text(
         message: types.Message,
@@ -118,14 +256,22 @@ async def process_quiz_text(
         state: FSMContext
 ):
     try:
-        quiz_data = parse_quiz_text(message.text)
+        parsed = parse_quiz_text(message.text)
 
+        creator_id = await get_or_create_user_id(
+            db,
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            full_name=message.from_user.full_name
+        )
         await create_quiz(
             db,
-            title=quiz_data['title'],
-            description=quiz_data['description'],
+            title=parsed.title,
+            description=parsed.description,
             content=message.text,
-            creator_id=message.from_user.id
+            creator_id=creator_id,
+            compiled=compile_quiz(parsed),
+            format_version=COMPILED_FORMAT_VERSION
         )
 
         await message.answer(
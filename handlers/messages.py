@@ -1,13 +1,28 @@
 from aiogram import Router, F
-from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+from aiogram.types import BufferedInputFile, Message
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import html
 import logging
-from sqlalchemy import delete
-from config import ADMIN_IDS
-from database.queries import create_quiz
+import tempfile
+from datetime import datetime, timedelta
+from typing import List
+from config import ADMIN_IDS, IMPORT_MAX_FILE_MB
+from database.answers import load_answer_events
+from database.broadcasts import get_recent_broadcasts
+from database.queries import bulk_create_quizzes, create_quiz, get_or_create_user_id, get_quiz_by_id
+from database.leaderboard import rebuild_leaderboards
+from database.stats import rebuild_quiz_stats
+from handlers.callbacks import load_quiz
+from services.cleanup import CleanupFilter
+from services.item_analysis import analyze_responses, format_analysis
+from services.quiz_cache import quiz_cache
+from services.quiz_compiler import compile_quiz, COMPILED_FORMAT_VERSION
+from services.quiz_import import quiz_importer
 from services.quiz_parser import parse_quiz_text, QuizValidationError
-from states import QuizStates
+from states import AdminStates, QuizStates
 from keyboards.inline import get_main_menu_keyboard
 from keyboards.reply import get_cancel_keyboard
 
@@ -26,25 +41,32 @@ async def process_quiz_text(
     """
     try:
         # Парсинг с валидацией
-        quiz_data = parse_quiz_text(message.text)
+        parsed = parse_quiz_text(message.text)
 
-        # Транзакция для создания квиза
-        async with db.begin():
-            quiz = await create_quiz(
-                db,
-                title=quiz_data['title'],
-                description=quiz_data['description'],
-                content=message.text,  # Сохраняем оригинальный текст
-                creator_id=message.from_user.id
-            )
+        # Транзакция фиксируется middleware после обработки апдейта
+        creator_id = await get_or_create_user_id(
+            db,
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            full_name=message.from_user.full_name
+        )
+        quiz = await create_quiz(
+            db,
+            title=parsed.title,
+            description=parsed.description,
+            content=message.text,  # Сохраняем оригинальный текст
+            creator_id=creator_id,
+            compiled=compile_quiz(parsed),  # И готовую форму для запуска
+            format_version=COMPILED_FORMAT_VERSION
+        )
 
-            await message.answer(
-                f"✅ Квиз <b>{quiz.title}</b> успешно создан!\n"
-                f"Вопросов: {len(quiz_data['questions'])}",
-                reply_markup=get_main_menu_keyboard(),
-                parse_mode="HTML"
-            )
-            await state.clear()
+        await message.answer(
+            f"✅ Квиз <b>{quiz.title}</b> успешно создан!\n"
+            f"Вопросов: {len(parsed.questions)}",
+            reply_markup=get_main_menu_keyboard(),
+            parse_mode="HTML"
+        )
+        await state.clear()
 
     except QuizValidationError as e:
         logger.warning(f"Validation error: {e}")
@@ -89,27 +111,384 @@ async def cancel_operation(
         )
 
 
-@router.message(F.text == "/cleanup")
+@router.message(Command("cleanup"))
 async def cleanup_database(
         message: Message,
-        db: AsyncSession
+        command: CommandObject,
+        cleanup_runner=None
 ) -> None:
     """
-    Админская команда для очистки тестовых данных
+    Админская команда для очистки тестовых данных в фоне
+    Использование: /cleanup [days=N] [creator=<telegram_id>] [quiz=<id>] | /cleanup stop
     """
     try:
         # Проверка прав администратора
         if message.from_user.id not in ADMIN_IDS:
             await message.answer("⛔ Доступ запрещен")
             return
+        if cleanup_runner is None:
+            await message.answer("Фоновая очистка не включена")
+            return
+
+        args = (command.args or "").split()
+        if args == ["stop"]:
+            if await cleanup_runner.stop():
+                await message.answer("⏹ Очистка прерывается")
+            else:
+                await message.answer("Очистка не выполняется")
+            return
+
+        try:
+            cleanup_filter = _parse_cleanup_filter(args)
+        except ValueError:
+            await message.answer(
+                "Использование: /cleanup [days=N] [creator=<telegram_id>] [quiz=<id>]\n"
+                "Без параметров удаляются все квизы. Остановить: /cleanup stop"
+            )
+            return
+
+        if cleanup_runner.running:
+            await message.answer("⏳ Очистка уже выполняется")
+            return
 
-        async with db.begin():
-            # Пример очистки - адаптируйте под свои модели
-            from database.models import Quiz, QuizResult
-            await db.execute(delete(QuizResult))
-            await db.execute(delete(Quiz))
-            await message.answer("🗑️ База данных очищена")
+        progress = await message.answer(f"🧹 Очистка ({cleanup_filter.describe()}): запущена")
+        cleanup_runner.start(message.bot, message.chat.id, progress.message_id, cleanup_filter)
 
     except Exception as e:
         logger.error(f"Cleanup error: {e}")
-        await message.answer("⚠️ Ошибка при очистке БД")
\ No newline at end of file
+        await message.answer("⚠️ Ошибка при очистке БД")
+
+
+def _parse_cleanup_filter(args: List[str]) -> CleanupFilter:
+    """Фильтры /cleanup вида key=value; ValueError - неверные параметры"""
+    values = {}
+    for arg in args:
+        key, sep, value = arg.partition("=")
+        if not sep or key not in ("days", "creator", "quiz") or key in values:
+            raise ValueError(arg)
+        values[key] = int(value)
+
+    created_before = None
+    if "days" in values:
+        created_before = datetime.now() - timedelta(days=values["days"])
+    return CleanupFilter(
+        created_before=created_before,
+        creator_telegram_id=values.get("creator"),
+        quiz_id=values.get("quiz")
+    )
+
+
+@router.message(F.text == "/rebuild_stats")
+async def rebuild_stats(
+        message: Message,
+        db: AsyncSession
+) -> None:
+    """
+    Админская команда: пересчет агрегатов и рейтингов из сырых результатов
+    """
+    try:
+        if message.from_user.id not in ADMIN_IDS:
+            await message.answer("⛔ Доступ запрещен")
+            return
+
+        await rebuild_quiz_stats(db)
+        await rebuild_leaderboards(db)
+        await message.answer("📊 Статистика и рейтинги квизов пересчитаны")
+
+    except Exception as e:
+        logger.error(f"Rebuild stats error: {e}")
+        await message.answer("⚠️ Ошибка при пересчете статистики")
+
+
+@router.message(F.text == "/cache")
+async def cache_stats(message: Message) -> None:
+    """
+    Админская команда: статистика кэша разобранных квизов
+    """
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Доступ запрещен")
+        return
+
+    stats = quiz_cache.stats()
+    await message.answer(
+        "🗄 Кэш квизов:\n"
+        f"Записей: {stats['entries']}\n"
+        f"Память: {stats['used_bytes'] // 1024} / {stats['max_bytes'] // 1024} КБ\n"
+        f"Попадания: {stats['hits']}, промахи: {stats['misses']} "
+        f"({stats['hit_rate'] * 100:.1f}%)\n"
+        f"Вытеснено: {stats['evictions']}"
+    )
+
+
+@router.message(F.text == "/outbound")
+async def outbound_stats(message: Message, send_scheduler=None) -> None:
+    """
+    Админская команда: очереди и счетчики планировщика исходящих запросов
+    """
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Доступ запрещен")
+        return
+    if send_scheduler is None:
+        await message.answer("Планировщик отправки не включен")
+        return
+
+    stats = send_scheduler.stats()
+    depth = stats["queue_depth"]
+    await message.answer(
+        "📤 Исходящие запросы:\n"
+        f"В очереди: callback {depth['callback']}, ответы {depth['interactive']}, "
+        f"рассылки {depth['bulk']}\n"
+        f"Чатов с ожидающими запросами: {stats['chats_busy']}\n"
+        f"Отправлено: {stats['sent']}, ответов 429: {stats['retry_after_hits']}, "
+        f"отказов после повторов: {stats['gave_up']}\n"
+        f"Макс. ожидание общего лимита: {stats['max_global_wait_ms']:.0f} мс"
+    )
+
+
+@router.message(F.text == "/import")
+async def cmd_import(
+        message: Message,
+        state: FSMContext
+) -> None:
+    """
+    Админская команда: массовый импорт квизов из документа
+    """
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Доступ запрещен")
+        return
+
+    await state.set_state(AdminStates.waiting_for_import)
+    await message.answer(
+        "📥 Отправьте документ .txt или .zip с файлами .txt.\n"
+        "Каждый квиз начинается со строки «Название: ...», формат - как в /template.",
+        reply_markup=get_cancel_keyboard()
+    )
+
+
+@router.message(AdminStates.waiting_for_import, F.document)
+async def process_import_document(
+        message: Message,
+        state: FSMContext,
+        db: AsyncSession
+) -> None:
+    """
+    Импорт документа: разбор в пуле процессов, вставка валидных квизов
+    одной транзакцией и отчет об ошибках по каждому квизу
+    """
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Доступ запрещен")
+        return
+
+    document = message.document
+    filename = document.file_name or "quizzes.txt"
+    if not filename.lower().endswith((".txt", ".zip")):
+        await message.answer("❌ Поддерживаются только файлы .txt и .zip")
+        return
+    if document.file_size and document.file_size > IMPORT_MAX_FILE_MB * 1024 * 1024:
+        await message.answer(f"❌ Файл больше {IMPORT_MAX_FILE_MB} МБ")
+        return
+
+    await message.answer("⏳ Импортирую квизы...")
+    try:
+        # Небольшие файлы остаются в памяти, большие сбрасываются на диск
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as file:
+            await message.bot.download(document, destination=file)
+            imported, failures = await quiz_importer.parse_document(file, filename)
+
+        if imported:
+            creator_id = await get_or_create_user_id(
+                db,
+                telegram_id=message.from_user.id,
+                username=message.from_user.username,
+                full_name=message.from_user.full_name
+            )
+            await bulk_create_quizzes(db, creator_id, imported)
+
+    except ValueError as e:
+        # Импорт атомарный - частично вставленные квизы не фиксируем
+        await db.rollback()
+        await message.answer(f"⚠️ {e}")
+        return
+
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Import error: {e}", exc_info=True)
+        await message.answer("⚠️ Ошибка при импорте квизов")
+        return
+
+    await state.clear()
+    await message.answer(
+        f"✅ Импортировано квизов: {len(imported)}\n"
+        f"❌ С ошибками: {len(failures)}",
+        reply_markup=get_main_menu_keyboard()
+    )
+
+    if failures:
+        lines = [
+            f"{failure.source}:{failure.line}: {failure.title or '(без названия)'} - {failure.error}"
+            for failure in failures
+        ]
+        # Подпись к документу ограничена 1024 символами
+        preview = "\n".join(html.escape(line[:150]) for line in lines[:5])
+        await message.answer_document(
+            BufferedInputFile("\n".join(lines).encode("utf-8"), filename="import_errors.txt"),
+            caption=f"Первые ошибки:\n{preview}"
+        )
+
+
+@router.message(Command("analyze"))
+async def analyze_quiz_questions(
+        message: Message,
+        command: CommandObject,
+        db: AsyncSession,
+        db_read: AsyncSession
+) -> None:
+    """
+    Анализ качества вопросов квиза по журналу ответов (автору и админам)
+    Использование: /analyze <id квиза>
+    """
+    try:
+        if not command.args or not command.args.strip().isdigit():
+            await message.answer("Использование: /analyze <id квиза>")
+            return
+
+        quiz_id = int(command.args.strip())
+        quiz = await get_quiz_by_id(db_read, quiz_id)
+        if not quiz:
+            await message.answer("⚠️ Квиз не найден")
+            return
+        if message.from_user.id not in ADMIN_IDS and quiz.creator.telegram_id != message.from_user.id:
+            await message.answer("⛔ Анализ доступен только автору квиза")
+            return
+
+        cached = await load_quiz(db, quiz_id)
+        columns = await load_answer_events(db_read, quiz_id)
+        # Векторный расчет выполняется в потоке - цикл событий не блокируется
+        report = await asyncio.to_thread(analyze_responses, *columns, cached.questions)
+        await message.answer(format_analysis(cached.title, report, cached.questions))
+
+    except Exception as e:
+        logger.error(f"Analyze error: {e}")
+        await message.answer("⚠️ Ошибка при анализе вопросов")
+
+
+@router.message(F.text == "/broadcast")
+async def cmd_broadcast(
+        message: Message,
+        state: FSMContext
+) -> None:
+    """
+    Админская команда: рассылка сообщения всем пользователям
+    """
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Доступ запрещен")
+        return
+
+    await state.set_state(AdminStates.broadcast_message)
+    await message.answer(
+        "📣 Отправьте текст рассылки (форматирование сохранится).\n"
+        "Пользователи, заблокировавшие бота, будут пропущены.",
+        reply_markup=get_cancel_keyboard()
+    )
+
+
+@router.message(F.text == "/broadcasts")
+async def broadcasts_status(
+        message: Message,
+        db_read: AsyncSession,
+        broadcaster=None
+) -> None:
+    """
+    Админская команда: прогресс последних рассылок
+    """
+    try:
+        if message.from_user.id not in ADMIN_IDS:
+            await message.answer("⛔ Доступ запрещен")
+            return
+
+        broadcasts = await get_recent_broadcasts(db_read)
+        if not broadcasts:
+            await message.answer("Рассылок еще не было")
+            return
+
+        active = set(broadcaster.active) if broadcaster else set()
+        lines = ["📣 Последние рассылки:"]
+        for broadcast in broadcasts:
+            status = broadcast.status
+            if status == "running" and broadcast.id not in active:
+                status = "running, ожидает перезапуска"
+            lines.append(
+                f"#{broadcast.id} {broadcast.created_at:%d.%m %H:%M} - {status}: "
+                f"доставлено {broadcast.sent}, ошибок {broadcast.failed}, "
+                f"заблокировали {broadcast.blocked}"
+            )
+        lines.append("\nОстановить: /broadcast_stop <id>")
+        await message.answer("\n".join(lines))
+
+    except Exception as e:
+        logger.error(f"Broadcasts status error: {e}")
+        await message.answer("⚠️ Ошибка при получении рассылок")
+
+
+@router.message(Command("broadcast_stop"))
+async def stop_broadcast(
+        message: Message,
+        command: CommandObject,
+        broadcaster=None
+) -> None:
+    """
+    Админская команда: остановка рассылки
+    Использование: /broadcast_stop <id рассылки>
+    """
+    try:
+        if message.from_user.id not in ADMIN_IDS:
+            await message.answer("⛔ Доступ запрещен")
+            return
+        if broadcaster is None:
+            await message.answer("Рассылки не включены")
+            return
+        if not command.args or not command.args.strip().isdigit():
+            await message.answer("Использование: /broadcast_stop <id рассылки>")
+            return
+
+        broadcast_id = int(command.args.strip())
+        if await broadcaster.cancel(broadcast_id):
+            await message.answer(f"⏹ Рассылка #{broadcast_id} остановлена")
+        else:
+            await message.answer("⚠️ Рассылка не найдена или уже завершена")
+
+    except Exception as e:
+        logger.error(f"Broadcast stop error: {e}")
+        await message.answer("⚠️ Ошибка при остановке рассылки")
+
+
+@router.message(AdminStates.broadcast_message, F.text, ~F.text.startswith("/"))
+async def process_broadcast_message(
+        message: Message,
+        state: FSMContext,
+        broadcaster=None
+) -> None:
+    """
+    Запуск рассылки: сообщение сохраняется в БД и отправляется в фоне
+    """
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Доступ запрещен")
+        return
+    if broadcaster is None:
+        await message.answer("Рассылки не включены")
+        await state.clear()
+        return
+
+    try:
+        broadcast_id = await broadcaster.create(message.bot, message.html_text, message.from_user.id)
+    except Exception as e:
+        logger.error(f"Broadcast start error: {e}", exc_info=True)
+        await message.answer("⚠️ Ошибка при запуске рассылки")
+        return
+
+    await state.clear()
+    await message.answer(
+        f"🚀 Рассылка #{broadcast_id} запущена.\n"
+        f"Прогресс: /broadcasts, остановить: /broadcast_stop {broadcast_id}",
+        reply_markup=get_main_menu_keyboard()
+    )
@@ -1,19 +1,47 @@
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from config import QUESTION_KEYBOARD_CACHE_SIZE
+
+# Неизменяемые клавиатуры строятся один раз при импорте и разделяются
+# между всеми сообщениями - вызывающий код не должен их изменять.
+
+_MAIN_MENU_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[[
+    InlineKeyboardButton(text="📝 Создать квиз", callback_data="create_quiz"),
+    InlineKeyboardButton(text="🎮 Пройти квиз", callback_data="run_quiz")
+]])
+
 
 def get_main_menu_keyboard() -> InlineKeyboardMarkup:
     """Главное меню с основными действиями"""
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(text="📝 Создать квиз", callback_data="create_quiz"),
-        InlineKeyboardButton(text="🎮 Пройти квиз", callback_data="run_quiz")
-    )
-    return builder.as_markup()
+    return _MAIN_MENU_KEYBOARD
+
 
+CATALOG_CURSOR_FORMAT = "%Y%m%d%H%M%S%f"
 
-def get_quizzes_keyboard(quizzes: list) -> InlineKeyboardMarkup:
-    """Клавиатура со списком доступных квизов"""
+
+def encode_catalog_cursor(created_at: datetime, quiz_id: int) -> str:
+    """Курсор каталога для callback_data (укладывается в лимит 64 байта)"""
+    return f"{created_at.strftime(CATALOG_CURSOR_FORMAT)}_{quiz_id}"
+
+
+def decode_catalog_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Обратное преобразование курсора каталога"""
+    created_at, quiz_id = cursor.split("_")
+    return datetime.strptime(created_at, CATALOG_CURSOR_FORMAT), int(quiz_id)
+
+
+def get_quizzes_keyboard(
+        quizzes: list,
+        has_prev: bool = False,
+        has_next: bool = False
+) -> InlineKeyboardMarkup:
+    """Клавиатура со страницей доступных квизов и навигацией"""
     builder = InlineKeyboardBuilder()
 
     for quiz in quizzes:
@@ -24,6 +52,26 @@ def get_quizzes_keyboard(quizzes: list) -> InlineKeyboardMarkup:
             )
         )
 
+    navigation = []
+    if has_prev and quizzes:
+        first = quizzes[0]
+        navigation.append(
+            InlineKeyboardButton(
+                text="⬅️ Назад",
+                callback_data=f"catalog_prev_{encode_catalog_cursor(first.created_at, first.id)}"
+            )
+        )
+    if has_next and quizzes:
+        last = quizzes[-1]
+        navigation.append(
+            InlineKeyboardButton(
+                text="Вперед ➡️",
+                callback_data=f"catalog_next_{encode_catalog_cursor(last.created_at, last.id)}"
+            )
+        )
+    if navigation:
+        builder.row(*navigation)
+
     builder.row(
         InlineKeyboardButton(
             text="🔙 Назад",
@@ -33,72 +81,125 @@ def get_quizzes_keyboard(quizzes: list) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_question_keyboard(options: list[str]) -> InlineKeyboardMarkup:
-    """Клавиатура с вариантами ответа на вопрос"""
-    builder = InlineKeyboardBuilder()
-
-    for index, option in enumerate(options):
-        builder.row(
-            InlineKeyboardButton(
-                text=f"{index + 1}. {option}",
-                callback_data=f"answer_{index}"
+def get_question_keyboard(options: Sequence[str], question_index: int) -> InlineKeyboardMarkup:
+    """
+    Клавиатура с вариантами ответа на вопрос
+
+    Номер вопроса в callback_data позволяет отбросить нажатие на кнопку
+    вопроса, который уже сменился (например, по истечении времени).
+    """
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"{index + 1}. {option}", callback_data=f"answer_{question_index}_{index}")]
+        for index, option in enumerate(options)
+    ])
+
+
+class QuestionKeyboardCache:
+    """
+    Готовые клавиатуры вопросов по квизам, общие для всех игроков
+
+    Ключ - (id квиза, версия формата), значение - клавиатуры всех вопросов
+    квиза. Запись привязана к кортежу вопросов из кэша квизов: если квиз
+    перезагружен (например, id переиспользован после удаления), клавиатуры
+    строятся заново. Размер ограничен max_quizzes квизами (LRU).
+    """
+
+    def __init__(self, max_quizzes: int):
+        self.max_quizzes = max_quizzes
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[tuple, Tuple[InlineKeyboardMarkup, ...]]]" = OrderedDict()
+
+    def get(self, quiz, index: int) -> InlineKeyboardMarkup:
+        """Клавиатура вопроса index квиза (services.quiz_cache.CachedQuiz)"""
+        key = (quiz.id, quiz.version)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] is not quiz.questions:
+            markups = tuple(
+                get_question_keyboard(question.options, question_index)
+                for question_index, question in enumerate(quiz.questions)
             )
-        )
+            entry = self._entries[key] = (quiz.questions, markups)
+            if len(self._entries) > self.max_quizzes:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(key)
+        return entry[1][index]
 
-    return builder.as_markup()
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+question_keyboards = QuestionKeyboardCache(QUESTION_KEYBOARD_CACHE_SIZE)
+
+
+def get_quiz_question_keyboard(quiz, index: int) -> InlineKeyboardMarkup:
+    """Клавиатура вопроса из общего кэша клавиатур"""
+    return question_keyboards.get(quiz, index)
+
+
+_RESULT_ROW = [
+    InlineKeyboardButton(text="🔄 Пройти еще раз", callback_data="retry_quiz"),
+    InlineKeyboardButton(text="📋 К списку квизов", callback_data="run_quiz")
+]
+_MAIN_MENU_ROW = [InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
+_QUIZ_RESULT_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[_RESULT_ROW, _MAIN_MENU_ROW])
 
 
-def get_quiz_result_keyboard() -> InlineKeyboardMarkup:
+@lru_cache(maxsize=1024)
+def get_quiz_result_keyboard(quiz_id: Optional[int] = None) -> InlineKeyboardMarkup:
     """Клавиатура после завершения квиза"""
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(
-            text="🔄 Пройти еще раз",
-            callback_data="retry_quiz"
-        ),
+    if quiz_id is None:
+        return _QUIZ_RESULT_KEYBOARD
+    return InlineKeyboardMarkup(inline_keyboard=[
+        _RESULT_ROW,
+        [InlineKeyboardButton(text="🏅 Рейтинг квиза", callback_data=f"top_{quiz_id}_show")],
+        _MAIN_MENU_ROW
+    ])
+
+
+@lru_cache(maxsize=1024)
+def get_leaderboard_keyboard(quiz_id: int, window: str) -> InlineKeyboardMarkup:
+    """Переключение периода рейтинга (quiz_id 0 - общий рейтинг)"""
+    return InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(
-            text="📋 К списку квизов",
-            callback_data="run_quiz"
+            text=f"{'• ' if key == window else ''}{title}",
+            callback_data=f"top_{quiz_id}_{key}"
         )
-    )
-    builder.row(
-        InlineKeyboardButton(
-            text="🏠 В главное меню",
-            callback_data="main_menu"
-        )
-    )
-    return builder.as_markup()
+        for key, title in (("all", "Все время"), ("week", "Неделя"), ("day", "День"))
+    ]])
+
+
+def get_stats_history_keyboard(rows: list, has_next: bool, is_first: bool) -> Optional[InlineKeyboardMarkup]:
+    """Навигация по истории прохождений (None - кнопки не нужны)"""
+    buttons = []
+    if not is_first:
+        buttons.append(InlineKeyboardButton(text="🔝 В начало", callback_data="stats_home"))
+    if has_next and rows:
+        last = rows[-1]
+        buttons.append(InlineKeyboardButton(
+            text="Ранее ➡️",
+            callback_data=f"stats_next_{encode_catalog_cursor(last.completed_at, last.id)}"
+        ))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+
+_CANCEL_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[[
+    InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_action")
+]])
 
 
 def get_cancel_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для отмены действия"""
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(
-            text="❌ Отменить",
-            callback_data="cancel_action"
-        )
-    )
-    return builder.as_markup()
+    return _CANCEL_KEYBOARD
+
+
+_CONFIRMATION_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_quiz"),
+        InlineKeyboardButton(text="✏️ Редактировать", callback_data="edit_quiz")
+    ],
+    [InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_quiz")]
+])
 
 
 def get_confirmation_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура подтверждения создания квиза"""
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(
-            text="✅ Подтвердить",
-            callback_data="confirm_quiz"
-        ),
-        InlineKeyboardButton(
-            text="✏️ Редактировать",
-            callback_data="edit_quiz"
-        )
-    )
-    builder.row(
-        InlineKeyboardButton(
-            text="❌ Отменить",
-            callback_data="cancel_quiz"
-        )
-    )
-    return builder.as_markup()
+    return _CONFIRMATION_KEYBOARD
@@ -0,0 +1,113 @@
+"""Скомпилированные квизы, идемпотентные результаты, агрегаты, рейтинги, FSM и индексы
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # В базах, созданных до миграций (alembic stamp 0001), telegram_id - INTEGER,
+    # а ID пользователей Telegram уже больше 2^31
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.alter_column(
+            "telegram_id",
+            existing_type=sa.Integer(),
+            type_=sa.BigInteger(),
+            existing_nullable=False
+        )
+
+    with op.batch_alter_table("quizzes") as batch_op:
+        batch_op.add_column(sa.Column("compiled", sa.Text(), nullable=True))
+        batch_op.add_column(
+            sa.Column("format_version", sa.Integer(), nullable=False, server_default="0")
+        )
+
+    with op.batch_alter_table("quiz_results") as batch_op:
+        batch_op.add_column(sa.Column("idempotency_key", sa.String(length=64), nullable=True))
+
+    # План индексов - под конкретные запросы горячего пути:
+    # каталог активных квизов (keyset по created_at, id), история пользователя,
+    # пересчет агрегатов по квизу, дедупликация результатов, загрузка рейтингов
+    op.create_index(
+        "ix_quizzes_active_catalog",
+        "quizzes",
+        ["created_at", "id"],
+        sqlite_where=sa.text("is_active = 1"),
+        postgresql_where=sa.text("is_active = true")
+    )
+    op.create_index(
+        "ix_quiz_results_idempotency_key", "quiz_results", ["idempotency_key"], unique=True
+    )
+    op.create_index(
+        "ix_quiz_results_user_completed",
+        "quiz_results",
+        ["user_id", sa.text("completed_at DESC")]
+    )
+    op.create_index("ix_quiz_results_quiz_id", "quiz_results", ["quiz_id"])
+
+    op.create_table(
+        "quiz_stats",
+        sa.Column("quiz_id", sa.Integer(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("score_sum", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["quiz_id"], ["quizzes.id"]),
+        sa.PrimaryKeyConstraint("quiz_id")
+    )
+    op.create_table(
+        "quiz_score_buckets",
+        sa.Column("quiz_id", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Integer(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["quiz_id"], ["quizzes.id"]),
+        sa.PrimaryKeyConstraint("quiz_id", "score")
+    )
+    op.create_table(
+        "leaderboard_entries",
+        sa.Column("quiz_id", sa.Integer(), nullable=False),
+        sa.Column("period", sa.String(length=16), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("quiz_id", "period", "user_id")
+    )
+    op.create_index("ix_leaderboard_entries_period", "leaderboard_entries", ["period"])
+
+    op.create_table(
+        "fsm_storage",
+        sa.Column("key", sa.String(length=255), nullable=False),
+        sa.Column("state", sa.String(length=255), nullable=True),
+        sa.Column("data", sa.Text(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("key")
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("fsm_storage")
+    op.drop_index("ix_leaderboard_entries_period", table_name="leaderboard_entries")
+    op.drop_table("leaderboard_entries")
+    op.drop_table("quiz_score_buckets")
+    op.drop_table("quiz_stats")
+
+    op.drop_index("ix_quiz_results_quiz_id", table_name="quiz_results")
+    op.drop_index("ix_quiz_results_user_completed", table_name="quiz_results")
+    op.drop_index("ix_quiz_results_idempotency_key", table_name="quiz_results")
+    op.drop_index("ix_quizzes_active_catalog", table_name="quizzes")
+
+    with op.batch_alter_table("quiz_results") as batch_op:
+        batch_op.drop_column("idempotency_key")
+
+    with op.batch_alter_table("quizzes") as batch_op:
+        batch_op.drop_column("format_version")
+        batch_op.drop_column("compiled")
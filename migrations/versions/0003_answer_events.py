@@ -0,0 +1,45 @@
+"""Журнал ответов на вопросы
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "answer_events",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("attempt_id", sa.String(length=32), nullable=False),
+        sa.Column("quiz_id", sa.Integer(), nullable=False),
+        sa.Column("question_index", sa.Integer(), nullable=False),
+        sa.Column("option", sa.Integer(), nullable=False),
+        sa.Column("is_correct", sa.Boolean(), nullable=False),
+        sa.Column("latency_ms", sa.Integer(), nullable=False),
+        sa.Column("answered_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["quiz_id"], ["quizzes.id"]),
+        sa.PrimaryKeyConstraint("id")
+    )
+    op.create_index(
+        "ux_answer_events_attempt_question",
+        "answer_events",
+        ["attempt_id", "question_index"],
+        unique=True
+    )
+    op.create_index("ix_answer_events_quiz_id", "answer_events", ["quiz_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_answer_events_quiz_id", table_name="answer_events")
+    op.drop_index("ux_answer_events_attempt_question", table_name="answer_events")
+    op.drop_table("answer_events")
@@ -0,0 +1,52 @@
+"""Дневные свертки старых результатов
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_quiz_results_completed_at", "quiz_results", ["completed_at"])
+
+    op.create_table(
+        "quiz_daily_scores",
+        sa.Column("quiz_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("score", sa.Integer(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["quiz_id"], ["quizzes.id"]),
+        sa.PrimaryKeyConstraint("quiz_id", "day", "score")
+    )
+
+    op.create_table(
+        "user_daily_results",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("quiz_id", sa.Integer(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("score_sum", sa.Integer(), nullable=False),
+        sa.Column("best_score", sa.Integer(), nullable=False),
+        sa.Column("total_questions_sum", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["quiz_id"], ["quizzes.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id", "day", "quiz_id")
+    )
+    op.create_index("ix_user_daily_results_quiz_id", "user_daily_results", ["quiz_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_daily_results_quiz_id", table_name="user_daily_results")
+    op.drop_table("user_daily_results")
+    op.drop_table("quiz_daily_scores")
+    op.drop_index("ix_quiz_results_completed_at", table_name="quiz_results")
@@ -1,4 +1,12 @@
-from .quiz_parser import parse_quiz_text, QuizValidationError
-from .quiz_processor import process_quiz
+from .quiz_parser import parse_quiz_text, ParsedQuiz, QuizQuestion, QuizValidationError
+from .quiz_compiler import compile_quiz, load_compiled_quiz, COMPILED_FORMAT_VERSION
 
-__all__ = ['parse_quiz_text', 'process_quiz', 'QuizValidationError']
+__all__ = [
+    'parse_quiz_text',
+    'ParsedQuiz',
+    'QuizQuestion',
+    'QuizValidationError',
+    'compile_quiz',
+    'load_compiled_quiz',
+    'COMPILED_FORMAT_VERSION'
+]
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+FlushFunction = Callable[[AsyncSession, List[dict]], Awaitable[object]]
+
+
+class WriteBehindWriter:
+    """
+    Отложенная пакетная запись строк в БД
+
+    Строки копятся в памяти и сбрасываются одной транзакцией каждые
+    flush_interval секунд или при накоплении max_batch строк. Запись
+    выполняет flush_fn - она должна быть идемпотентной (ON CONFLICT DO NOTHING
+    по ключу идемпотентности), тогда повтор после сбоя не задвоит данные.
+
+    Пакет, не записанный max_attempts раз подряд, пишется построчно: строки с
+    ошибкой данных (нарушение ключа, например квиз уже удален) логируются и
+    отбрасываются, чтобы не блокировать очередь. Очередь ограничена
+    max_buffer строками - сверх этого put пишет строку сам, не откладывая.
+    """
+
+    def __init__(
+            self,
+            session_maker: async_sessionmaker,
+            flush_fn: FlushFunction,
+            flush_interval: float = 0.2,
+            max_batch: int = 500,
+            name: str = "writer",
+            max_attempts: int = 3,
+            max_buffer: int = 50000
+    ):
+        self.session_maker = session_maker
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.name = name
+        self.max_attempts = max_attempts
+        self.max_buffer = max_buffer
+
+        self._buffer: List[dict] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._attempts = 0  # Неудачных попыток подряд для пакета в начале очереди
+
+        self.written = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.direct_writes = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    async def put(self, row: dict) -> None:
+        """
+        Ставит строку в очередь на запись
+
+        Если очередь заполнена (БД не успевает или недоступна), строка
+        записывается сразу; ошибка записи передается вызывающему коду.
+        """
+        if len(self._buffer) >= self.max_buffer:
+            self.direct_writes += 1
+            await self._write([row])
+            self.written += 1
+            return
+
+        self._buffer.append(row)
+        if len(self._buffer) >= self.max_batch:
+            self._wakeup.set()
+
+    async def start(self, *args, **kwargs) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self, *args, **kwargs) -> None:
+        """Останавливает фоновую задачу и полностью сбрасывает очередь"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        while self._buffer:
+            if not await self.flush():
+                logger.error(f"{self.name}: {len(self._buffer)} rows lost on shutdown")
+                break
+
+    async def flush(self) -> bool:
+        """Записывает накопленные строки пакетами по max_batch"""
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._buffer[:self.max_batch]
+                del self._buffer[:self.max_batch]
+                try:
+                    await self._write(batch)
+                    self.written += len(batch)
+                    self._attempts = 0
+
+                except Exception as e:
+                    self.failed_flushes += 1
+                    self._attempts += 1
+                    logger.error(f"{self.name}: flush of {len(batch)} rows failed: {e}")
+                    if self._attempts < self.max_attempts:
+                        # Возвращаем пакет в начало очереди - повторим при следующем сбросе
+                        self._buffer[:0] = batch
+                        return False
+
+                    self._attempts = 0
+                    if not await self._write_rows(batch):
+                        return False
+
+                except BaseException:
+                    self._buffer[:0] = batch
+                    raise
+
+            return True
+
+    async def _write(self, rows: List[dict]) -> None:
+        async with self.session_maker() as session:
+            async with session.begin():
+                await self.flush_fn(session, rows)
+
+    async def _write_rows(self, batch: List[dict]) -> bool:
+        """
+        Построчная запись пакета, который не проходит целиком
+
+        Строки с ошибкой данных отбрасываются. При другой ошибке (например,
+        БД недоступна) оставшиеся строки возвращаются в очередь и
+        возвращается False.
+        """
+        for index, row in enumerate(batch):
+            try:
+                await self._write([row])
+                self.written += 1
+
+            except (IntegrityError, DataError) as e:
+                self.dropped += 1
+                logger.error(f"{self.name}: dropping row that cannot be written: {row!r}: {e}")
+
+            except Exception as e:
+                logger.error(f"{self.name}: row-by-row write failed: {e}")
+                self._buffer[:0] = batch[index:]
+                return False
+
+            except BaseException:
+                self._buffer[:0] = batch[index:]
+                raise
+
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.broadcasts import (
+    create_broadcast,
+    get_broadcast,
+    get_recipients_batch,
+    get_running_broadcast_ids,
+    save_broadcast_checkpoint,
+    set_broadcast_status
+)
+from .send_scheduler import bulk_sending
+from .user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых писать пользователю бессмысленно
+_UNREACHABLE_ERRORS = ("chat not found", "user is deactivated")
+
+
+class Broadcaster:
+    """
+    Рассылки администратора всем пользователям
+
+    Получатели читаются из users пачками по batch_size (keyset по id,
+    заблокировавшие бота пропускаются), пачка отправляется пулом из
+    workers задач. Темп задает SendScheduler: запросы идут с приоритетом
+    рассылки и не вытесняют ответы пользователям. После каждой пачки
+    контрольная точка и счетчики фиксируются в broadcasts, поэтому после
+    сбоя или перезапуска рассылка продолжается со следующей пачки
+    (повторно может получить сообщение не больше одной пачки).
+    """
+
+    def __init__(self, session_maker: async_sessionmaker, workers: int, batch_size: int):
+        self.session_maker = session_maker
+        self.workers = workers
+        self.batch_size = batch_size
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    @property
+    def active(self) -> List[int]:
+        """id рассылок, выполняемых этим процессом"""
+        return list(self._tasks)
+
+    async def create(self, bot: Bot, text: str, created_by: int) -> int:
+        """Сохраняет рассылку и запускает ее в фоне"""
+        async with self.session_maker() as session:
+            broadcast = await create_broadcast(session, text, created_by)
+            await session.commit()
+        self.start(bot, broadcast.id)
+        return broadcast.id
+
+    def start(self, bot: Bot, broadcast_id: int) -> None:
+        if broadcast_id not in self._tasks:
+            task = asyncio.create_task(self._run(bot, broadcast_id))
+            self._tasks[broadcast_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def resume(self, bot: Bot, **kwargs) -> None:
+        """Продолжает незавершенные рассылки (при старте бота)"""
+        async with self.session_maker() as session:
+            broadcast_ids = await get_running_broadcast_ids(session)
+        for broadcast_id in broadcast_ids:
+            logger.info(f"Resuming broadcast {broadcast_id}")
+            self.start(bot, broadcast_id)
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        """Останавливает рассылку; False - она уже завершена или не найдена"""
+        async with self.session_maker() as session:
+            cancelled = await set_broadcast_status(session, broadcast_id, "cancelled")
+            await session.commit()
+
+        task = self._tasks.get(broadcast_id)
+        if task is not None:
+            task.cancel()
+        return cancelled
+
+    async def close(self, *args, **kwargs) -> None:
+        """Прерывает рассылки при остановке - со статусом running они продолжатся при старте"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, bot: Bot, broadcast_id: int) -> None:
+        try:
+            async with self.session_maker() as session:
+                broadcast = await get_broadcast(session, broadcast_id)
+            if broadcast is None or broadcast.status != "running":
+                return
+
+            cursor = broadcast.last_user_id
+            with bulk_sending():
+                while True:
+                    async with self.session_maker() as session:
+                        batch = await get_recipients_batch(session, cursor, self.batch_size)
+                    if not batch:
+                        break
+
+                    sent, failed, blocked = await self._send_batch(bot, broadcast.text, batch)
+                    cursor = batch[-1][0]
+                    async with self.session_maker() as session:
+                        await save_broadcast_checkpoint(session, broadcast_id, cursor, sent, failed, blocked)
+                        await session.commit()
+
+            async with self.session_maker() as session:
+                finished = await set_broadcast_status(session, broadcast_id, "done")
+                await session.commit()
+                broadcast = await get_broadcast(session, broadcast_id)
+
+            if finished:
+                logger.info(f"Broadcast {broadcast_id} done: {broadcast.sent} sent")
+                await bot.send_message(
+                    broadcast.created_by,
+                    f"✅ Рассылка #{broadcast_id} завершена\n"
+                    f"Доставлено: {broadcast.sent}, ошибок: {broadcast.failed}, "
+                    f"заблокировали бота: {broadcast.blocked}"
+                )
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Статус остается running - рассылка продолжится при следующем старте
+            logger.error(f"Broadcast {broadcast_id} stopped: {e}", exc_info=True)
+
+    async def _send_batch(
+            self,
+            bot: Bot,
+            text: str,
+            batch: List[Tuple[int, int]]
+    ) -> Tuple[int, int, List[int]]:
+        """Отправляет пачку пулом задач; возвращает доставленные, ошибки и заблокировавших"""
+        recipients = iter(batch)
+        sent = failed = 0
+        blocked: List[int] = []
+
+        async def worker() -> None:
+            nonlocal sent, failed
+            for user_id, telegram_id in recipients:
+                error = await self._send_one(bot, telegram_id, text)
+                if error is None:
+                    sent += 1
+                elif error == "blocked":
+                    blocked.append(user_id)
+                    user_cache.invalidate(telegram_id)
+                else:
+                    failed += 1
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, len(batch)))))
+        return sent, failed, blocked
+
+    @staticmethod
+    async def _send_one(bot: Bot, telegram_id: int, text: str) -> Optional[str]:
+        """None - доставлено, "blocked" - пользователь недоступен, иначе текст ошибки"""
+        try:
+            await bot.send_message(telegram_id, text)
+            return None
+        except TelegramForbiddenError:
+            return "blocked"
+        except TelegramBadRequest as e:
+            if any(reason in e.message.lower() for reason in _UNREACHABLE_ERRORS):
+                return "blocked"
+            logger.warning(f"Broadcast to {telegram_id} failed: {e}")
+            return str(e)
+        except TelegramAPIError as e:
+            # В том числе 429 после исчерпания повторов планировщика
+            logger.warning(f"Broadcast to {telegram_id} failed: {e}")
+            return str(e)
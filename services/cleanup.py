@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Sequence
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.cleanup import deactivate_quizzes, delete_quiz_rows_chunk, delete_quizzes, get_cleanup_quiz_ids
+from database.leaderboard import load_leaderboards
+from database.models import AnswerEvent, QuizResult
+from .batch_writer import WriteBehindWriter
+from .quiz_cache import quiz_cache
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_INTERVAL = 3.0  # Не чаще одного обновления сообщения о прогрессе за столько секунд
+
+
+@dataclass(frozen=True, slots=True)
+class CleanupFilter:
+    """Какие квизы удалять (без условий - все)"""
+    created_before: Optional[datetime] = None
+    creator_telegram_id: Optional[int] = None
+    quiz_id: Optional[int] = None
+
+    def describe(self) -> str:
+        parts = []
+        if self.created_before is not None:
+            parts.append(f"созданные до {self.created_before:%d.%m.%Y %H:%M}")
+        if self.creator_telegram_id is not None:
+            parts.append(f"автора {self.creator_telegram_id}")
+        if self.quiz_id is not None:
+            parts.append(f"квиз #{self.quiz_id}")
+        return "квизы " + ", ".join(parts) if parts else "все квизы"
+
+
+class CleanupRunner:
+    """
+    Фоновая очистка квизов с их ответами и результатами
+
+    Квизы под фильтр выбираются пачками по quiz_batch, их журнал ответов и
+    результаты удаляются диапазонами id не больше chunk_size строк, каждый
+    диапазон - отдельной короткой транзакцией с паузой после нее. Блокировка
+    записи SQLite держится миллисекунды, и апдейты пользователей проходят
+    между порциями. Баллы удаляемых результатов вычитаются из общего рейтинга
+    теми же порциями, рейтинги в памяти перезагружаются после очистки.
+
+    Перед удалением пачка квизов скрывается из каталога, а отложенные
+    записи (writers) сбрасываются - ожидавшие записи результаты и ответы
+    этих квизов удаляются вместе с остальными, а не остаются сиротами. Удаление идемпотентно: прерванную очистку достаточно
+    запустить снова. Одновременно выполняется одна очистка.
+    """
+
+    def __init__(
+            self,
+            session_maker: async_sessionmaker,
+            chunk_size: int,
+            quiz_batch: int,
+            pause: float,
+            writers: Sequence[WriteBehindWriter] = ()
+    ):
+        self.session_maker = session_maker
+        self.writers = writers
+        self.chunk_size = chunk_size
+        self.quiz_batch = quiz_batch
+        self.pause = pause
+        self._task: Optional[asyncio.Task] = None
+        self._progress = {}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self, bot: Bot, chat_id: int, message_id: int, cleanup_filter: CleanupFilter) -> bool:
+        """Запускает очистку; прогресс пишется в сообщение message_id. False - очистка уже идет"""
+        if self._task is not None:
+            return False
+        self._progress = {"quizzes": 0, "answer_events": 0, "quiz_results": 0}
+        self._task = asyncio.create_task(self._run(bot, chat_id, message_id, cleanup_filter))
+        self._task.add_done_callback(self._on_done)
+        return True
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._task = None
+
+    async def stop(self) -> bool:
+        """Прерывает очистку (уже удаленное не восстанавливается)"""
+        if self._task is None:
+            return False
+        self._task.cancel()
+        return True
+
+    async def close(self, *args, **kwargs) -> None:
+        task = self._task
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def _format_progress(self, cleanup_filter: CleanupFilter, status: str) -> str:
+        progress = self._progress
+        return (
+            f"🧹 Очистка ({cleanup_filter.describe()}): {status}\n"
+            f"Удалено квизов: {progress['quizzes']}\n"
+            f"Результатов: {progress['quiz_results']}\n"
+            f"Ответов в журнале: {progress['answer_events']}"
+        )
+
+    async def _report(self, bot: Bot, chat_id: int, message_id: int, text: str) -> None:
+        try:
+            await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+        except TelegramAPIError as e:
+            logger.warning(f"Cleanup progress update failed: {e}")
+
+    async def _reload_leaderboards(self) -> None:
+        try:
+            async with self.session_maker() as session:
+                await load_leaderboards(session)
+        except Exception as e:
+            logger.error(f"Leaderboards reload after cleanup failed: {e}", exc_info=True)
+
+    async def _run(self, bot: Bot, chat_id: int, message_id: int, cleanup_filter: CleanupFilter) -> None:
+        started = time.monotonic()
+        reported = started
+        status = "завершена"
+        try:
+            cursor = 0
+            while True:
+                async with self.session_maker() as session:
+                    quiz_ids = await get_cleanup_quiz_ids(
+                        session,
+                        cursor,
+                        self.quiz_batch,
+                        created_before=cleanup_filter.created_before,
+                        creator_telegram_id=cleanup_filter.creator_telegram_id,
+                        quiz_id=cleanup_filter.quiz_id
+                    )
+                if not quiz_ids:
+                    break
+
+                async with self.session_maker() as session:
+                    await deactivate_quizzes(session, quiz_ids)
+                    await session.commit()
+                for writer in self.writers:
+                    await writer.flush()
+
+                # Сначала зависимые строки порциями, затем сами квизы и их агрегаты
+                for model in (AnswerEvent, QuizResult):
+                    while True:
+                        async with self.session_maker() as session:
+                            deleted = await delete_quiz_rows_chunk(session, model, quiz_ids, self.chunk_size)
+                            await session.commit()
+                        if not deleted:
+                            break
+                        self._progress[model.__tablename__] += deleted
+                        await asyncio.sleep(self.pause)
+
+                        if time.monotonic() - reported >= PROGRESS_INTERVAL:
+                            reported = time.monotonic()
+                            await self._report(
+                                bot, chat_id, message_id, self._format_progress(cleanup_filter, "выполняется")
+                            )
+
+                async with self.session_maker() as session:
+                    self._progress["quizzes"] += await delete_quizzes(session, quiz_ids)
+                    await session.commit()
+                for quiz_id in quiz_ids:
+                    quiz_cache.invalidate(quiz_id)
+                cursor = quiz_ids[-1]
+
+        except asyncio.CancelledError:
+            status = "прервана"
+            raise
+        except Exception as e:
+            status = "остановлена из-за ошибки"
+            logger.error(f"Cleanup failed: {e}", exc_info=True)
+        finally:
+            if self._progress["quiz_results"] or self._progress["quizzes"]:
+                # Зафиксированные порции уже изменили таблицу рейтингов
+                await self._reload_leaderboards()
+            logger.info(f"Cleanup {status} in {time.monotonic() - started:.1f}s: {self._progress}")
+            await self._report(bot, chat_id, message_id, self._format_progress(cleanup_filter, status))
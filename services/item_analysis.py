@@ -0,0 +1,174 @@
+import math
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy нужен только для анализа вопросов
+    np = None
+
+from .quiz_parser import QuizQuestion
+
+MIN_RESPONSES = 20  # Меньше ответов - выводы о вопросе не делаем
+EASY_THRESHOLD = 0.9  # Доля правильных ответов, выше которой вопрос слишком легкий
+HARD_THRESHOLD = 0.2  # ... ниже которой слишком трудный
+LOW_DISCRIMINATION = 0.15  # Вопрос плохо отделяет сильных от слабых
+DEAD_DISTRACTOR = 0.05  # Неправильный вариант, который почти никто не выбирает
+
+
+@dataclass(frozen=True, slots=True)
+class QuestionAnalysis:
+    """Показатели одного вопроса по журналу ответов"""
+    index: int  # 0-based индекс вопроса в квизе
+    responses: int
+    difficulty: float  # p-value: доля правильных ответов
+    discrimination: float  # Корреляция ответа с результатом по остальным вопросам (nan - не определена)
+    option_frequencies: Tuple[float, ...]  # Доля выборов каждого варианта
+    mean_latency_ms: float
+    flags: Tuple[str, ...]
+
+
+def analyze_responses(
+        attempt_ids: Sequence[str],
+        question_indexes: Sequence[int],
+        options: Sequence[int],
+        is_correct: Sequence[bool],
+        latencies_ms: Sequence[int],
+        questions: Sequence[QuizQuestion]
+) -> List[QuestionAnalysis]:
+    """
+    Анализ вопросов квиза по журналу ответов за один векторный проход
+
+    Ответы раскладываются в матрицу попытка x вопрос (1 - верно, 0 - неверно,
+    маска - был ли ответ). Для каждого вопроса считаются сложность, индекс
+    дискриминации (item-rest корреляция: ответ на вопрос против суммы баллов
+    по остальным вопросам той же попытки) и частоты выбора вариантов.
+    Тяжелые вычисления не блокируют цикл событий - вызывать через asyncio.to_thread.
+    """
+    if np is None:
+        raise RuntimeError("Для анализа вопросов установите numpy")
+
+    n_questions = len(questions)
+    n_options = max((len(question.options) for question in questions), default=0)
+
+    question_idx = np.asarray(question_indexes, dtype=np.int64)
+    option_idx = np.asarray(options, dtype=np.int64)
+    correct = np.asarray(is_correct, dtype=np.float64)
+    latency = np.asarray(latencies_ms, dtype=np.float64)
+
+    # Ответы на вопросы, которых уже нет в квизе, отбрасываем
+    valid = (question_idx >= 0) & (question_idx < n_questions) & (option_idx >= 0) & (option_idx < n_options)
+    question_idx, option_idx = question_idx[valid], option_idx[valid]
+    correct, latency = correct[valid], latency[valid]
+    attempts, attempt_codes = np.unique(np.asarray(attempt_ids, dtype=object)[valid], return_inverse=True)
+    n_attempts = len(attempts)
+
+    # Матрица ответов: попытки x вопросы
+    scores = np.zeros((n_attempts, n_questions))
+    answered = np.zeros((n_attempts, n_questions))
+    scores[attempt_codes, question_idx] = correct
+    answered[attempt_codes, question_idx] = 1.0
+
+    responses = answered.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        difficulty = scores.sum(axis=0) / responses
+
+        # Item-rest корреляция по ответившим на вопрос
+        rest = scores.sum(axis=1, keepdims=True) - scores
+        mean_item = difficulty
+        mean_rest = (rest * answered).sum(axis=0) / responses
+        item_dev = (scores - mean_item) * answered
+        rest_dev = (rest - mean_rest) * answered
+        covariance = (item_dev * rest_dev).sum(axis=0)
+        discrimination = covariance / np.sqrt((item_dev ** 2).sum(axis=0) * (rest_dev ** 2).sum(axis=0))
+
+        # Частоты вариантов и среднее время ответа
+        flat = question_idx * n_options + option_idx
+        option_counts = np.bincount(flat, minlength=n_questions * n_options).reshape(n_questions, n_options)
+        frequencies = option_counts / responses[:, None]
+        mean_latency = np.bincount(question_idx, weights=latency, minlength=n_questions) / responses
+
+    report = []
+    for index, question in enumerate(questions):
+        count = int(responses[index])
+        question_frequencies = tuple(
+            float(value) if count else 0.0 for value in frequencies[index, :len(question.options)]
+        )
+        report.append(QuestionAnalysis(
+            index=index,
+            responses=count,
+            difficulty=float(difficulty[index]),
+            discrimination=float(discrimination[index]),
+            option_frequencies=question_frequencies,
+            mean_latency_ms=float(mean_latency[index]),
+            flags=_question_flags(
+                count,
+                float(difficulty[index]),
+                float(discrimination[index]),
+                question_frequencies,
+                question.correct_answer
+            )
+        ))
+    return report
+
+
+def _question_flags(
+        responses: int,
+        difficulty: float,
+        discrimination: float,
+        frequencies: Tuple[float, ...],
+        correct_answer: int
+) -> Tuple[str, ...]:
+    """Признаки проблемного вопроса"""
+    if responses < MIN_RESPONSES:
+        return ()
+
+    flags = []
+    if difficulty > EASY_THRESHOLD:
+        flags.append("слишком легкий")
+    elif difficulty < HARD_THRESHOLD:
+        flags.append("слишком трудный")
+
+    if math.isnan(discrimination):
+        pass
+    elif discrimination < 0:
+        flags.append("сильные игроки ошибаются чаще - проверьте правильный ответ")
+    elif discrimination < LOW_DISCRIMINATION:
+        flags.append("плохо различает игроков")
+
+    correct_share = frequencies[correct_answer]
+    distractors = [share for option, share in enumerate(frequencies) if option != correct_answer]
+    if distractors and max(distractors) > correct_share:
+        flags.append("неправильный вариант популярнее правильного")
+    dead = sum(share < DEAD_DISTRACTOR for share in distractors)
+    if dead:
+        flags.append(f"вариантов, которые почти не выбирают: {dead}")
+
+    return tuple(flags)
+
+
+def format_analysis(title: str, report: List[QuestionAnalysis], questions: Sequence[QuizQuestion]) -> str:
+    """Текст отчета для автора квиза (HTML)"""
+    attempts = max((item.responses for item in report), default=0)
+    lines = [f"🔬 Анализ вопросов: <b>{title}</b>", f"Ответов на вопрос: до {attempts}", ""]
+    for item in report:
+        if not item.responses:
+            lines.append(f"{item.index + 1}. нет ответов")
+            continue
+
+        correct_answer = questions[item.index].correct_answer
+        options = " ".join(
+            f"{'✓' if option == correct_answer else ''}{share * 100:.0f}%"
+            for option, share in enumerate(item.option_frequencies)
+        )
+        discrimination = "-" if math.isnan(item.discrimination) else f"{item.discrimination:.2f}"
+        lines.append(
+            f"{'⚠️' if item.flags else '✅'} {item.index + 1}. p={item.difficulty:.2f} "
+            f"D={discrimination} [{options}] {item.mean_latency_ms / 1000:.1f}с"
+        )
+        if item.flags:
+            lines.append(f"    {'; '.join(item.flags)}")
+
+    lines.append("")
+    lines.append("p - доля правильных ответов, D - дискриминация, ✓ - правильный вариант")
+    return "\n".join(lines)
@@ -0,0 +1,133 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+GLOBAL_BOARD = 0  # quiz_id общего рейтинга
+
+WINDOWS = ("all", "week", "day")
+WINDOW_TITLES = {
+    "all": "за все время",
+    "week": "за неделю",
+    "day": "за день"
+}
+
+
+def period_key(window: str, moment: datetime) -> str:
+    """Ключ периода рейтинга: all, w2026-42 (ISO-неделя) или d2026-10-18"""
+    if window == "all":
+        return "all"
+    if window == "week":
+        year, week, _ = moment.isocalendar()
+        return f"w{year}-{week:02d}"
+    if window == "day":
+        return f"d{moment:%Y-%m-%d}"
+    raise ValueError(f"Неизвестный период рейтинга: {window}")
+
+
+class Board:
+    """
+    Отсортированный рейтинг одного квиза (или общий) за один период
+
+    Ключи (-score, user_id) хранятся в отсортированном списке, поэтому
+    место пользователя и позиция балла ищутся бинарным поиском за O(log n).
+    """
+    __slots__ = ("scores", "keys")
+
+    def __init__(self):
+        self.scores: Dict[int, int] = {}
+        self.keys: List[Tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def set(self, user_id: int, score: int) -> None:
+        old = self.scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            del self.keys[bisect_left(self.keys, (-old, user_id))]
+        self.scores[user_id] = score
+        insort(self.keys, (-score, user_id))
+
+    def add(self, user_id: int, score: int, accumulate: bool) -> None:
+        """Сумма баллов (accumulate) или лучший результат пользователя"""
+        old = self.scores.get(user_id)
+        if old is None:
+            self.set(user_id, score)
+        elif accumulate:
+            self.set(user_id, old + score)
+        elif score > old:
+            self.set(user_id, score)
+
+    def rank_for_score(self, score: int) -> int:
+        """Место для балла: 1 + количество строго лучших результатов"""
+        return bisect_left(self.keys, (-score,)) + 1
+
+    def rank(self, user_id: int) -> Optional[int]:
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.rank_for_score(score)
+
+    def top(self, limit: int) -> List[Tuple[int, int]]:
+        """Первые limit пар (user_id, score)"""
+        return [(user_id, -neg_score) for neg_score, user_id in self.keys[:limit]]
+
+
+class Leaderboards:
+    """
+    Рейтинги в памяти: по каждому квизу и общий, за все время, неделю и день
+
+    По квизу учитывается лучший результат пользователя, в общем рейтинге -
+    сумма баллов. Недельные и дневные доски сбрасываются при смене периода.
+    """
+
+    def __init__(self):
+        self._boards: Dict[Tuple[int, str], Board] = {}
+        self._periods: Dict[str, str] = {}
+
+    def board(self, quiz_id: int, window: str, now: Optional[datetime] = None) -> Board:
+        self._roll(window, period_key(window, now or datetime.now()))
+        board = self._boards.get((quiz_id, window))
+        if board is None:
+            board = self._boards[(quiz_id, window)] = Board()
+        return board
+
+    def record(self, quiz_id: int, user_id: int, score: int, completed_at: datetime) -> None:
+        """Учитывает один результат во всех подходящих рейтингах"""
+        for window in WINDOWS:
+            key = period_key(window, completed_at)
+            if self._periods.get(window, key) > key:
+                continue  # Результат из уже закрытого периода
+            self._roll(window, key)
+            self.board(quiz_id, window, completed_at).add(user_id, score, accumulate=False)
+            self.board(GLOBAL_BOARD, window, completed_at).add(user_id, score, accumulate=True)
+
+    def load(self, entries: Iterable, now: Optional[datetime] = None) -> None:
+        """Заполняет рейтинги строками (quiz_id, period, user_id, score)"""
+        now = now or datetime.now()
+        self._boards.clear()
+        self._periods = {window: period_key(window, now) for window in WINDOWS}
+        windows_by_period = {period: window for window, period in self._periods.items()}
+
+        for entry in entries:
+            window = windows_by_period.get(entry.period)
+            if window is not None:
+                self.board(entry.quiz_id, window, now).set(entry.user_id, entry.score)
+
+    def current_periods(self, now: Optional[datetime] = None) -> Dict[str, str]:
+        now = now or datetime.now()
+        return {window: period_key(window, now) for window in WINDOWS}
+
+    def _roll(self, window: str, key: str) -> None:
+        """Сбрасывает доски периода, если наступил новый"""
+        if self._periods.get(window) == key:
+            return
+        if window in self._periods and self._periods[window] > key:
+            return
+        self._periods[window] = key
+        for board_key in [board_key for board_key in self._boards if board_key[1] == window]:
+            del self._boards[board_key]
+
+
+leaderboards = Leaderboards()
@@ -0,0 +1,111 @@
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from config import QUIZ_CACHE_MAX_BYTES
+from .quiz_parser import QuizQuestion
+
+
+@dataclass(frozen=True, slots=True)
+class CachedQuiz:
+    """Разобранный квиз, готовый к запуску"""
+    id: int
+    version: int
+    title: str
+    questions: Tuple[QuizQuestion, ...]
+
+
+def _estimate_size(quiz: CachedQuiz) -> int:
+    """Грубая оценка занимаемой памяти (строки + контейнеры)"""
+    size = sys.getsizeof(quiz) + sys.getsizeof(quiz.title) + sys.getsizeof(quiz.questions)
+    for question in quiz.questions:
+        size += sys.getsizeof(question) + sys.getsizeof(question.text)
+        size += sys.getsizeof(question.options)
+        size += sum(sys.getsizeof(option) for option in question.options)
+    return size
+
+
+class QuizCache:
+    """
+    LRU-кэш разобранных квизов с ограничением по памяти
+
+    Ключ - (id квиза, версия формата). Для каждого id хранится только
+    актуальная версия, поэтому поиск по id не требует обращения к БД.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[int, int], CachedQuiz]" = OrderedDict()
+        self._sizes: Dict[Tuple[int, int], int] = {}
+        self._versions: Dict[int, int] = {}
+        self._used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, quiz_id: int) -> Optional[CachedQuiz]:
+        """Возвращает квиз из кэша и обновляет его позицию в LRU"""
+        version = self._versions.get(quiz_id)
+        if version is None:
+            self.misses += 1
+            return None
+
+        key = (quiz_id, version)
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._entries[key]
+
+    def put(self, quiz: CachedQuiz) -> None:
+        """Добавляет квиз, вытесняя самые давние записи при превышении лимита"""
+        self.invalidate(quiz.id)
+
+        size = _estimate_size(quiz)
+        if size > self.max_bytes:
+            return
+
+        key = (quiz.id, quiz.version)
+        self._entries[key] = quiz
+        self._sizes[key] = size
+        self._versions[quiz.id] = quiz.version
+        self._used_bytes += size
+
+        while self._used_bytes > self.max_bytes:
+            old_key, _ = self._entries.popitem(last=False)
+            self._forget(old_key)
+            self.evictions += 1
+
+    def invalidate(self, quiz_id: Optional[int] = None) -> None:
+        """Удаляет квиз из кэша (или очищает кэш полностью, если id не указан)"""
+        if quiz_id is None:
+            self._entries.clear()
+            self._sizes.clear()
+            self._versions.clear()
+            self._used_bytes = 0
+            return
+
+        version = self._versions.get(quiz_id)
+        if version is not None:
+            key = (quiz_id, version)
+            del self._entries[key]
+            self._forget(key)
+
+    def _forget(self, key: Tuple[int, int]) -> None:
+        self._used_bytes -= self._sizes.pop(key)
+        del self._versions[key[0]]
+
+    def stats(self) -> dict:
+        """Статистика использования кэша"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "used_bytes": self._used_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+quiz_cache = QuizCache(QUIZ_CACHE_MAX_BYTES)
@@ -0,0 +1,59 @@
+import html
+import json
+from typing import Optional, Tuple
+
+from .quiz_parser import parse_quiz_text, ParsedQuiz, QuizQuestion
+
+# Версия формата скомпилированного квиза.
+# При изменении структуры увеличиваем версию - старые записи
+# перекомпилируются лениво при первом запуске квиза.
+COMPILED_FORMAT_VERSION = 3
+
+
+def compile_quiz(quiz: ParsedQuiz) -> str:
+    """
+    Компилирует результат parse_quiz_text в компактную строку для хранения в БД
+
+    Формат: {"v": версия, "q": [[текст, [варианты], правильный_ответ, секунд_на_ответ], ...]}
+    Текст вопросов и вариантов хранится без HTML-экранирования парсера: подписи
+    кнопок Telegram не разбирает как HTML, экранируется только текст сообщений.
+    """
+    payload = {
+        'v': COMPILED_FORMAT_VERSION,
+        'q': [
+            [
+                html.unescape(question.text),
+                [html.unescape(option) for option in question.options],
+                question.correct_answer,
+                question.time_limit
+            ]
+            for question in quiz.questions
+        ]
+    }
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+
+def load_compiled_quiz(compiled: str) -> Tuple[QuizQuestion, ...]:
+    """Загружает вопросы из скомпилированной формы без повторного парсинга текста"""
+    payload = json.loads(compiled)
+    if payload.get('v') != COMPILED_FORMAT_VERSION:
+        raise ValueError("Неподдерживаемая версия скомпилированного квиза")
+
+    return tuple(
+        QuizQuestion(text=text, options=tuple(options), correct_answer=correct_answer, time_limit=time_limit)
+        for text, options, correct_answer, time_limit in payload['q']
+    )
+
+
+def load_quiz_questions(quiz) -> Tuple[Tuple[QuizQuestion, ...], Optional[str]]:
+    """
+    Возвращает вопросы квиза и, если запись устарела, новую скомпилированную форму
+
+    Второй элемент кортежа не None, когда квиз был перекомпилирован из исходного
+    текста и вызывающему коду следует сохранить его в БД (ленивое обновление).
+    """
+    if quiz.compiled and quiz.format_version == COMPILED_FORMAT_VERSION:
+        return load_compiled_quiz(quiz.compiled), None
+
+    compiled = compile_quiz(parse_quiz_text(quiz.content))
+    return load_compiled_quiz(compiled), compiled
@@ -0,0 +1,258 @@
+import asyncio
+import io
+import logging
+import re
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from config import IMPORT_WORKERS, IMPORT_CHUNK_SIZE, IMPORT_MAX_UNPACKED_MB
+from .quiz_compiler import compile_quiz
+from .quiz_parser import parse_quiz_text, QuizValidationError
+
+logger = logging.getLogger(__name__)
+
+# Новый квиз в документе начинается со строки названия
+_BLOCK_START_RE = re.compile(r"^[ \t]*Название(?: квиза)?:")
+
+
+@dataclass(frozen=True, slots=True)
+class QuizBlock:
+    """Текст одного квиза из документа"""
+    source: str  # Имя файла (или файла внутри архива)
+    line: int  # Строка начала блока в файле
+    text: str
+
+
+@dataclass(frozen=True, slots=True)
+class ImportedQuiz:
+    """Квиз, прошедший разбор и валидацию"""
+    source: str
+    line: int
+    title: str
+    description: str
+    content: str
+    compiled: str
+    questions: int
+
+
+@dataclass(frozen=True, slots=True)
+class ImportFailure:
+    """Квиз (или файл), который не удалось импортировать"""
+    source: str
+    line: int
+    title: str
+    error: str
+
+
+ImportResult = Union[ImportedQuiz, ImportFailure]
+
+
+def iter_text_blocks(lines: Iterable[str], source: str) -> Iterator[QuizBlock]:
+    """
+    Разбивает поток строк на блоки квизов по строкам 'Название: ...'
+
+    Строки до первого названия попадают в первый блок - без названия он
+    не пройдет валидацию и окажется в отчете об ошибках.
+    """
+    buffer: List[str] = []
+    start = 1
+    for line_number, line in enumerate(lines, 1):
+        if _BLOCK_START_RE.match(line) and buffer:
+            if any(chunk.strip() for chunk in buffer):
+                yield QuizBlock(source, start, "".join(buffer))
+            buffer = []
+            start = line_number
+        buffer.append(line)
+
+    if any(chunk.strip() for chunk in buffer):
+        yield QuizBlock(source, start, "".join(buffer))
+
+
+def iter_document_blocks(
+        file: BinaryIO,
+        filename: str,
+        max_unpacked: int = IMPORT_MAX_UNPACKED_MB * 1024 * 1024
+) -> Iterator[Union[QuizBlock, ImportFailure]]:
+    """
+    Читает .txt или .zip (с .txt внутри) потоково и выдает блоки квизов
+
+    Файлы с неверной кодировкой и архивы с ошибками выдаются как ImportFailure.
+    Файл архива, который не удалось распаковать, попадает в отчет об ошибках,
+    остальные файлы архива читаются дальше.
+    Из архива распаковывается не больше max_unpacked байт: файлы сверх
+    лимита не читаются и попадают в отчет об ошибках.
+    """
+    if filename.lower().endswith(".zip"):
+        try:
+            archive = zipfile.ZipFile(file)
+        except zipfile.BadZipFile:
+            yield ImportFailure(filename, 0, "", "Поврежденный zip-архив")
+            return
+
+        unpacked = 0
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(".txt"):
+                    continue
+                # Размер из заголовка надежен: ZipExtFile не читает больше
+                # заявленного file_size и проверяет CRC в конце файла
+                unpacked += info.file_size
+                if unpacked > max_unpacked:
+                    yield ImportFailure(
+                        info.filename, 0, "",
+                        f"Превышен размер распакованного архива ({max_unpacked // (1024 * 1024)} МБ)"
+                    )
+                    return
+                try:
+                    with archive.open(info) as member:
+                        yield from _iter_text_file(member, info.filename)
+                except (zipfile.BadZipFile, RuntimeError, NotImplementedError, zlib.error) as e:
+                    # Ошибка CRC, зашифрованный файл или неизвестное сжатие - только этот файл
+                    yield ImportFailure(info.filename, 0, "", f"Не удалось распаковать файл: {e}")
+        return
+
+    yield from _iter_text_file(file, filename)
+
+
+def _iter_text_file(file: BinaryIO, source: str) -> Iterator[Union[QuizBlock, ImportFailure]]:
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline=None)
+    try:
+        yield from iter_text_blocks(text, source)
+    except UnicodeDecodeError:
+        yield ImportFailure(source, 0, "", "Файл не в кодировке UTF-8")
+    finally:
+        text.detach()  # Исходный файл закрывает вызывающий код
+
+
+def parse_quiz_blocks(blocks: List[QuizBlock]) -> List[ImportResult]:
+    """
+    Разбирает и компилирует пачку блоков (выполняется в процессе пула)
+
+    Номера строк в ошибках пересчитываются в координаты исходного файла.
+    """
+    results: List[ImportResult] = []
+    for block in blocks:
+        try:
+            parsed = parse_quiz_text(block.text)
+        except QuizValidationError as e:
+            line = block.line + e.line - 1 if e.line else block.line
+            results.append(ImportFailure(block.source, line, _guess_title(block.text), e.message))
+            continue
+
+        results.append(ImportedQuiz(
+            source=block.source,
+            line=block.line,
+            title=parsed.title,
+            description=parsed.description,
+            content=block.text.strip(),
+            compiled=compile_quiz(parsed),
+            questions=len(parsed.questions)
+        ))
+    return results
+
+
+def _next_chunk(
+        items: Iterator[Union[QuizBlock, ImportFailure]],
+        size: int
+) -> Tuple[List[QuizBlock], List[ImportFailure], bool]:
+    """Читает из документа до size блоков; третий элемент - документ прочитан до конца"""
+    blocks: List[QuizBlock] = []
+    failures: List[ImportFailure] = []
+    for item in items:
+        if isinstance(item, ImportFailure):
+            failures.append(item)
+            continue
+        blocks.append(item)
+        if len(blocks) >= size:
+            return blocks, failures, False
+    return blocks, failures, True
+
+
+def _guess_title(text: str) -> str:
+    """Название квиза для отчета об ошибке (первая строка блока)"""
+    first_line = text.lstrip().split("\n", 1)[0]
+    return first_line.split(":", 1)[-1].strip()[:100]
+
+
+class QuizImporter:
+    """
+    Разбор документов с квизами в пуле процессов
+
+    Разбор текста - чистая нагрузка на CPU, поэтому блоки пачками по
+    chunk_size отправляются в ProcessPoolExecutor, а цикл событий остается
+    свободным для апдейтов. Пул создается при первом импорте.
+    """
+
+    def __init__(self, max_workers: int, chunk_size: int):
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def parse_document(self, file: BinaryIO, filename: str) -> Tuple[List[ImportedQuiz], List[ImportFailure]]:
+        """
+        Возвращает успешно разобранные квизы и отчет об ошибках (по файлу и строке)
+
+        Документ читается пачками по chunk_size блоков, и каждая пачка сразу
+        уходит в пул. В работе одновременно не больше двух пачек на процесс,
+        поэтому исходный текст не читается в память целиком. Разобранные квизы
+        (с текстом и скомпилированной формой) накапливаются в списке до записи
+        в БД - объем импорта ограничен размером документа и IMPORT_MAX_UNPACKED_MB.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        items = iter_document_blocks(file, filename)
+        max_pending = self.max_workers * 2
+
+        imported: List[ImportedQuiz] = []
+        failures: List[ImportFailure] = []
+        pending: Set[asyncio.Future] = set()
+
+        def collect(done: Iterable[asyncio.Future]) -> None:
+            for future in done:
+                for result in future.result():
+                    if isinstance(result, ImportedQuiz):
+                        imported.append(result)
+                    else:
+                        failures.append(result)
+
+        try:
+            finished = False
+            while not finished:
+                if len(pending) >= max_pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    collect(done)
+
+                # Чтение и нарезка файла - блокирующий ввод-вывод, выполняем в потоке
+                blocks, chunk_failures, finished = await loop.run_in_executor(
+                    None, _next_chunk, items, self.chunk_size
+                )
+                failures.extend(chunk_failures)
+                if blocks:
+                    pending.add(loop.run_in_executor(executor, parse_quiz_blocks, blocks))
+
+            if pending:
+                done, _ = await asyncio.wait(pending)
+                collect(done)
+        finally:
+            for future in pending:
+                future.cancel()
+
+        failures.sort(key=lambda failure: (failure.source, failure.line))
+        logger.info(f"Import of {filename}: {len(imported)} parsed, {len(failures)} failed")
+        return imported, failures
+
+    async def close(self, *args, **kwargs) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+quiz_importer = QuizImporter(IMPORT_WORKERS, IMPORT_CHUNK_SIZE)
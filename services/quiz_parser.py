@@ -1,24 +1,96 @@
 import html
 import re
-from dataclasses import dataclass
-from typing import List, Dict
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import List, Optional, Tuple
+
+MAX_QUESTIONS = 50
+MIN_LINES = 5  # Меньше непустых строк не хватит даже на один вопрос
+MIN_TIME_LIMIT = 5  # Ограничение времени на вопрос, секунд
+MAX_TIME_LIMIT = 3600
 
 
 class QuizValidationError(ValueError):
     """Кастомное исключение для ошибок валидации квизов"""
-    pass
+
+    def __init__(self, message: str, line: Optional[int] = None):
+        self.message = message
+        self.line = line  # Номер строки исходного текста (с 1), если известен
+        super().__init__(f"Строка {line}: {message}" if line else message)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class QuizQuestion:
+    """Неизменяемый вопрос квиза в компактной форме (разделяется между пользователями)"""
     text: str
-    options: List[str]
+    options: Tuple[str, ...]
     correct_answer: int  # 0-based индекс
+    time_limit: int = 0  # Секунд на ответ (0 - без ограничения)
+    line: int = field(default=0, compare=False)  # Строка вопроса в исходном тексте (0 - неизвестна)
+
+
+@dataclass(frozen=True, slots=True)
+class ParsedQuiz:
+    """Результат разбора текста квиза"""
+    title: str
+    description: str
+    questions: Tuple[QuizQuestion, ...]
+
+
+# Единое регулярное выражение для всех видов строк. Каждая альтернатива
+# заканчивается именованной группой со значением, поэтому вид строки
+# определяется по match.lastgroup. Последняя альтернатива (OTHER) совпадает
+# с любой строкой, включая пустую, - finditer выдает ровно одно совпадение
+# на строку, и номер строки считается без разбиения текста.
+_LINE_RE = re.compile(
+    r"""
+    ^[ \t]*(?:
+        Название(?:[ ]квиза)?:(?P<TITLE>[^\n]*)
+      | Описание(?:[ ]квиза)?:(?P<DESCRIPTION>[^\n]*)
+      | (?:Вопрос|Question)[^:\n]*:(?P<QUESTION>[^\n]*)
+      | (?P<BAD_QUESTION>(?:Вопрос|Question)[^\n]*)
+      | \d+\.(?P<OPTION>[^\n]*)
+      | (?:Правильный[ ]ответ|Correct[ ]answer)[^:\n]*:(?P<ANSWER>[^\n]*)
+      | Время[ ]на[ ]вопрос:(?P<QUIZ_TIME>[^\n]*)
+      | Время:(?P<TIME>[^\n]*)
+      | (?P<OTHER>[^\n]*)
+    )
+    """,
+    re.MULTILINE | re.VERBOSE
+)
+
+
+_NON_EMPTY_LINE_RE = re.compile(r"^[^\S\n]*\S", re.MULTILINE)
+
+
+class _QuestionBuilder:
+    """Вопрос в процессе разбора"""
+    __slots__ = ("text", "options", "correct_answer", "time_limit", "line")
+
+    def __init__(self, text: str, line: int):
+        self.text = text
+        self.options: List[str] = []
+        self.correct_answer: Optional[int] = None
+        self.time_limit: Optional[int] = None
+        self.line = line
+
+    def build(self, number: int, default_time_limit: int) -> QuizQuestion:
+        try:
+            _validate_question(self)
+        except QuizValidationError as e:
+            raise QuizValidationError(f"Вопрос {number}: {e}", self.line)
+        return QuizQuestion(
+            text=self.text,
+            options=tuple(self.options),
+            correct_answer=self.correct_answer,
+            time_limit=self.time_limit if self.time_limit is not None else default_time_limit,
+            line=self.line
+        )
 
 
-def parse_quiz_text(raw_text: str) -> Dict:
+def parse_quiz_text(raw_text: str) -> ParsedQuiz:
     """
-    Парсит текст квиза и возвращает структурированные данные
+    Парсит текст квиза за один проход и возвращает структурированные данные
     Формат:
     Название: Название квиза
     Описание: Описание квиза
@@ -28,162 +100,139 @@ def parse_quiz_text(raw_text: str) -> Dict:
     2. Вариант 2
     3. Вариант 3
     Правильный ответ: 1
+    Время: 30
 
     Вопрос 2: ...
+
+    Необязательные строки: «Время на вопрос: N» - ограничение в секундах
+    для всех вопросов квиза, «Время: N» после вопроса - для этого вопроса.
+    Ошибки содержат номер строки исходного текста (QuizValidationError.line).
     """
-    try:
-        # Предварительная очистка и проверка
-        text = _sanitize_input(raw_text)
-        if not text:
-            raise QuizValidationError("Текст квиза пуст")
-
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        if len(lines) < 5:
-            raise QuizValidationError("Текст слишком короткий для квиза")
-
-        quiz_data = {
-            'title': '',
-            'description': '',
-            'questions': []
-        }
-        current_question = None
-
-        for line in lines:
-            # Обработка заголовков
-            if _is_header_line(line, "Название"):
-                quiz_data['title'] = _parse_header(line, "Название")
-            elif _is_header_line(line, "Описание"):
-                quiz_data['description'] = _parse_header(line, "Описание")
-
-            # Обработка вопросов
-            elif line.startswith(('Вопрос', 'Question')):
-                if current_question:
-                    _validate_question(current_question)
-                    quiz_data['questions'].append(current_question)
-
-                question_text = _parse_question_line(line)
-                current_question = {
-                    'text': question_text,
-                    'options': [],
-                    'correct_answer': None
-                }
-
-            # Обработка вариантов ответа
-            elif re.match(r'^\d+\.', line):
-                if not current_question:
-                    raise QuizValidationError("Вариант ответа без вопроса")
-
-                option_text = _parse_option_line(line)
-                current_question['options'].append(option_text)
-
-            # Обработка правильного ответа
-            elif line.startswith(('Правильный ответ', 'Correct answer')):
-                if not current_question:
-                    raise QuizValidationError("Ответ без вопроса")
-
-                current_question['correct_answer'] = _parse_correct_answer(line)
-
-        # Добавляем последний вопрос
-        if current_question:
-            _validate_question(current_question)
-            quiz_data['questions'].append(current_question)
-
-        # Финальная валидация
-        _validate_quiz_structure(quiz_data)
-        return quiz_data
-
-    except Exception as e:
-        raise QuizValidationError(str(e))
+    text = _sanitize_input(raw_text)
+    if not text.strip():
+        raise QuizValidationError("Текст квиза пуст")
+    if not _has_min_lines(text):
+        raise QuizValidationError("Текст слишком короткий для квиза")
 
+    title = ""
+    description = ""
+    time_limit = 0
+    builders: List[_QuestionBuilder] = []
+    current: Optional[_QuestionBuilder] = None
 
-def _sanitize_input(text: str) -> str:
-    """Очистка и подготовка входного текста"""
-    # Удаляем BOM и лишние пробелы
-    text = text.lstrip('\ufeff').strip()
-    # Экранируем HTML/XML теги
-    return html.escape(text)
+    for line_number, match in enumerate(_LINE_RE.finditer(text), 1):
+        kind = match.lastgroup
+        if kind == "OTHER":
+            continue  # Пустые и нераспознанные строки пропускаем
 
+        value = match.group(kind).strip()
 
-def _is_header_line(line: str, prefix: str) -> bool:
-    """Проверяет, является ли строка заголовком"""
-    return line.startswith((f"{prefix}:", f"{prefix} квиза:"))
+        if kind == "OPTION":
+            if current is None:
+                raise QuizValidationError("Вариант ответа без вопроса", line_number)
+            current.options.append(value)
 
+        elif kind == "QUESTION":
+            current = _QuestionBuilder(value, line_number)
+            builders.append(current)
 
-def _parse_header(line: str, prefix: str) -> str:
-    """Извлекает значение заголовка после указанного префикса
+        elif kind == "ANSWER":
+            if current is None:
+                raise QuizValidationError("Ответ без вопроса", line_number)
+            current.correct_answer = _parse_correct_answer(value, line_number)
 
-    Args:
-        line: Строка для парсинга (например, "Название: Мой квиз")
-        prefix: Ожидаемый префикс (например, "Название")
+        elif kind == "TITLE":
+            title = value
 
-    Returns:
-        Значение после двоеточия, очищенное от пробелов
+        elif kind == "DESCRIPTION":
+            description = value
 
-    Raises:
-        QuizValidationError: Если формат строки не соответствует ожидаемому
-    """
-    try:
-        parts = line.split(':', 1)
-        if len(parts) != 2:
-            raise ValueError
-        return parts[1].strip()
-    except (ValueError, IndexError):
-        raise QuizValidationError(f"Неверный формат заголовка {prefix}. Ожидается '{prefix}: значение'")
+        elif kind == "QUIZ_TIME":
+            time_limit = _parse_time_limit(value, line_number)
 
+        elif kind == "TIME":
+            if current is None:
+                raise QuizValidationError("Время без вопроса", line_number)
+            current.time_limit = _parse_time_limit(value, line_number)
 
-def _parse_question_line(line: str) -> str:
-    """Парсит строку с вопросом"""
-    return line.split(':', 1)[1].strip()
+        else:  # BAD_QUESTION
+            raise QuizValidationError(
+                "Неверный формат вопроса. Ожидается 'Вопрос N: текст'", line_number
+            )
 
+    # Вопросы собираются в конце: время квиза может стоять после вопросов
+    questions = [builder.build(number, time_limit) for number, builder in enumerate(builders, 1)]
 
-def _parse_option_line(line: str) -> str:
-    """Парсит вариант ответа"""
-    return line.split('.', 1)[1].strip()
+    # Финальная валидация
+    _validate_quiz_structure(title, questions)
+    return ParsedQuiz(title=title, description=description, questions=tuple(questions))
 
 
-def _parse_correct_answer(line: str) -> int:
+def _sanitize_input(text: str) -> str:
+    """Очистка и подготовка входного текста"""
+    # Удаляем BOM; пробелы по краям не трогаем, чтобы не сбить нумерацию строк
+    text = text.lstrip('\ufeff')
+    # Экранируем HTML/XML теги (переводы строк не меняются)
+    return html.escape(text)
+
+
+def _has_min_lines(text: str) -> bool:
+    """Есть ли в тексте MIN_LINES непустых строк (просмотр останавливается на них)"""
+    lines = _NON_EMPTY_LINE_RE.finditer(text)
+    return sum(1 for _ in islice(lines, MIN_LINES)) == MIN_LINES
+
+
+def _parse_correct_answer(value: str, line_number: int) -> int:
     """Парсит и проверяет правильный ответ"""
     try:
-        answer = int(line.split(':', 1)[1].strip()) - 1  # Конвертируем в 0-based
-        if answer < 0:
-            raise ValueError("Номер ответа должен быть положительным")
-        return answer
-    except (ValueError, IndexError):
-        raise QuizValidationError("Неверный формат правильного ответа")
+        answer = int(value) - 1  # Конвертируем в 0-based
+    except ValueError:
+        raise QuizValidationError("Неверный формат правильного ответа", line_number)
+    if answer < 0:
+        raise QuizValidationError("Номер ответа должен быть положительным", line_number)
+    return answer
+
+
+def _parse_time_limit(value: str, line_number: int) -> int:
+    """Парсит и проверяет ограничение времени в секундах"""
+    try:
+        seconds = int(value)
+    except ValueError:
+        raise QuizValidationError("Неверный формат времени. Ожидается число секунд", line_number)
+    if not MIN_TIME_LIMIT <= seconds <= MAX_TIME_LIMIT:
+        raise QuizValidationError(
+            f"Время на вопрос должно быть от {MIN_TIME_LIMIT} до {MAX_TIME_LIMIT} секунд", line_number
+        )
+    return seconds
 
 
-def _validate_question(question: Dict) -> None:
+def _validate_question(question: _QuestionBuilder) -> None:
     """Валидация отдельного вопроса"""
-    if not question['text']:
+    if not question.text:
         raise QuizValidationError("Текст вопроса не может быть пустым")
 
-    if len(question['options']) < 2:
+    if len(question.options) < 2:
         raise QuizValidationError("Должно быть минимум 2 варианта ответа")
 
-    if question['correct_answer'] is None:
+    if question.correct_answer is None:
         raise QuizValidationError("Не указан правильный ответ")
 
-    if question['correct_answer'] >= len(question['options']):
+    if question.correct_answer >= len(question.options):
         raise QuizValidationError(
-            f"Номер правильного ответа ({question['correct_answer'] + 1}) "
-            f"превышает количество вариантов ({len(question['options'])})"
+            f"Номер правильного ответа ({question.correct_answer + 1}) "
+            f"превышает количество вариантов ({len(question.options)})"
         )
 
 
-def _validate_quiz_structure(quiz_data: Dict) -> None:
+def _validate_quiz_structure(title: str, questions: List[QuizQuestion]) -> None:
     """Финальная валидация всей структуры квиза"""
-    if not quiz_data['title']:
+    if not title:
         raise QuizValidationError("Не указано название квиза")
 
-    if not quiz_data['questions']:
+    if not questions:
         raise QuizValidationError("Квиз должен содержать хотя бы один вопрос")
 
-    max_questions = 50
-    if len(quiz_data['questions']) > max_questions:
-        raise QuizValidationError(f"Максимум {max_questions} вопросов в квизе")
-
-    for i, question in enumerate(quiz_data['questions'], 1):
-        try:
-            _validate_question(question)
-        except QuizValidationError as e:
-            raise QuizValidationError(f"Вопрос {i}: {str(e)}")
+    if len(questions) > MAX_QUESTIONS:
+        raise QuizValidationError(
+            f"Максимум {MAX_QUESTIONS} вопросов в квизе", questions[MAX_QUESTIONS].line
+        )
@@ -0,0 +1,60 @@
+import math
+import random
+import time
+import uuid
+from typing import Dict, Optional
+
+from .quiz_cache import CachedQuiz
+from .quiz_parser import QuizQuestion
+
+
+def new_session_data(quiz: CachedQuiz, shuffle: bool = False) -> Dict:
+    """
+    Создает компактное состояние прохождения квиза для FSM
+
+    В состоянии хранятся только идентификатор и версия квиза, курсор,
+    счет и seed перемешивания - сами вопросы берутся из общего кэша.
+    attempt_id служит ключом идемпотентности при сохранении результата,
+    shown_at_ms - момент показа текущего вопроса (для времени ответа).
+    """
+    return {
+        "attempt_id": uuid.uuid4().hex,
+        "quiz_id": quiz.id,
+        "quiz_version": quiz.version,
+        "current_question": 0,
+        "correct_answers": 0,
+        "seed": random.getrandbits(32) if shuffle else None,
+        "shown_at_ms": now_ms()
+    }
+
+
+def now_ms() -> int:
+    """Текущее время в миллисекундах (для времени ответа на вопрос)"""
+    return int(time.time() * 1000)
+
+
+def question_index(position: int, total: int, seed: Optional[int]) -> int:
+    """
+    Возвращает индекс вопроса для позиции с учетом перемешивания
+
+    Перестановка аффинная: (a * position + b) mod total, где a взаимно просто
+    с total. Вычисляется за O(1) без хранения порядка вопросов в состоянии.
+    """
+    if seed is None or total < 2:
+        return position
+
+    a = seed % total or 1
+    while math.gcd(a, total) != 1:
+        a += 1
+    b = (seed // total) % total
+    return (a * position + b) % total
+
+
+def session_question_index(quiz: CachedQuiz, data: Dict) -> int:
+    """Индекс текущего вопроса в квизе для состояния прохождения"""
+    return question_index(data["current_question"], len(quiz.questions), data.get("seed"))
+
+
+def session_question(quiz: CachedQuiz, data: Dict) -> QuizQuestion:
+    """Текущий вопрос для состояния прохождения"""
+    return quiz.questions[session_question_index(quiz, data)]
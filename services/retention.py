@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.retention import rollup_results_batch
+
+logger = logging.getLogger(__name__)
+
+BATCH_PAUSE = 0.02  # Пауза между транзакциями свертки (дает пройти записям пользователей)
+
+
+class RetentionJob:
+    """
+    Периодическая свертка и удаление старых результатов
+
+    Раз в interval секунд результаты старше retention_days сворачиваются в
+    дневные агрегаты (quiz_daily_scores, user_daily_results) и удаляются из
+    quiz_results пачками по batch_size, каждая - отдельной транзакцией.
+    Горячая таблица результатов остается небольшой, а пересчеты статистики
+    и рейтингов объединяют свертку с недавними сырыми строками.
+    """
+
+    def __init__(
+            self,
+            session_maker: async_sessionmaker,
+            retention_days: int,
+            interval: float,
+            batch_size: int
+    ):
+        self.session_maker = session_maker
+        self.retention_days = retention_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+        self.rolled_up = 0
+        self.last_run: Optional[datetime] = None
+
+    async def start(self, *args, **kwargs) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self, *args, **kwargs) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Retention job failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> int:
+        """Сворачивает все результаты старше окна хранения; возвращает их количество"""
+        # Границу берем по началу дня, чтобы день сворачивался целиком
+        cutoff = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        cutoff -= timedelta(days=self.retention_days)
+
+        total = 0
+        while True:
+            async with self.session_maker() as session:
+                rolled_up = await rollup_results_batch(session, cutoff, self.batch_size)
+                await session.commit()
+            if not rolled_up:
+                break
+            total += rolled_up
+            await asyncio.sleep(BATCH_PAUSE)
+
+        self.rolled_up += total
+        self.last_run = datetime.now()
+        if total:
+            logger.info(f"Rolled up {total} quiz results older than {cutoff:%Y-%m-%d}")
+        return total
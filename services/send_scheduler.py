@@ -0,0 +1,240 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих запросов: меньше - раньше
+PRIORITY_CALLBACK = 0  # Ответы на нажатия кнопок (у пользователя крутится индикатор)
+PRIORITY_INTERACTIVE = 1  # Ответы на действия пользователей
+PRIORITY_BULK = 2  # Массовые отправки (рассылки)
+PRIORITY_NAMES = {PRIORITY_CALLBACK: "callback", PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+# Методы, на которые распространяются лимиты Telegram на отправку
+_LIMITED_PREFIXES = ("Send", "Edit", "Copy", "Forward")
+RETRY_JITTER = 0.2  # Доля случайной добавки к retry_after
+
+_send_priority: ContextVar[int] = ContextVar("send_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def bulk_sending() -> Iterator[None]:
+    """Запросы внутри блока идут с низким приоритетом (рассылки и фоновые задачи)"""
+    token = _send_priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        _send_priority.reset(token)
+
+
+class TokenBucket:
+    """Маркерная корзина: rate маркеров в секунду, не больше capacity в запасе"""
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # Пауза после 429 (retry_after)
+
+    def delay(self, now: float) -> float:
+        """Сколько секунд ждать до свободного маркера (0 - можно отправлять)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """
+    Планировщик исходящих запросов к Bot API (request-middleware сессии бота)
+
+    Каждый запрос на отправку проходит через маркерную корзину своего чата
+    (запросы одного чата выполняются строго по очереди) и общую корзину
+    бота. Свободные маркеры общей корзины раздаются по приоритету: ответы
+    на callback, затем ответы пользователям, затем рассылки. При 429
+    чат (или весь бот, если чат неизвестен) ставится на паузу retry_after
+    со случайной добавкой, и запрос повторяется не более max_retries раз -
+    повторы не уходят в Telegram раньше срока и не умножают нагрузку.
+    """
+
+    def __init__(
+            self,
+            global_rate: float = 30,
+            chat_rate: float = 1,
+            chat_burst: float = 3,
+            group_rate: float = 20 / 60,
+            max_retries: int = 3,
+            max_chats: int = 100000
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+
+        self._chat_buckets: "OrderedDict[Union[int, str], TokenBucket]" = OrderedDict()
+        self._chat_locks: Dict[Union[int, str], Tuple[asyncio.Lock, int]] = {}  # Замок и число запросов
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.sent = 0
+        self.retry_after_hits = 0
+        self.gave_up = 0
+        self.max_global_wait = 0.0
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        if isinstance(method, AnswerCallbackQuery):
+            priority = PRIORITY_CALLBACK
+        elif type(method).__name__.startswith(_LIMITED_PREFIXES):
+            priority = _send_priority.get()
+        else:
+            return await make_request(bot, method)  # getUpdates, getFile и т.п. не ограничиваем
+
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await self._send(make_request, bot, method, priority, None)
+
+        lock, users = self._chat_locks.get(chat_id) or (asyncio.Lock(), 0)
+        self._chat_locks[chat_id] = (lock, users + 1)
+        try:
+            async with lock:
+                return await self._send(make_request, bot, method, priority, self._chat_bucket(chat_id))
+        finally:
+            lock, users = self._chat_locks[chat_id]
+            if users == 1:
+                del self._chat_locks[chat_id]
+            else:
+                self._chat_locks[chat_id] = (lock, users - 1)
+
+    async def _send(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType],
+            priority: int,
+            bucket: Optional[TokenBucket]
+    ) -> Response[TelegramType]:
+        attempt = 0
+        while True:
+            if bucket is not None:
+                while (delay := bucket.delay(time.monotonic())) > 0:
+                    await asyncio.sleep(delay)
+                bucket.take()
+            await self._acquire_global(priority)
+
+            try:
+                response = await make_request(bot, method)
+                self.sent += 1
+                return response
+
+            except TelegramRetryAfter as e:
+                self.retry_after_hits += 1
+                pause = e.retry_after * (1 + random.uniform(0, RETRY_JITTER)) + random.uniform(0, 0.5)
+                # Без чата (ответ на callback) флуд-лимит относится ко всему боту
+                (bucket if bucket is not None else self.global_bucket).block(pause)
+                if attempt >= self.max_retries:
+                    self.gave_up += 1
+                    logger.warning(f"{type(method).__name__}: giving up after {attempt + 1} 429 responses")
+                    raise
+                attempt += 1
+                logger.info(f"{type(method).__name__}: retry after {pause:.1f}s")
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные id и @username - группы и каналы, у них свой лимит
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            rate = self.chat_rate if is_private else self.group_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, self.chat_burst)
+            if len(self._chat_buckets) > self.max_chats:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire_global(self, priority: int) -> None:
+        """Маркер общей корзины; при очереди - в порядке приоритета"""
+        if not self._waiters and self.global_bucket.delay(time.monotonic()) <= 0:
+            self.global_bucket.take()
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._pump_task is None:
+            self._pump_task = asyncio.create_task(self._pump())
+
+        started = time.monotonic()
+        await future  # При отмене запроса future отменяется, и насос его пропустит
+        self.max_global_wait = max(self.max_global_wait, time.monotonic() - started)
+
+    async def _pump(self) -> None:
+        """Раздает маркеры ожидающим запросам по мере пополнения корзины"""
+        try:
+            while self._waiters:
+                delay = self.global_bucket.delay(time.monotonic())
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():
+                    self.global_bucket.take()
+                    future.set_result(None)
+        finally:
+            self._pump_task = None
+
+    def stats(self) -> dict:
+        """Глубина очередей и счетчики для метрик"""
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depth[PRIORITY_NAMES[priority]] += 1
+        return {
+            "queue_depth": depth,
+            "chats_busy": len(self._chat_locks),
+            "chat_buckets": len(self._chat_buckets),
+            "sent": self.sent,
+            "retry_after_hits": self.retry_after_hits,
+            "gave_up": self.gave_up,
+            "max_global_wait_ms": self.max_global_wait * 1000
+        }
+
+    async def close(self, *args, **kwargs) -> None:
+        if self._pump_task:
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except asyncio.CancelledError:
+                pass
+        for _, _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
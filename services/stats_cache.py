@@ -0,0 +1,47 @@
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from config import STATS_CACHE_TTL, STATS_CACHE_SIZE
+
+
+class UserStatsCache:
+    """
+    Короткоживущий кэш экрана «Моя статистика» по telegram_id
+
+    Повторные нажатия кнопки в пределах TTL не обращаются к БД. После
+    завершения квиза запись пользователя сбрасывается.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, Tuple[Any, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id: int) -> Optional[Any]:
+        entry = self._entries.get(telegram_id)
+        if entry is None or entry[1] < time.monotonic():
+            self._entries.pop(telegram_id, None)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(telegram_id)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, telegram_id: int, value: Any) -> None:
+        self._entries[telegram_id] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id: Optional[int] = None) -> None:
+        if telegram_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(telegram_id, None)
+
+
+stats_cache = UserStatsCache(STATS_CACHE_TTL, STATS_CACHE_SIZE)
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+ExpireCallback = Callable[[Any], Awaitable[object]]
+
+
+class TimerWheel:
+    """
+    Хешированное колесо таймеров с одной фоновой задачей
+
+    Время делится на такты по tick секунд, таймер кладется в ячейку
+    (такт срабатывания mod slots) - постановка и отмена по ключу за O(1).
+    Фоновая задача раз в такт просматривает одну ячейку и передает
+    истекшие таймеры фиксированному пулу из workers обработчиков, поэтому
+    число задач не зависит от числа таймеров. Точность - один такт.
+    """
+
+    def __init__(self, on_expire: ExpireCallback, tick: float = 0.25, slots: int = 1024, workers: int = 8):
+        self.on_expire = on_expire
+        self.tick = tick
+        self.workers = workers
+        self._slots: List[Dict[Hashable, Tuple[int, Any]]] = [{} for _ in range(slots)]
+        self._timers: Dict[Hashable, int] = {}  # Ключ -> номер ячейки
+        self._queue: "asyncio.Queue[Any]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._started = time.monotonic()
+        self._ticks = 0
+
+        # Метрики
+        self.fired = 0
+        self.cancelled = 0
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def schedule(self, key: Hashable, delay: float, payload: Any) -> None:
+        """Ставит таймер на delay секунд (таймер с тем же ключом заменяется)"""
+        slot = self._timers.get(key)
+        if slot is not None:
+            del self._slots[slot][key]
+        expires = self._ticks + max(1, math.ceil(delay / self.tick))
+        slot = expires % len(self._slots)
+        self._slots[slot][key] = (expires, payload)
+        self._timers[key] = slot
+
+    def cancel(self, key: Hashable) -> bool:
+        slot = self._timers.pop(key, None)
+        if slot is None:
+            return False
+        del self._slots[slot][key]
+        self.cancelled += 1
+        return True
+
+    async def start(self, *args, **kwargs) -> None:
+        if not self._tasks:
+            self._started = time.monotonic() - self._ticks * self.tick
+            self._tasks.append(asyncio.create_task(self._run()))
+            self._tasks.extend(asyncio.create_task(self._worker()) for _ in range(self.workers))
+
+    async def close(self, *args, **kwargs) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _run(self) -> None:
+        while True:
+            # Такты отсчитываются от старта: при задержке цикла событий
+            # пропущенные ячейки обрабатываются подряд без сна
+            delay = self._started + (self._ticks + 1) * self.tick - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._ticks += 1
+
+            slot = self._slots[self._ticks % len(self._slots)]
+            if not slot:
+                continue
+            # В ячейке лежат и таймеры следующих оборотов колеса
+            expired = [key for key, (expires, _) in slot.items() if expires <= self._ticks]
+            for key in expired:
+                _, payload = slot.pop(key)
+                del self._timers[key]
+                self._queue.put_nowait(payload)
+
+    async def _worker(self) -> None:
+        while True:
+            payload = await self._queue.get()
+            try:
+                self.fired += 1
+                await self.on_expire(payload)
+            except Exception as e:
+                logger.error(f"Timer callback failed: {e}", exc_info=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._timers),
+            "expired_queue": self._queue.qsize(),
+            "fired": self.fired,
+            "cancelled": self.cancelled
+        }
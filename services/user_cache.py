@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from config import USER_CACHE_TTL, USER_CACHE_SIZE
+
+
+class UserIdentityCache:
+    """
+    TTL-кэш соответствия telegram_id -> users.id
+
+    Запись считается актуальной, только если не истек TTL и username/full_name
+    совпадают с сохраненными - иначе нужно обновить пользователя в БД.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, Tuple[int, Optional[str], Optional[str], float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+            self,
+            telegram_id: int,
+            username: Optional[str],
+            full_name: Optional[str]
+    ) -> Optional[int]:
+        entry = self._entries.get(telegram_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        user_id, cached_username, cached_full_name, expires_at = entry
+        if (
+                expires_at < time.monotonic()
+                or cached_username != username
+                or cached_full_name != full_name
+        ):
+            del self._entries[telegram_id]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(telegram_id)
+        self.hits += 1
+        return user_id
+
+    def put(
+            self,
+            telegram_id: int,
+            user_id: int,
+            username: Optional[str],
+            full_name: Optional[str]
+    ) -> None:
+        self._entries[telegram_id] = (user_id, username, full_name, time.monotonic() + self.ttl)
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id: Optional[int] = None) -> None:
+        if telegram_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(telegram_id, None)
+
+
+user_cache = UserIdentityCache(USER_CACHE_TTL, USER_CACHE_SIZE)
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import web
+
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+    UPDATE_QUEUE_SIZE,
+    UPDATE_WORKERS
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+METRICS_PATH = "/metrics"
+
+
+class WebhookIngress:
+    """
+    Прием апдейтов по вебхуку через ограниченную очередь
+
+    HTTP-обработчик только кладет апдейт в очередь и сразу отвечает,
+    обработку выполняет фиксированный пул воркеров диспетчера.
+
+    Политика перегрузки: если очередь заполнена, апдейт не принимается
+    и Telegram получает 503 с Retry-After - он повторит доставку позже.
+    Так бот не копит неограниченный бэклог в памяти.
+    """
+
+    def __init__(
+            self,
+            dp: Dispatcher,
+            bot: Bot,
+            queue_size: int,
+            workers: int,
+            secret: Optional[str] = None,
+            retry_after: int = 1
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.workers = workers
+        self.secret = secret
+        self.retry_after = retry_after
+        self.queue: "asyncio.Queue[tuple[float, Update]]" = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+
+        # Метрики
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.last_drain_latency = 0.0
+        self.avg_drain_latency = 0.0
+        self.max_drain_latency = 0.0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Принимает апдейт от Telegram"""
+        if self.secret and request.headers.get(SECRET_HEADER) != self.secret:
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError:
+            return web.Response(status=400)
+
+        try:
+            self.queue.put_nowait((time.monotonic(), update))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            if self.rejected % 100 == 1:
+                logger.warning(
+                    f"Update queue is full ({self.queue.maxsize}), "
+                    f"rejected {self.rejected} updates so far"
+                )
+            return web.Response(status=503, headers={"Retry-After": str(self.retry_after)})
+
+        self.accepted += 1
+        return web.Response()
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        """Глубина очереди и задержка обработки, метрики исходящих запросов и таймеров вопросов"""
+        stats = self.stats()
+        send_scheduler = self.dp.workflow_data.get("send_scheduler")
+        if send_scheduler is not None:
+            stats["outbound"] = send_scheduler.stats()
+        question_timers = self.dp.workflow_data.get("question_timers")
+        if question_timers is not None:
+            stats["question_timers"] = question_timers.stats()
+        return web.json_response(stats)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "workers": self.workers,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "drain_latency_last_ms": self.last_drain_latency * 1000,
+            "drain_latency_avg_ms": self.avg_drain_latency * 1000,
+            "drain_latency_max_ms": self.max_drain_latency * 1000
+        }
+
+    async def start(self, *args) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, *args) -> None:
+        """Дожидается обработки уже принятых апдейтов и останавливает воркеров"""
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            received_at, update = await self.queue.get()
+            try:
+                latency = time.monotonic() - received_at
+                self.last_drain_latency = latency
+                self.max_drain_latency = max(self.max_drain_latency, latency)
+                # Экспоненциальное скользящее среднее
+                self.avg_drain_latency += (latency - self.avg_drain_latency) * 0.05
+
+                await self.dp.feed_update(self.bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, ingress: WebhookIngress) -> web.Application:
+    """Собирает aiohttp-приложение для приема апдейтов"""
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, ingress.handle)
+    app.router.add_get(METRICS_PATH, ingress.metrics)
+
+    app.on_startup.append(ingress.start)
+    # Сначала дочищаем очередь, затем останавливаем диспетчер (и хранилище FSM)
+    app.on_shutdown.append(ingress.stop)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Запускает бота в режиме вебхука"""
+    ingress = WebhookIngress(
+        dp,
+        bot,
+        queue_size=UPDATE_QUEUE_SIZE,
+        workers=UPDATE_WORKERS,
+        secret=WEBHOOK_SECRET
+    )
+    app = create_webhook_app(dp, bot, ingress)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+    await site.start()
+
+    await bot.set_webhook(
+        f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    logger.info(f"Webhook server listening on {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
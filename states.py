@@ -34,6 +34,7 @@ class AdminStates(StatesGroup):
     waiting_for_admin_command = State()  # Ожидание команды администрирования
     user_management = State()  # Управление пользователями
     broadcast_message = State()  # Рассылка сообщений
+    waiting_for_import = State()  # Ожидание документа с квизами для импорта
 
 
 class UserProfileStates(StatesGroup):